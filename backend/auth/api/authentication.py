@@ -1,8 +1,38 @@
+import hashlib
+import time
 from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.tokens import AccessToken
 from rest_framework import exceptions
 from django.conf import settings
+from django.core.cache import cache
 from django.middleware.csrf import CsrfViewMiddleware
 
+# Keys of the token cache the game and chat services share through Redis
+TOKEN_KEY_PREFIX = 'auth:token:'
+REVOKED = 'revoked'
+
+
+def token_key(token):
+    return TOKEN_KEY_PREFIX + hashlib.sha256(token.encode()).hexdigest()
+
+
+def revoke_token(token):
+    """
+    Mark an access token revoked until it expires, replacing any cached
+    verification of it in the other services.
+    """
+    try:
+        expires_at = AccessToken(token)['exp']
+    except Exception:
+        return
+    ttl = int(expires_at - time.time())
+    if ttl > 0:
+        cache.set(token_key(token), REVOKED, timeout=ttl)
+
+
+def is_token_revoked(token):
+    return cache.get(token_key(token)) == REVOKED
+
 class CSRFCheck(CsrfViewMiddleware):
     def _reject(self, request, reason):
         return reason
@@ -16,7 +46,7 @@ class JWTCookieAuthentication(JWTAuthentication):
 
         token = request.COOKIES.get(settings.SIMPLE_JWT['AUTH_COOKIE'])
         
-        if not token:
+        if not token or is_token_revoked(token):
             return None
 
         try:
@@ -18,4 +18,37 @@ class HealthCheckTests(APITestCase):
         self.assertIn('system', response.data)
         
         # Check if the response is successful
-        self.assertEqual(response.status_code, status.HTTP_200_OK)
\ No newline at end of file
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+class BulkUserLookupTests(APITestCase):
+    def setUp(self):
+        from django.contrib.auth import get_user_model
+        from .models import Friendship, UserBlock
+
+        User = get_user_model()
+        self.caller = User.objects.create_user('caller@example.com', 'caller', 'password')
+        self.friend = User.objects.create_user('friend@example.com', 'friend', 'password')
+        self.stranger = User.objects.create_user('stranger@example.com', 'stranger', 'password')
+        self.blocker = User.objects.create_user('blocker@example.com', 'blocker', 'password')
+        Friendship.objects.create(user=self.friend, friend=self.caller, is_accepted=True)
+        UserBlock.objects.create(user=self.blocker, blocked_user=self.caller)
+        self.client.force_authenticate(self.caller)
+
+    def test_bulk_lookup_returns_accessible_users_in_one_query(self):
+        """
+        Ensure profiles and relations come from a single query and blocked users are left out.
+        """
+        ids = [str(user.id) for user in (self.friend, self.stranger, self.blocker)]
+        with self.assertNumQueries(1):
+            response = self.client.post(reverse('get_users_bulk'), {'ids': ids, 'relations': True}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        users = {user['username']: user for user in response.data['users']}
+        self.assertEqual(set(users), {'friend', 'stranger'})
+        self.assertTrue(users['friend']['is_friend'])
+        self.assertFalse(users['stranger']['is_friend'])
+        self.assertEqual(response.data['unavailable'], [str(self.blocker.id)])
+
+    def test_bulk_lookup_rejects_too_many_ids(self):
+        response = self.client.post(reverse('get_users_bulk'), {'ids': [str(self.friend.id)] * 101}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
@@ -35,7 +35,8 @@ from .views import (
     get_unread_count,
     clear_notification,
     clear_all_notifications,
-    get_user_by_id
+    get_user_by_id,
+    get_users_bulk
 )
 
 urlpatterns = [
@@ -46,6 +47,7 @@ urlpatterns = [
         path('login/', login_view, name='login'),
         path('logout/', logout_view, name='logout'),
         path('me/', me_view, name='me'),
+        path('users/bulk/', get_users_bulk, name='get_users_bulk'),
         path('users/<uuid:user_id>/', get_user_by_id, name='get_user_by_id'),
         path('verify/', verify_token, name='verify_token'),
         path('token/', get_access_token, name='get_access_token'),
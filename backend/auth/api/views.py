@@ -3,9 +3,10 @@ import os
 import pyotp
 import requests
 import urllib.parse
+import uuid
 from functools import wraps
 
-from django.db.models import Q
+from django.db.models import Exists, OuterRef, Q
 from django.db import transaction
 from django.conf import settings
 from django.shortcuts import redirect
@@ -17,7 +18,7 @@ from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
 from django.utils.encoding import force_bytes, force_str
 from django.core.mail import send_mail
 from django.core.files.storage import default_storage
-from .authentication import JWTCookieAuthentication
+from .authentication import JWTCookieAuthentication, is_token_revoked, revoke_token
 from django.middleware.csrf import get_token
 from django.views.decorators.csrf import csrf_exempt
 from django.core.paginator import Paginator, EmptyPage
@@ -37,6 +38,9 @@ from .models import Friendship, UserBlock, Notification
 
 User = get_user_model()
 
+# Users one call to get_users_bulk may ask for
+BULK_USERS_LIMIT = 100
+
 def csrf_exempt_authentication(view_func):
     @wraps(view_func)
     def wrapped_view(*args, **kwargs):
@@ -148,6 +152,76 @@ def get_user_by_id(request, user_id):
     
     return Response(response_data)
 
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def get_users_bulk(request):
+    """
+    Get the public information of several users in one query, for services
+    that would otherwise call get_user_by_id once per user.
+
+    Body:
+    - ids: User IDs (required, at most 100)
+    - relations: Whether to add is_friend and is_self for the caller (optional, default: false)
+
+    As in get_user_by_id, users blocking or blocked by the caller are not
+    returned; their IDs are listed in `unavailable` with unknown ones.
+    """
+    user_ids = request.data.get('ids')
+    relations = bool(request.data.get('relations', False))
+
+    if not isinstance(user_ids, list) or len(user_ids) > BULK_USERS_LIMIT:
+        return Response(
+            {'error': {
+                'message': f'ids must be a list of at most {BULK_USERS_LIMIT} user IDs'
+            }},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    try:
+        user_ids = {uuid.UUID(str(user_id)) for user_id in user_ids}
+    except ValueError:
+        return Response(
+            {'error': {
+                'message': 'Invalid user ID'
+            }},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    # Relations are EXISTS subqueries of the same statement
+    users = User.objects.filter(id__in=user_ids).annotate(
+        is_blocked=Exists(UserBlock.objects.filter(
+            Q(user=request.user, blocked_user=OuterRef('pk')) |
+            Q(user=OuterRef('pk'), blocked_user=request.user)
+        ))
+    )
+    if relations:
+        users = users.annotate(
+            is_friend=Exists(Friendship.objects.filter(
+                Q(user=request.user, friend=OuterRef('pk')) |
+                Q(user=OuterRef('pk'), friend=request.user),
+                is_accepted=True
+            ))
+        )
+
+    results = []
+    for user in users:
+        if user.is_blocked:
+            continue
+        data = UserFriendSerializer(user).data
+        if relations:
+            data.update({
+                'is_friend': user.is_friend,
+                'is_self': user.id == request.user.id,
+                'is_blocked': False
+            })
+        results.append(data)
+
+    found = {str(data['id']) for data in results}
+    return Response({
+        'users': results,
+        'unavailable': [str(user_id) for user_id in user_ids if str(user_id) not in found]
+    })
+
 @api_view(['POST'])
 @permission_classes([AllowAny])
 @csrf_exempt_authentication
@@ -327,6 +401,10 @@ def oauth_42_callback(request):
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def logout_view(request):
+    access_token = request.COOKIES.get(settings.SIMPLE_JWT['AUTH_COOKIE'])
+    if access_token:
+        revoke_token(access_token)
+
     response = Response({'message': 'Logged out successfully'})
     
     response.delete_cookie(settings.SIMPLE_JWT['AUTH_COOKIE'])
@@ -426,6 +504,13 @@ def verify_token(request):
             token = cookie_token
             
         valid_token = AccessToken(token)
+        if is_token_revoked(token):
+            return Response(
+                {'error': {
+                    'message': 'Token has been revoked'
+                }},
+                status=status.HTTP_401_UNAUTHORIZED
+            )
         user_id = valid_token.payload.get('user_id')
         
         try:
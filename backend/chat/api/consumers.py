@@ -1,10 +1,11 @@
-import json, aiohttp
+import json
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
 from django.conf import settings
 from typing import Optional
 from .models import Messages
 from .models import BlockUsers
+from .clients import service_client
 import logging
 
 logger = logging.getLogger(__name__)
@@ -79,16 +80,15 @@ class ChatConsumer(AsyncWebsocketConsumer):
         Marks user as online both in Redis and Auth service
         """
         try:            
-            async with aiohttp.ClientSession() as session:
-                async with session.post(
-                    f"{settings.AUTH_SERVICE_URL}/api/auth/internal/update-status/",
-                    json={
-                        'user_id': self.user_id,
-                        'is_online': True
-                    }
-                ) as response:
-                    if response.status != 200:
-                        print(f"Failed to update online status in auth service: {await response.text()}")       
+            async with service_client.post(
+                f"{settings.AUTH_SERVICE_URL}/api/auth/internal/update-status/",
+                json={
+                    'user_id': self.user_id,
+                    'is_online': True
+                }
+            ) as response:
+                if response.status != 200:
+                    print(f"Failed to update online status in auth service: {await response.text()}")       
         except Exception as e:
             print(f"Error marking user online: {e}")
 
@@ -97,16 +97,15 @@ class ChatConsumer(AsyncWebsocketConsumer):
         Marks user as offline both in Redis and Auth service
         """
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.post(
-                    f"{settings.AUTH_SERVICE_URL}/api/auth/internal/update-status/",
-                    json={
-                        'user_id': self.user_id,
-                        'is_online': False
-                    }
-                ) as response:
-                    if response.status != 200:
-                        print(f"Failed to update offline status in auth service: {await response.text()}")      
+            async with service_client.post(
+                f"{settings.AUTH_SERVICE_URL}/api/auth/internal/update-status/",
+                json={
+                    'user_id': self.user_id,
+                    'is_online': False
+                }
+            ) as response:
+                if response.status != 200:
+                    print(f"Failed to update offline status in auth service: {await response.text()}")      
         except Exception as e:
             print(f"Error marking user offline: {e}")
 
@@ -0,0 +1,174 @@
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+import jwt
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+# Shared with the auth service, which marks tokens revoked under the same keys on logout
+TOKEN_KEY_PREFIX = 'auth:token:'
+REVOKED = 'revoked'
+# Seconds a verified token is trusted at most, and in this process before Redis is asked again
+TOKEN_CACHE_TTL = 300
+LOCAL_TOKEN_CACHE_TTL = 10
+LOCAL_TOKEN_CACHE_SIZE = 10000
+
+
+def token_key(token):
+    return TOKEN_KEY_PREFIX + hashlib.sha256(token.encode()).hexdigest()
+
+
+def token_expiry(token):
+    """
+    Expiry of ``token`` as a Unix timestamp, read without checking the
+    signature; only used to bound how long a verified token is cached.
+    """
+    try:
+        return jwt.decode(token, options={'verify_signature': False}).get('exp')
+    except jwt.InvalidTokenError:
+        return None
+
+
+class Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class TokenCache:
+    """
+    Cache of verified tokens: an in-process LRU in front of the Redis cache
+    shared by every service, both keyed by the token's hash and never kept
+    past the token's ``exp``.
+
+    On a miss, concurrent requests carrying the same token wait for a
+    single lookup instead of each calling the auth service. Tokens revoked
+    on logout are stored as REVOKED; verified tokens are only added, never
+    written over a revocation, and this process notices one within
+    ``local_ttl`` seconds.
+    """
+
+    def __init__(self, ttl=TOKEN_CACHE_TTL, local_ttl=LOCAL_TOKEN_CACHE_TTL, max_entries=LOCAL_TOKEN_CACHE_SIZE,
+                 backend=cache, clock=time.time):
+        self.ttl = ttl
+        self.local_ttl = local_ttl
+        self.max_entries = max_entries
+        self.backend = backend
+        self.clock = clock
+        # key -> (expires_at, user payload or REVOKED)
+        self.local = OrderedDict()
+        self.inflight = {}
+        self.lock = threading.Lock()
+
+    def get(self, token, verify):
+        """
+        Return the user payload of ``token``, calling ``verify(token)`` when
+        no process has verified it yet. Return None for revoked tokens.
+        """
+        key = token_key(token)
+        value = self.get_local(key)
+        if value is not None:
+            return None if value == REVOKED else value
+
+        with self.lock:
+            flight = self.inflight.get(key)
+            leading = flight is None
+            if leading:
+                flight = self.inflight[key] = Flight()
+        if not leading:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = self.load(key, token, verify)
+            return flight.result
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.inflight[key]
+            flight.done.set()
+
+    def load(self, key, token, verify):
+        expires_at = self.expires_at(token)
+        value = self.get_shared(key)
+        if value is not None:
+            self.set_local(key, value, expires_at)
+            return None if value == REVOKED else value
+
+        payload = verify(token)
+        if not payload:
+            return None
+        ttl = expires_at - self.clock()
+        if ttl <= 0:
+            return payload
+        if not self.add_shared(key, payload, ttl) and self.get_shared(key) == REVOKED:
+            self.set_local(key, REVOKED, expires_at)
+            return None
+        self.set_local(key, payload, expires_at)
+        return payload
+
+    def revoked(self, token):
+        key = token_key(token)
+        value = self.get_local(key)
+        if value is None:
+            value = self.get_shared(key)
+            if value == REVOKED:
+                self.set_local(key, REVOKED, self.expires_at(token))
+        return value == REVOKED
+
+    def expires_at(self, token):
+        now = self.clock()
+        exp = token_expiry(token)
+        return now + self.ttl if exp is None else min(exp, now + self.ttl)
+
+    def get_local(self, key):
+        with self.lock:
+            entry = self.local.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= self.clock():
+                del self.local[key]
+                return None
+            self.local.move_to_end(key)
+            return entry[1]
+
+    def set_local(self, key, value, expires_at):
+        with self.lock:
+            self.local[key] = (min(expires_at, self.clock() + self.local_ttl), value)
+            self.local.move_to_end(key)
+            while len(self.local) > self.max_entries:
+                self.local.popitem(last=False)
+
+    def get_shared(self, key):
+        try:
+            return self.backend.get(key)
+        except Exception as e:
+            logger.warning(f"Token cache unavailable: {str(e)}")
+            return None
+
+    def add_shared(self, key, value, ttl):
+        try:
+            return self.backend.add(key, value, timeout=max(1, int(ttl)))
+        except Exception as e:
+            logger.warning(f"Token cache unavailable: {str(e)}")
+            return True
+
+
+def get_token_cache():
+    return TokenCache(
+        ttl=getattr(settings, 'TOKEN_CACHE_TTL', TOKEN_CACHE_TTL),
+        local_ttl=getattr(settings, 'LOCAL_TOKEN_CACHE_TTL', LOCAL_TOKEN_CACHE_TTL),
+        max_entries=getattr(settings, 'LOCAL_TOKEN_CACHE_SIZE', LOCAL_TOKEN_CACHE_SIZE),
+    )
+
+
+token_cache = get_token_cache()
@@ -2,6 +2,7 @@ import logging
 import aiohttp
 from django.conf import settings
 from typing import Optional, Dict
+from .clients import service_client
 logger = logging.getLogger(__name__)
 
 class AuthServiceError(Exception):
@@ -11,24 +12,55 @@ class AuthServiceError(Exception):
 
 async def get_user_from_id(user_id: str, token: str):
     try:
-        async with aiohttp.ClientSession() as session:
-            headers = {'Authorization': f'Bearer {token}'}
-            cookies = {settings.SIMPLE_JWT['AUTH_COOKIE']: token}
+        headers = {'Authorization': f'Bearer {token}'}
+        cookies = {settings.SIMPLE_JWT['AUTH_COOKIE']: token}
 
-            async with session.get(
-                f"{settings.AUTH_SERVICE_URL}/api/auth/users/{user_id}",
+        async with service_client.get(
+            f"{settings.AUTH_SERVICE_URL}/api/auth/users/{user_id}",
+            headers=headers,
+            cookies=cookies,
+        ) as response:
+            if response.status == 200:
+                return await response.json()
+            elif response.status == 401:
+                return None
+            else:
+                raise AuthServiceError(f"Auth service returned status {response.status}")
+    except aiohttp.ClientError as e:
+        raise AuthServiceError(f"Failed to communicate with auth service: {str(e)}")
+
+
+# User IDs the auth service resolves per bulk call
+BULK_USERS_LIMIT = 100
+
+
+async def get_users_from_ids(user_ids, token: str, relations: bool = False) -> Dict[str, Dict]:
+    """
+    Resolve several users with one auth service call per BULK_USERS_LIMIT
+    IDs. Users that are unknown or not accessible to the caller are left out.
+    With ``relations``, each user also carries is_friend, is_self and
+    is_blocked for the caller, as returned by get_user_from_id.
+    """
+    user_ids = list(dict.fromkeys(str(user_id) for user_id in user_ids))
+    users = {}
+    try:
+        headers = {'Authorization': f'Bearer {token}'}
+        cookies = {settings.SIMPLE_JWT['AUTH_COOKIE']: token}
+
+        for start in range(0, len(user_ids), BULK_USERS_LIMIT):
+            async with service_client.post(
+                f"{settings.AUTH_SERVICE_URL}/api/auth/users/bulk/",
+                json={'ids': user_ids[start:start + BULK_USERS_LIMIT], 'relations': relations},
                 headers=headers,
                 cookies=cookies,
-                timeout=aiohttp.ClientTimeout(total=10)
             ) as response:
-                if response.status == 200:
-                    return await response.json()
-                elif response.status == 401:
-                    return None
-                else:
+                if response.status != 200:
                     raise AuthServiceError(f"Auth service returned status {response.status}")
+                data = await response.json()
+            users.update((str(user['id']), user) for user in data['users'])
     except aiohttp.ClientError as e:
         raise AuthServiceError(f"Failed to communicate with auth service: {str(e)}")
+    return users
 
 
 async def verify_token_with_auth_service(token: str) -> Optional[Dict]:
@@ -37,25 +69,23 @@ async def verify_token_with_auth_service(token: str) -> Optional[Dict]:
     and header-based token verification for maximum compatibility.
     """
     try:
-        async with aiohttp.ClientSession() as session:
-            headers = {'Authorization': f'Bearer {token}'}
-            cookies = {settings.SIMPLE_JWT['AUTH_COOKIE']: token}
-            
-            async with session.post(
-                settings.JWT_VERIFICATION_URL,
-                headers=headers,
-                cookies=cookies,
-                timeout=aiohttp.ClientTimeout(total=10)
-            ) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    if data.get('valid') and data.get('user'):
-                        return data['user']
-                    return None
-                elif response.status == 401:
-                    return None
-                else:
-                    raise AuthServiceError(f"Auth service returned status {response.status}")
+        headers = {'Authorization': f'Bearer {token}'}
+        cookies = {settings.SIMPLE_JWT['AUTH_COOKIE']: token}
+
+        async with service_client.post(
+            settings.JWT_VERIFICATION_URL,
+            headers=headers,
+            cookies=cookies,
+        ) as response:
+            if response.status == 200:
+                data = await response.json()
+                if data.get('valid') and data.get('user'):
+                    return data['user']
+                return None
+            elif response.status == 401:
+                return None
+            else:
+                raise AuthServiceError(f"Auth service returned status {response.status}")
     except aiohttp.ClientError as e:
         raise AuthServiceError(f"Failed to communicate with auth service: {str(e)}")
 
@@ -7,13 +7,13 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.renderers import JSONRenderer
 from django.db.models import Q
-from asgiref.sync import async_to_sync
 from django.conf import settings
 from django.db import connections
 from django.db.utils import OperationalError
 from .models import Messages, BlockUsers
 from .serializers import MessageSerializer
-from .utils import get_user_from_id
+from .clients import background_loop, service_client
+from .utils import get_users_from_ids
 
 
 logger = logging.getLogger(__name__)
@@ -38,10 +38,7 @@ class ChatHealthCheck(APIView):
             health_status['database_message'] = 'Database connection failed'
 
         try:
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            auth_status, auth_message = loop.run_until_complete(self.check_auth_service())
-            loop.close()
+            auth_status, auth_message = background_loop.run(self.check_auth_service())
 
             health_status['auth_service'] = 'available' if auth_status else 'unavailable'
             if not auth_status:
@@ -61,13 +58,11 @@ class ChatHealthCheck(APIView):
         return Response(health_status, status=response_status)
 
     async def check_auth_service(self):
-        timeout = aiohttp.ClientTimeout(total=settings.AUTH_SERVICE_TIMEOUT)
         try:
-            async with aiohttp.ClientSession(timeout=timeout) as session:
-                async with session.get(f"{settings.AUTH_SERVICE_URL}/api/auth/health/") as response:
-                    if response.status == 200:
-                        return True, await response.json()
-                    return False, f'Auth service returned status {response.status}'
+            async with service_client.get(f"{settings.AUTH_SERVICE_URL}/api/auth/health/") as response:
+                if response.status == 200:
+                    return True, await response.json()
+                return False, f'Auth service returned status {response.status}'
         except aiohttp.ClientConnectorError as e:
             return False, f'Connection to auth service failed: {str(e)}'
         except asyncio.TimeoutError:
@@ -120,11 +115,15 @@ class ListLatestConversasions(APIView):
                 if other_user not in conversations:
                     conversations[other_user] = {
                         "user_id": other_user,
-                        "user": async_to_sync(get_user_from_id)(other_user, request.token),
                         "last_message": msg.content,
                         "last_message_time": msg.time.strftime('%Y-%m-%d %H:%M')
                     }
 
+            # One auth service call for every conversation partner
+            users = background_loop.run(get_users_from_ids(conversations, request.token, relations=True))
+            for other_user, conversation in conversations.items():
+                conversation["user"] = users.get(str(other_user))
+
             # Already in descending order due to .order_by('-time'), but if needed:
             sorted_conversations = sorted(
                 conversations.values(),
@@ -7,6 +7,7 @@ django_asgi_app = get_asgi_application()
 
 from channels.routing import ProtocolTypeRouter, URLRouter
 from channels.security.websocket import AllowedHostsOriginValidator
+from api.clients import LifespanApp
 from api.middleware import WebSocketAuthMiddleware
 from api.routing import websocket_urlpatterns
 
@@ -14,5 +15,6 @@ application = ProtocolTypeRouter({
     "http": django_asgi_app,
     "websocket": WebSocketAuthMiddleware(
         URLRouter(websocket_urlpatterns)
-    )
+    ),
+    "lifespan": LifespanApp(),
 })
\ No newline at end of file
@@ -175,6 +175,21 @@ CORS_ALLOW_HEADERS = [
 AUTH_SERVICE_TIMEOUT = int(os.getenv('AUTH_SERVICE_TIMEOUT', 5))
 AUTH_SERVICE_URL = os.getenv('AUTH_SERVICE_URL', 'http://auth:8000')
 JWT_VERIFICATION_URL = f"{AUTH_SERVICE_URL}/api/auth/verify/"
+# Keys signed with before the current one, still accepted while their tokens live
+JWT_PREVIOUS_VERIFYING_KEYS = [key for key in os.getenv('JWT_PREVIOUS_SIGNING_KEYS', '').split(',') if key]
+# Key set of the auth service, for tokens that carry a key id
+JWT_JWKS_URL = os.getenv('JWT_JWKS_URL')
+# Also ask the auth service about tokens that verify locally, to catch deleted users
+JWT_REVOCATION_CHECK = os.getenv('JWT_REVOCATION_CHECK', 'False').lower() == 'true'
+# Seconds a verified token is cached in Redis at most, and in each process before Redis is asked again
+TOKEN_CACHE_TTL = int(os.getenv('TOKEN_CACHE_TTL', 300))
+LOCAL_TOKEN_CACHE_TTL = int(os.getenv('LOCAL_TOKEN_CACHE_TTL', 10))
+LOCAL_TOKEN_CACHE_SIZE = int(os.getenv('LOCAL_TOKEN_CACHE_SIZE', 10000))
+# Pooled connections to other services, in total and per service, and seconds idle ones stay open
+SERVICE_POOL_SIZE = int(os.getenv('SERVICE_POOL_SIZE', 100))
+SERVICE_POOL_SIZE_PER_HOST = int(os.getenv('SERVICE_POOL_SIZE_PER_HOST', 20))
+SERVICE_KEEPALIVE_TIMEOUT = float(os.getenv('SERVICE_KEEPALIVE_TIMEOUT', 30))
+SERVICE_CONNECT_TIMEOUT = float(os.getenv('SERVICE_CONNECT_TIMEOUT', 2))
 
 LOGGING = {
     'version': 1,
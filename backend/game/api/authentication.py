@@ -2,7 +2,8 @@ from rest_framework_simplejwt.authentication import JWTAuthentication
 from django.conf import settings
 from rest_framework import exceptions
 import aiohttp
-import asyncio
+from .clients import background_loop, service_client
+from .token_cache import token_cache
 
 class SimpleUser:
     def __init__(self, user_data):
@@ -18,19 +19,15 @@ class GameJWTAuthentication(JWTAuthentication):
         
         if not token:
             header = self.get_header(request)
-            if header:
-                token = self.get_raw_token(header)
+            raw_token = self.get_raw_token(header) if header else None
+            if raw_token:
+                token = raw_token.decode()
 
         if not token:
             return None
 
         try:
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            
-            user_data = loop.run_until_complete(self.verify_token(request, token))
-            loop.close()
-            
+            user_data = token_cache.get(token, lambda token: background_loop.run(self.verify_token(request, token)))
             if user_data:
                 user = SimpleUser(user_data)
                 request.token = token
@@ -44,39 +41,37 @@ class GameJWTAuthentication(JWTAuthentication):
         """Verify token with auth service"""
         try:
             csrf_token = request.COOKIES.get('csrftoken')
-            
-            async with aiohttp.ClientSession() as session:
-                headers = {
-                    'Authorization': f'Bearer {token}',
-                    'Origin': 'http://localhost:8000',
-                }
-                
-                if csrf_token:
-                    headers['X-CSRFToken'] = csrf_token
-                
-                cookies = {
-                    settings.SIMPLE_JWT['AUTH_COOKIE']: token,
-                }
-                
-                if csrf_token:
-                    cookies['csrftoken'] = csrf_token
-                
-                async with session.post(
-                    settings.JWT_VERIFICATION_URL,
-                    headers=headers,
-                    cookies=cookies,
-                    timeout=aiohttp.ClientTimeout(total=settings.AUTH_SERVICE_TIMEOUT)
-                ) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        if data.get('valid') and data.get('user'):
-                            return data['user']
-                    elif response.status == 403:
-                        error_text = await response.text()
-                        print(f"Verification failed - Status: {response.status}")
-                        print(f"Headers: {response.headers}")
-                        print(f"Response: {error_text}")
-                    return None
-                    
+
+            headers = {
+                'Authorization': f'Bearer {token}',
+                'Origin': 'http://localhost:8000',
+            }
+
+            if csrf_token:
+                headers['X-CSRFToken'] = csrf_token
+
+            cookies = {
+                settings.SIMPLE_JWT['AUTH_COOKIE']: token,
+            }
+
+            if csrf_token:
+                cookies['csrftoken'] = csrf_token
+
+            async with service_client.post(
+                settings.JWT_VERIFICATION_URL,
+                headers=headers,
+                cookies=cookies,
+            ) as response:
+                if response.status == 200:
+                    data = await response.json()
+                    if data.get('valid') and data.get('user'):
+                        return data['user']
+                elif response.status == 403:
+                    error_text = await response.text()
+                    print(f"Verification failed - Status: {response.status}")
+                    print(f"Headers: {response.headers}")
+                    print(f"Response: {error_text}")
+                return None
+
         except aiohttp.ClientError as e:
-            raise exceptions.AuthenticationFailed(f'Auth service error: {str(e)}')
\ No newline at end of file
+            raise exceptions.AuthenticationFailed(f'Auth service error: {str(e)}')
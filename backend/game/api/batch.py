@@ -0,0 +1,222 @@
+import numpy as np
+from .engine import (
+    BALL_DIRECTION_OPTIONS,
+    BALL_SPEED,
+    COURT_MAX,
+    COURT_MIN,
+    INTERVAL,
+    MAX_BALL_SPEED,
+    MAX_CONTACTS_PER_STEP,
+    PADDLE_HEIGHT,
+    WINNING_SCORE,
+)
+
+DIRECTIONS = np.array(BALL_DIRECTION_OPTIONS, dtype=np.float64)
+
+
+def time_to_line(position, velocity):
+    """
+    Vectorized ``engine.time_to_line`` for the court lines.
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = np.where(
+            velocity < 0, (COURT_MIN - position) / velocity,
+            np.where(velocity > 0, (COURT_MAX - position) / velocity, np.inf)
+        )
+    return np.maximum(t, 0)
+
+
+class BatchPhysics:
+    """
+    Struct-of-arrays physics backend that advances every room with one
+    vectorized step.
+
+    Rooms occupy the first ``len(self)`` slots of each buffer; removing a room
+    moves the last slot into the freed one so the active region stays dense.
+    The rules mirror ``engine.step`` exactly.
+    """
+
+    FIELDS = ("x", "y", "dx", "dy", "speed", "p1_y", "p2_y")
+
+    def __init__(self, capacity=64, seed=None):
+        self.capacity = capacity
+        self.rooms = []
+        self.slots = {}
+        self.rng = np.random.default_rng(seed)
+        for field in self.FIELDS:
+            setattr(self, field, np.zeros(capacity, dtype=np.float64))
+        self.score = np.zeros((capacity, 2), dtype=np.int32)
+
+    def __len__(self):
+        return len(self.rooms)
+
+    def __contains__(self, room_name):
+        return room_name in self.slots
+
+    def _grow(self):
+        self.capacity *= 2
+        for field in self.FIELDS:
+            old = getattr(self, field)
+            new = np.zeros(self.capacity, dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, field, new)
+        score = np.zeros((self.capacity, 2), dtype=np.int32)
+        score[:len(self.score)] = self.score
+        self.score = score
+
+    def add_room(self, room_name, state):
+        if len(self.rooms) == self.capacity:
+            self._grow()
+        slot = len(self.rooms)
+        self.rooms.append(room_name)
+        self.slots[room_name] = slot
+        self.load(slot, state)
+
+    def remove_room(self, room_name):
+        slot = self.slots.pop(room_name, None)
+        if slot is None:
+            return
+        last = len(self.rooms) - 1
+        if slot != last:
+            moved = self.rooms[last]
+            self.rooms[slot] = moved
+            self.slots[moved] = slot
+            for field in self.FIELDS:
+                buffer = getattr(self, field)
+                buffer[slot] = buffer[last]
+            self.score[slot] = self.score[last]
+        self.rooms.pop()
+
+    def load(self, slot, state):
+        ball = state["ball"]
+        self.x[slot] = ball["x"]
+        self.y[slot] = ball["y"]
+        self.dx[slot] = ball["dx"]
+        self.dy[slot] = ball["dy"]
+        self.speed[slot] = state["speed"]
+        self.p1_y[slot] = state["paddles"]["p1_y"]
+        self.p2_y[slot] = state["paddles"]["p2_y"]
+        self.score[slot] = (state["score"]["p1"], state["score"]["p2"])
+
+    def export(self, room_name, state):
+        """
+        Copy a room's buffers back into its state dict.
+        """
+        slot = self.slots[room_name]
+        state["ball"].update({
+            "x": float(self.x[slot]),
+            "y": float(self.y[slot]),
+            "dx": float(self.dx[slot]),
+            "dy": float(self.dy[slot]),
+        })
+        state["speed"] = float(self.speed[slot])
+        state["paddles"]["p1_y"] = float(self.p1_y[slot])
+        state["paddles"]["p2_y"] = float(self.p2_y[slot])
+        state["score"]["p1"] = int(self.score[slot, 0])
+        state["score"]["p2"] = int(self.score[slot, 1])
+
+    def set_paddle(self, room_name, key, y_position):
+        slot = self.slots.get(room_name)
+        if slot is not None:
+            getattr(self, key)[slot] = max(0, min(100, y_position))
+
+    def reset(self, slots):
+        self.speed[slots] = BALL_SPEED
+        self.p1_y[slots] = 50
+        self.p2_y[slots] = 50
+        self.x[slots] = 49
+        self.y[slots] = 49
+        self.dx[slots] = DIRECTIONS[self.rng.integers(len(DIRECTIONS), size=len(slots)), 0]
+        self.dy[slots] = DIRECTIONS[self.rng.integers(len(DIRECTIONS), size=len(slots)), 1]
+
+    def sweep(self, slots, scale):
+        """
+        Vectorized ``engine.sweep_ball`` for ``slots``, one contact per room
+        and pass. Returns the slots where a point was scored.
+        """
+        x, y = self.x[slots], self.y[slots]
+        dx, dy = self.dx[slots], self.dy[slots]
+        speed = self.speed[slots]
+        p1_y, p2_y = self.p1_y[slots], self.p2_y[slots]
+        remaining = np.ones(len(slots))
+        scored = np.zeros(len(slots), dtype=bool)
+        for _ in range(MAX_CONTACTS_PER_STEP):
+            vx = dx * speed * scale
+            vy = dy * speed * scale
+            t_wall = time_to_line(y, vy)
+            t_paddle = time_to_line(x, vx)
+            t = np.minimum(t_wall, t_paddle)
+            contact = t < remaining
+            if not contact.any():
+                break
+            t = np.where(contact, t, 0)
+            x += vx * t
+            y += vy * t
+            remaining -= t
+
+            # Top/Bottom walls
+            wall = contact & (t_wall <= t_paddle)
+            y[wall] = np.where(vy[wall] > 0, COURT_MAX, COURT_MIN)
+            dy[wall] *= -1
+
+            paddle = contact & ~wall
+            left = paddle & (vx < 0)
+            right = paddle & (vx > 0)
+            hit_left = left & (np.abs(p1_y - y) <= PADDLE_HEIGHT / 2)
+            hit_right = right & (np.abs(p2_y - y) <= PADDLE_HEIGHT / 2)
+            hit = hit_left | hit_right
+            speed[hit] = np.minimum(speed[hit] * 1.15, MAX_BALL_SPEED)
+            x[hit_left] = COURT_MIN
+            x[hit_right] = COURT_MAX
+            dx[hit] *= -1
+
+            miss_left = left & ~hit_left
+            miss_right = right & ~hit_right
+            self.score[slots[miss_left], 1] += 1
+            self.score[slots[miss_right], 0] += 1
+            remaining[miss_left | miss_right] = 0
+            scored |= miss_left | miss_right
+
+        x += dx * speed * scale * remaining
+        y += dy * speed * scale * remaining
+        self.x[slots], self.y[slots] = x, y
+        self.dx[slots], self.dy[slots] = dx, dy
+        self.speed[slots] = speed
+
+        scored = slots[scored]
+        self.reset(scored)
+        return scored
+
+    def step(self, dt):
+        """
+        Advance every room by ``dt`` seconds. Returns ``{room_name: events}``
+        for the rooms where a point was scored, using the same event tuples
+        as ``engine.step``.
+        """
+        n = len(self.rooms)
+        if not n:
+            return {}
+
+        x, y = self.x[:n], self.y[:n]
+        speed = self.speed[:n]
+        scale = dt / INTERVAL
+        next_x = x + self.dx[:n] * speed * scale
+        next_y = y + self.dy[:n] * speed * scale
+        clear = (next_x >= COURT_MIN) & (next_x <= COURT_MAX) & (next_y >= COURT_MIN) & (next_y <= COURT_MAX)
+        # Most rooms stay clear of every wall and paddle line; only the
+        # others are swept
+        np.copyto(x, next_x, where=clear)
+        np.copyto(y, next_y, where=clear)
+        swept = np.flatnonzero(~clear)
+        if not swept.size:
+            return {}
+        scored = self.sweep(swept, scale)
+
+        room_events = {}
+        for slot in scored.tolist():
+            p1, p2 = self.score[slot].tolist()
+            events = [("score", {"p1": p1, "p2": p2})]
+            if p1 >= WINNING_SCORE or p2 >= WINNING_SCORE:
+                events.append(("game_over", 0 if p1 > p2 else 1))
+            room_events[self.rooms[slot]] = events
+        return room_events
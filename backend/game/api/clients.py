@@ -0,0 +1,140 @@
+import asyncio
+import logging
+import threading
+import aiohttp
+from django.conf import settings
+from .engine import engine
+
+logger = logging.getLogger(__name__)
+
+
+class ServiceClient:
+    """
+    Long-lived aiohttp sessions for calls to the other services, one per
+    event loop since a session cannot be shared between loops.
+
+    Each session keeps connections alive in a pool bounded overall and per
+    host, and caches DNS lookups, so a call to another service reuses an
+    open connection instead of paying DNS and TCP setup again. Sessions
+    are closed by `close`, which the ASGI lifespan handler calls on
+    shutdown.
+    """
+
+    def __init__(self, limit=100, limit_per_host=20, keepalive_timeout=30, dns_ttl=300,
+                 timeout=5, connect_timeout=2):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.dns_ttl = dns_ttl
+        self.timeout = aiohttp.ClientTimeout(total=timeout, connect=connect_timeout)
+        self.sessions = {}
+
+    def session(self):
+        loop = asyncio.get_running_loop()
+        session = self.sessions.get(loop)
+        if session is None or session.closed:
+            # Loops closed without a lifespan shutdown
+            for closed in [other for other in self.sessions if other.is_closed()]:
+                del self.sessions[closed]
+            connector = aiohttp.TCPConnector(
+                limit=self.limit,
+                limit_per_host=self.limit_per_host,
+                keepalive_timeout=self.keepalive_timeout,
+                ttl_dns_cache=self.dns_ttl,
+            )
+            session = self.sessions[loop] = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+        return session
+
+    def get(self, url, **kwargs):
+        return self.session().get(url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.session().post(url, **kwargs)
+
+    async def close(self):
+        """
+        Close the session of the running loop.
+        """
+        session = self.sessions.pop(asyncio.get_running_loop(), None)
+        if session is not None and not session.closed:
+            await session.close()
+
+
+def get_service_client():
+    return ServiceClient(
+        limit=getattr(settings, 'SERVICE_POOL_SIZE', 100),
+        limit_per_host=getattr(settings, 'SERVICE_POOL_SIZE_PER_HOST', 20),
+        keepalive_timeout=getattr(settings, 'SERVICE_KEEPALIVE_TIMEOUT', 30),
+        timeout=getattr(settings, 'AUTH_SERVICE_TIMEOUT', 5),
+        connect_timeout=getattr(settings, 'SERVICE_CONNECT_TIMEOUT', 2),
+    )
+
+
+service_client = get_service_client()
+
+
+class BackgroundLoop:
+    """
+    Event loop on a daemon thread for sync code, such as DRF authenticators
+    and views, that needs the async service helpers. Every call runs on
+    this one loop, so its service session and pooled connections are
+    reused across requests instead of a loop being built and torn down for
+    each.
+    """
+
+    def __init__(self):
+        self.loop = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self.loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name='service-loop', daemon=True).start()
+                self.loop = loop
+            return self.loop
+
+    def run(self, coroutine, timeout=None):
+        """
+        Run ``coroutine`` on the background loop and return its result,
+        blocking the calling thread.
+        """
+        return asyncio.run_coroutine_threadsafe(coroutine, self.start()).result(timeout)
+
+    async def stop(self):
+        with self._lock:
+            loop, self.loop = self.loop, None
+        if loop is None:
+            return
+        await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(service_client.close(), loop))
+        loop.call_soon_threadsafe(loop.stop)
+
+
+background_loop = BackgroundLoop()
+
+
+class LifespanApp:
+    """
+    ASGI lifespan handler: on shutdown, writes the game results the engine
+    still buffers, then closes the pooled service sessions and stops the
+    background loop.
+    """
+
+    async def __call__(self, scope, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                try:
+                    if engine.history is not None:
+                        await engine.history.close()
+                except Exception as e:
+                    logger.error(f"Failed to write buffered game results: {str(e)}")
+                try:
+                    await service_client.close()
+                    await background_loop.stop()
+                except Exception as e:
+                    logger.error(f"Failed to close service sessions: {str(e)}")
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
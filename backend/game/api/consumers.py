@@ -1,190 +1,198 @@
-import math
 import json
 import asyncio
 import logging
-import random
-import uuid
-from collections import deque
-from .models import GameHistory
+import time
+from .ids import uuid7
+from .engine import engine, PADDLE_HEIGHT, WINNING_SCORE, new_game_state, room_members
+from .inputs import MAX_INPUT_MESSAGE_SIZE, TokenBucket, parse_position
+from .pacing import PING_INTERVAL
+from .matchmaking import matchmaker
+from .ratings import get_rating
+from .protocol import PROTOCOL_BINARY, frame_layout, negotiate
 from asgiref.sync import sync_to_async
+from channels.consumer import get_handler_name
 from channels.generic.websocket import AsyncWebsocketConsumer
 
 logger = logging.getLogger(__name__)
 
-waiting_players = deque()
-games = {}
-
-BALL_SPEED = 0.75
-MAX_BALL_SPEED = 2
-
-BALL_DIRECTION_OPTIONS = [
-    (round(math.cos(angle), 2), round(math.sin(angle), 2))
-    for angle in [math.radians(deg) for deg in range(20, 161, 20)]
-] + [
-    (round(math.cos(angle), 2), round(math.sin(angle), 2))
-    for angle in [math.radians(deg) for deg in range(200, 341, 20)]
-]
-
-INTERVAL = 1 / 60
-WINNING_SCORE = 5
-PADDLE_HEIGHT = 20
-
 
 class PongGameConsumer(AsyncWebsocketConsumer):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.outbox = None
+        self.outbox_task = None
+        self.room_name = None
+        self.player_index = None
+        self.room_host = None
+        self.queue_task = None
+        self.rating = None
+        self.input_bucket = None
+        self.inputs_dropped = 0
+        self.ping_task = None
+
     async def connect(self):
-        await self.accept()
+        self.protocol, subprotocol = negotiate(self.scope)
+        await self.accept(subprotocol=subprotocol)
         user_id = self.scope.get("user_id")
         if not user_id:
             await self.close()
             return
 
-        if waiting_players:
-            opponent_channel, opponent_user_id = waiting_players.popleft()
-            game_instance = await self.create_game_instance(user_id, opponent_user_id)
-            room_name = str(game_instance.id)
-
-            games[room_name] = {
-                "id": room_name,
-                "players": [(opponent_channel, opponent_user_id), (self.channel_name, user_id)],
-                "ball": {
-                    "x": 49, 
-                    "y": 49, 
-                    "dx": random.choice(BALL_DIRECTION_OPTIONS)[0], 
-                    "dy": random.choice(BALL_DIRECTION_OPTIONS)[1]
-                },
-                "paddles": {"p1_y": 50, "p2_y": 50},
-                "score": {"p1": 0, "p2": 0},
-                "speed": BALL_SPEED
+        self.input_bucket = TokenBucket(engine.input_rate, engine.input_burst)
+        self.outbox = asyncio.Queue(maxsize=engine.outbox_size)
+        self.outbox_task = asyncio.create_task(self.drain_outbox())
+        self.ping_task = asyncio.create_task(self.ping())
+        engine.attach(self)
+        await engine.start()
+
+        self.rating = await sync_to_async(get_rating)(user_id)
+        match = await matchmaker.pair_or_enqueue(self.channel_name, user_id, self.rating)
+        if match:
+            await self.start_match(*match)
+        else:
+            self.queue_task = asyncio.create_task(self.keep_queued())
+
+    async def start_match(self, opponent_channel, opponent_user_id):
+        """
+        Create the room for this player and ``opponent_channel`` and start it
+        on the worker chosen to own it.
+        """
+        user_id = self.scope["user_id"]
+        # Generated here, the game is only written to the database once it ends
+        room_name = str(uuid7())
+
+        state = new_game_state(
+            room_name, [(opponent_channel, opponent_user_id), (self.channel_name, user_id)]
+        )
+        # Players connected to other workers than the owner forward their
+        # inputs to `host`
+        owner = await engine.place_room(room_name, state)
+        self.room_name, self.player_index, self.room_host = room_name, 1, owner
+        await engine.send_room(
+            room_members(state), {
+                "type": "match_found",
+                "room": room_name,
+                "players": [opponent_user_id, user_id],
+                "host": owner,
             }
-            await self.channel_layer.group_add(room_name, opponent_channel)
-            await self.channel_layer.group_add(room_name, self.channel_name)
-            await self.channel_layer.group_send(
-                room_name, {
-                    "type": "match_found",
-                    "room": room_name,
-                    "players": [opponent_user_id, user_id]
-                }
+        )
+        await engine.open_room(owner, state)
+
+    async def keep_queued(self):
+        """
+        Retry pairing while waiting. The search window widens with the time
+        spent in the queue, so a retry can find an opponent that was out of
+        range earlier; it also tells other workers the connection is alive.
+        """
+        while True:
+            await asyncio.sleep(matchmaker.retry_interval)
+            match = await matchmaker.pair_or_enqueue(
+                self.channel_name, self.scope["user_id"], self.rating, retry=True
             )
-            asyncio.create_task(self.game_loop(room_name))
-        else:
-            waiting_players.append((self.channel_name, user_id))
+            if match:
+                # Hosting from here; match_found must not cancel this task
+                self.queue_task = None
+                await self.start_match(*match)
+                return
 
     async def disconnect(self, close_code):
-        room_name = next(
-            (r for r, g in games.items() if self.channel_name in [p[0] for p in g["players"]]),
-            None
-        )
+        engine.detach(self.channel_name)
+        if self.outbox_task is not None:
+            self.outbox_task.cancel()
+        if self.ping_task is not None:
+            self.ping_task.cancel()
+
+        if self.queue_task is not None:
+            self.queue_task.cancel()
+            if self.room_name is None:
+                await matchmaker.remove(self.channel_name)
+
+        room_name, _ = engine.find_player(self.channel_name)
         if room_name:
-            game = games[room_name]
-            # Force an immediate win for the other player
-            if self.channel_name == game["players"][0][0]:
-                game["score"]["p2"] = WINNING_SCORE
-            else:
-                game["score"]["p1"] = WINNING_SCORE
-
-            await self.channel_layer.group_send(
-                room_name, {"type": "score_update", "score": game["score"]}
-            )
-    
-            await self.channel_layer.group_send(
-                room_name,
-                {"type": "game_end", "message": "Opponent disconnected, YOU WIN", "game": game}
-            )
-            games.pop(room_name, None)
-            await self.channel_layer.group_discard(room_name, self.channel_name)
+            await engine.end_room(room_name, self.channel_name)
+        elif self.room_name and self.room_host:
+            await self.channel_layer.send(self.room_host, {
+                "type": "room.leave",
+                "room": self.room_name,
+                "channel": self.channel_name,
+            })
 
-        # Remove from waiting list if present
-        if any(self.channel_name == p[0] for p in waiting_players):
-            waiting_players.remove(
-                next(player for player in waiting_players if player[0] == self.channel_name)
-            )
+    async def receive(self, text_data=None, bytes_data=None):
+        if not text_data or self.input_bucket is None:
+            return
+        # Rate limit before parsing so a flooding client costs as little as possible
+        if len(text_data) > MAX_INPUT_MESSAGE_SIZE or not self.input_bucket.allow():
+            self.inputs_dropped += 1
+            engine.input_stats["dropped"] += 1
+            return
+        try:
+            data = json.loads(text_data)
+        except ValueError:
+            return
+        if not isinstance(data, dict):
+            return
+        if self.room_name is None:
+            # The waiting player learns its room from match_found; an input
+            # can race ahead of that message, so fall back to the engine index.
+            self.room_name, self.player_index = engine.find_player(self.channel_name)
+            if self.room_name is None:
+                return
 
-    async def receive(self, text_data):
-        data = json.loads(text_data)
-        room_name = next(
-            (r for r, g in games.items() if self.channel_name in [p[0] for p in g["players"]]),
-            None
-        )
-        if not room_name:
+        if data.get("type") == "pong":
+            # The round trip is measured here and reported like an input
+            sent = parse_position(data.get("t"))
+            if sent is None:
+                return
+            data = {"type": "rtt", "rtt": time.monotonic() - sent / 1000}
+        elif data.get("type") not in ("move", "resync"):
+            return
+        if self.room_name not in engine.games and self.room_host:
+            # Room is owned by another worker, hand the input to it
+            await self.channel_layer.send(self.room_host, {
+                "type": "room.input",
+                "room": self.room_name,
+                "player_index": self.player_index,
+                "data": data,
+            })
             return
+        engine.apply_input(self.room_name, self.player_index, data)
 
-        if data["type"] == "move":
-            player_index = [p[0] for p in games[room_name]["players"]].index(self.channel_name)
-            # Clamp paddle between 0 and 100
-            games[room_name]["paddles"][f"p{player_index+1}_y"] = max(
-                0, min(100, data["y_position"])
-            )
+    async def ping(self):
+        """
+        Ping players in a room so the engine can pace broadcasts by their
+        round trip. Clients answer with ``{"type": "pong", "t": <t>}``.
+        """
+        while True:
+            await asyncio.sleep(PING_INTERVAL)
+            if self.room_name is not None:
+                await self.send(text_data=json.dumps({"type": "ping", "t": time.monotonic() * 1000}))
 
-    async def game_loop(self, room_name):
-        while room_name in games:
-            game = games[room_name]
-            ball = game["ball"]
-
-            # Move ball
-            ball["x"] += ball["dx"] * game["speed"]
-            ball["y"] += ball["dy"] * game["speed"]
-
-            # Top/Bottom walls
-            if ball["y"] <= 2 or ball["y"] >= 98:
-                ball["dy"] *= -1
-
-            # Left side (player 1)
-            if ball["x"] <= 2:
-                # If hits paddle, bounce; else score
-                if abs(game["paddles"]["p1_y"] - ball["y"]) <= PADDLE_HEIGHT / 2:
-                    game["speed"] = min (game["speed"] * 1.15, MAX_BALL_SPEED)
-                    ball["x"] = 2
-                    ball["dx"] *= -1
-                else:
-                    game["speed"] = BALL_SPEED
-                    game["score"]["p2"] += 1
-                    game["paddles"]["p2_y"] = 50
-                    game["paddles"]["p1_y"] = 50
-                    ball.update({
-                        "x": 49, "y": 49,
-                        "dx": random.choice(BALL_DIRECTION_OPTIONS)[0],
-                        "dy": random.choice(BALL_DIRECTION_OPTIONS)[1]
-                    })
-                    await self.channel_layer.group_send(
-                        room_name, {"type": "score_update", "score": game["score"]}
-                    )
-
-            # Right side (player 2)
-            elif ball["x"] >= 98:
-                if abs(game["paddles"]["p2_y"] - ball["y"]) <= PADDLE_HEIGHT / 2:
-                    game["speed"] = min (game["speed"] * 1.15, MAX_BALL_SPEED)
-                    ball["x"] = 98
-                    ball["dx"] *= -1
-                else:
-                    game["speed"] = BALL_SPEED
-                    game["score"]["p1"] += 1
-                    game["paddles"]["p2_y"] = 50
-                    game["paddles"]["p1_y"] = 50
-                    ball.update({
-                        "x": 49, "y": 49,
-                        "dx": random.choice(BALL_DIRECTION_OPTIONS)[0],
-                        "dy": random.choice(BALL_DIRECTION_OPTIONS)[1]
-                    })
-                    await self.channel_layer.group_send(
-                        room_name, {"type": "score_update", "score": game["score"]}
-                    )
-
-            # Check for game over
-            if game["score"]["p1"] >= WINNING_SCORE or game["score"]["p2"] >= WINNING_SCORE:
-                winner_name = game["players"][0][1] if game["score"]["p1"] > game["score"]["p2"] else game["players"][1][1]
-                await self.channel_layer.group_send(
-                    room_name,
-                    {"type": "game_end", "message": f"Game over, {winner_name}", "game": game}
-                )
-                games.pop(room_name, None)
-                break
-
-            # Broadcast state
-            await self.channel_layer.group_send(
-                room_name,
-                {"type": "game_state_update", "data": game}
-            )
-            await asyncio.sleep(INTERVAL)
+    async def room_moved(self, event):
+        """
+        The room was taken over by another worker after its owner died.
+        """
+        if event["room"] == self.room_name:
+            self.room_host = event["host"]
+
+    def deliver(self, message):
+        """
+        Fast path used by the engine for rooms hosted in this process: queue
+        the message for this socket without going through the channel layer.
+        Returns False when the outbox is full and the message was dropped.
+        """
+        try:
+            self.outbox.put_nowait(message)
+            return True
+        except asyncio.QueueFull:
+            return False
+
+    async def drain_outbox(self):
+        while True:
+            message = await self.outbox.get()
+            try:
+                await getattr(self, get_handler_name(message))(message)
+            except Exception as e:
+                logger.error(f"Failed to deliver {message['type']} to {self.channel_name}: {str(e)}")
 
     async def match_found(self, event):
         player_1_id, player_2_id = event["players"]
@@ -192,17 +200,32 @@ class PongGameConsumer(AsyncWebsocketConsumer):
         logger.info(f"Players: {player_1_id} vs {player_2_id}")
         # Assign role by matching current scope user with player_1 or player_2
         role = "player_1" if self.scope.get("user_id") == player_1_id else "player_2"
-        await self.send(text_data=json.dumps({
+        self.room_name = event["room"]
+        self.player_index = 0 if role == "player_1" else 1
+        self.room_host = event.get("host")
+        if self.queue_task is not None:
+            self.queue_task.cancel()
+        message = {
             "type": "match_found",
             "room": event["room"],
-            "role": role
-        }))
+            "role": role,
+            "players": event["players"],
+            "winning_score": WINNING_SCORE,
+            "paddle_height": PADDLE_HEIGHT,
+            "protocol": self.protocol,
+            # Lets clients predict their paddle between frames stamped with ticks
+            "tick_rate": round(1 / engine.dt),
+        }
+        if self.protocol == PROTOCOL_BINARY:
+            message["frame"] = frame_layout()
+        await self.send(text_data=json.dumps(message))
 
     async def game_state_update(self, event):
-        await self.send(text_data=json.dumps({
-            "type": "game_state_update",
-            "data": event["data"]
-        }))
+        # Frames arrive pre-encoded by the engine, forward them verbatim
+        if self.protocol == PROTOCOL_BINARY:
+            await self.send(bytes_data=event["bytes"])
+        else:
+            await self.send(text_data=event["text"])
 
     async def score_update(self, event):
         await self.send(text_data=json.dumps({
@@ -211,33 +234,106 @@ class PongGameConsumer(AsyncWebsocketConsumer):
         }))
 
     async def game_end(self, event):
-        await self.save_game_history(event["game"])
+        self.room_name = self.room_host = None
         await self.send(text_data=json.dumps({
             "type": "game_end",
             "message": event["message"]
         }))
 
-    @sync_to_async
-    def create_game_instance(self, player_1_id, player_2_id):
-        return GameHistory.objects.create(
-            player_1_id=uuid.UUID(player_1_id),
-            player_2_id=uuid.UUID(player_2_id),
-            player_1_score=0,
-            player_2_score=0,
-            winner_id=None
-        )
 
-    @sync_to_async
-    def save_game_history(self, game):
-        logger.info(f"Saving game history: {game}")
-        game_instance = GameHistory.objects.get(id=uuid.UUID(game["id"]))
-        game_instance.player_1_id = uuid.UUID(game["players"][0][1])
-        game_instance.player_2_id = uuid.UUID(game["players"][1][1])
-        game_instance.player_1_score = game["score"]["p1"]
-        game_instance.player_2_score = game["score"]["p2"]
-        game_instance.winner_id = (
-            uuid.UUID(game["players"][0][1])
-            if game["score"]["p1"] > game["score"]["p2"]
-            else uuid.UUID(game["players"][1][1])
-        )
-        game_instance.save()
+class SpectatorConsumer(AsyncWebsocketConsumer):
+    """
+    Read-only socket that streams one room at the spectator rate.
+
+    Spectators receive the same keyframe and delta encoding as players,
+    sampled at SPECTATOR_RATE and delivered by this worker's SpectatorRelay.
+    The only message they can send is a resync request.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.outbox = None
+        self.outbox_task = None
+        self.room_name = None
+        self.input_bucket = None
+
+    async def connect(self):
+        self.protocol, subprotocol = negotiate(self.scope)
+        await self.accept(subprotocol=subprotocol)
+        if not self.scope.get("user_id"):
+            await self.close()
+            return
+
+        self.input_bucket = TokenBucket(1, 5)
+        self.outbox = asyncio.Queue(maxsize=engine.outbox_size)
+        await engine.start()
+        room_name = self.scope["url_route"]["kwargs"]["room_name"]
+        state = await engine.watch_room(room_name, self)
+        if state is None:
+            await self.send(text_data=json.dumps({"type": "error", "message": "Game not found"}))
+            await self.close()
+            return
+        self.room_name = room_name
+
+        message = {
+            "type": "spectate_start",
+            "room": room_name,
+            "players": [user_id for _, user_id in state["players"]],
+            "score": state["score"],
+            "winning_score": WINNING_SCORE,
+            "paddle_height": PADDLE_HEIGHT,
+            "protocol": self.protocol,
+        }
+        if self.protocol == PROTOCOL_BINARY:
+            message["frame"] = frame_layout()
+        await self.send(text_data=json.dumps(message))
+        # Frames relayed meanwhile waited in the outbox, after spectate_start
+        self.outbox_task = asyncio.create_task(self.drain_outbox())
+
+    async def disconnect(self, close_code):
+        if self.outbox_task is not None:
+            self.outbox_task.cancel()
+        if self.room_name is not None:
+            engine.unwatch_room(self.room_name, self.channel_name)
+
+    async def receive(self, text_data=None, bytes_data=None):
+        if not text_data or self.room_name is None:
+            return
+        if len(text_data) > MAX_INPUT_MESSAGE_SIZE or not self.input_bucket.allow():
+            return
+        try:
+            data = json.loads(text_data)
+        except ValueError:
+            return
+        if isinstance(data, dict) and data.get("type") == "resync":
+            await engine.request_spectator_resync(self.room_name)
+
+    def deliver(self, message):
+        try:
+            self.outbox.put_nowait(message)
+            return True
+        except asyncio.QueueFull:
+            return False
+
+    async def drain_outbox(self):
+        while True:
+            message = await self.outbox.get()
+            try:
+                await getattr(self, get_handler_name(message))(message)
+            except Exception as e:
+                logger.error(f"Failed to deliver {message['type']} to spectator {self.channel_name}: {str(e)}")
+
+    async def spectator_frame(self, event):
+        if self.protocol == PROTOCOL_BINARY:
+            await self.send(bytes_data=event["bytes"])
+        else:
+            await self.send(text_data=event["text"])
+
+    async def spectator_end(self, event):
+        self.room_name = None
+        await self.send(text_data=json.dumps({
+            "type": "game_end",
+            "score": event["score"],
+            "message": event["message"],
+        }))
+        await self.close()
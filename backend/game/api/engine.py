@@ -0,0 +1,919 @@
+import math
+import asyncio
+import logging
+import random
+import time
+from channels.layers import get_channel_layer
+from django.conf import settings
+from .framebuffer import FRAME_RING_CAPACITY
+from .inputs import parse_position, parse_sequence
+from .ownership import HashRing, get_room_directory
+from .pacing import MAX_BROADCAST_STEP, MIN_BROADCAST_RATE, BroadcastPacer, LoadMeter, smooth
+from .protocol import DeltaTracker, KEYFRAME_INTERVAL, encode_payloads
+from .replay import ReplayRecorder
+from .spectators import RELAY_QUEUE_SIZE, SPECTATOR_RATE, SpectatorRelay
+
+logger = logging.getLogger(__name__)
+
+BALL_SPEED = 0.75
+MAX_BALL_SPEED = 2
+
+BALL_DIRECTION_OPTIONS = [
+    (round(math.cos(angle), 2), round(math.sin(angle), 2))
+    for angle in [math.radians(deg) for deg in range(20, 161, 20)]
+] + [
+    (round(math.cos(angle), 2), round(math.sin(angle), 2))
+    for angle in [math.radians(deg) for deg in range(200, 341, 20)]
+]
+
+INTERVAL = 1 / 60
+WINNING_SCORE = 5
+PADDLE_HEIGHT = 20
+# Lines the ball bounces off: walls on y, paddles on x
+COURT_MIN = 2
+COURT_MAX = 98
+# Bound on the wall and paddle contacts resolved in one step
+MAX_CONTACTS_PER_STEP = 8
+
+# Upper bound on physics steps run in a single scheduler wake-up when the
+# loop falls behind; anything beyond that is dropped instead of replayed.
+MAX_CATCHUP_STEPS = 5
+
+
+def new_game_state(room_name, players):
+    """
+    Build the initial state dict for a match between two (channel, user_id) pairs.
+    """
+    return {
+        "id": room_name,
+        "players": players,
+        "ball": {
+            "x": 49,
+            "y": 49,
+            "dx": random.choice(BALL_DIRECTION_OPTIONS)[0],
+            "dy": random.choice(BALL_DIRECTION_OPTIONS)[1]
+        },
+        "paddles": {"p1_y": 50, "p2_y": 50},
+        "score": {"p1": 0, "p2": 0},
+        "speed": BALL_SPEED,
+        # Simulation steps run so far and the last input sequence applied per player
+        "tick": 0,
+        "acks": {"p1": 0, "p2": 0},
+    }
+
+
+def reset_ball(state, rng=random):
+    state["speed"] = BALL_SPEED
+    state["paddles"]["p1_y"] = 50
+    state["paddles"]["p2_y"] = 50
+    state["ball"].update({
+        "x": 49, "y": 49,
+        "dx": rng.choice(BALL_DIRECTION_OPTIONS)[0],
+        "dy": rng.choice(BALL_DIRECTION_OPTIONS)[1]
+    })
+
+
+def time_to_line(position, velocity, low, high):
+    """
+    Fraction of the step after which a coordinate moving by ``velocity`` per
+    step reaches ``low`` or ``high``, or infinity when it moves away from
+    both. Positions already past a line in the direction of travel give 0.
+    """
+    if velocity < 0:
+        return max(0.0, (low - position) / velocity)
+    if velocity > 0:
+        return max(0.0, (high - position) / velocity)
+    return math.inf
+
+
+def sweep_ball(state, scale, events, rng=random):
+    """
+    Move the ball through a step that reaches a wall or paddle line: find
+    the first line it crosses during the rest of the step, move it there,
+    resolve the contact and carry on with the time left, so fast balls and
+    long steps cannot pass through a paddle.
+    """
+    ball = state["ball"]
+    paddles = state["paddles"]
+    score = state["score"]
+    remaining = 1.0
+    for _ in range(MAX_CONTACTS_PER_STEP):
+        vx = ball["dx"] * state["speed"] * scale
+        vy = ball["dy"] * state["speed"] * scale
+        t_wall = time_to_line(ball["y"], vy, COURT_MIN, COURT_MAX)
+        t_paddle = time_to_line(ball["x"], vx, COURT_MIN, COURT_MAX)
+        t = min(t_wall, t_paddle)
+        if t >= remaining:
+            break
+        ball["x"] += vx * t
+        ball["y"] += vy * t
+        remaining -= t
+
+        # Top/Bottom walls
+        if t_wall <= t_paddle:
+            ball["y"] = COURT_MAX if vy > 0 else COURT_MIN
+            ball["dy"] *= -1
+            continue
+
+        # Paddle line of the player the ball moves towards
+        key = "p1_y" if vx < 0 else "p2_y"
+        if abs(paddles[key] - ball["y"]) <= PADDLE_HEIGHT / 2:
+            state["speed"] = min(state["speed"] * 1.15, MAX_BALL_SPEED)
+            ball["x"] = COURT_MIN if vx < 0 else COURT_MAX
+            ball["dx"] *= -1
+        else:
+            score["p2" if vx < 0 else "p1"] += 1
+            reset_ball(state, rng)
+            events.append(("score", dict(score)))
+            remaining = 0
+            break
+
+    ball["x"] += ball["dx"] * state["speed"] * scale * remaining
+    ball["y"] += ball["dy"] * state["speed"] * scale * remaining
+
+
+def step(state, inputs, dt, rng=random):
+    """
+    Advance a single match by ``dt`` seconds.
+
+    ``inputs`` maps paddle keys (``p1_y``/``p2_y``) to the latest requested
+    position. The state dict is updated in place and a list of events is
+    returned: ``("score", score)`` when a point is scored and
+    ``("game_over", winner_index)`` once a player reaches WINNING_SCORE.
+    Speeds are expressed per INTERVAL and ``dt`` may be any multiple of it:
+    contacts with walls and paddles are resolved at the exact time they
+    happen within the step, so lower tick rates keep hits accurate. No I/O
+    happens here.
+    """
+    events = []
+    ball = state["ball"]
+    paddles = state["paddles"]
+    score = state["score"]
+
+    for key, y_position in inputs.items():
+        # Clamp paddle between 0 and 100
+        paddles[key] = max(0, min(100, y_position))
+
+    scale = dt / INTERVAL
+    x = ball["x"] + ball["dx"] * state["speed"] * scale
+    y = ball["y"] + ball["dy"] * state["speed"] * scale
+    if COURT_MIN <= x <= COURT_MAX and COURT_MIN <= y <= COURT_MAX:
+        # Most steps stay clear of every wall and paddle line
+        ball["x"], ball["y"] = x, y
+    else:
+        sweep_ball(state, scale, events, rng)
+
+    # Check for game over
+    if score["p1"] >= WINNING_SCORE or score["p2"] >= WINNING_SCORE:
+        events.append(("game_over", 0 if score["p1"] > score["p2"] else 1))
+
+    return events
+
+
+def room_members(state):
+    return [channel_name for channel_name, _ in state["players"]]
+
+
+class GameEngine:
+    """
+    Process-wide fixed-timestep scheduler that steps every active room from a
+    single coroutine.
+
+    The next deadline is advanced by exactly one timestep per step, so time
+    spent in physics and broadcasting is subtracted from the following sleep
+    instead of accumulating as drift. When the loop falls behind it runs up to
+    MAX_CATCHUP_STEPS physics steps before broadcasting once. With
+    SIMULATION_WORKERS set, physics runs in a ShardPool of child processes
+    that hand room states back through shared memory.
+
+    Consumers living in this process register with ``attach``; messages for
+    them are put straight into their outbox, and only members connected to
+    other workers are reached through the channel layer.
+
+    Every room is owned by exactly one worker, recorded as a lease in the
+    room directory. A new room is owned by the worker that paired it, which
+    hosts at least one player, and other workers reach the owner through its
+    worker channel. The owner renews its leases together with a snapshot of
+    each room; when it dies, a worker with a player of the room claims the
+    lapsed lease and resumes the room from the snapshot. Consistent hashing
+    over the live workers picks which of them claims first.
+    """
+
+    def __init__(self, tick_rate=None, backend=None, directory=None, workers=None):
+        game_settings = getattr(settings, 'GAME_SETTINGS', {})
+        if tick_rate is None:
+            tick_rate = game_settings.get('GAME_TICK_RATE', 30)
+        if backend is None:
+            backend = game_settings.get('PHYSICS_BACKEND', 'scalar')
+        if workers is None:
+            workers = game_settings.get('SIMULATION_WORKERS', 0)
+        self.dt = 1 / tick_rate
+        self.keyframe_interval = game_settings.get('KEYFRAME_INTERVAL', KEYFRAME_INTERVAL)
+        self.games = {}
+        self.inputs = {}
+        # room_name -> {player_index: input sequence} waiting for the next step
+        self.input_seqs = {}
+        # room_name -> value of `ticks` when the room was at tick 0
+        self.tick_origins = {}
+        self.trackers = {}
+        self.pacer = BroadcastPacer(
+            tick_rate, INTERVAL,
+            min_rate=game_settings.get('BROADCAST_MIN_RATE', MIN_BROADCAST_RATE),
+            max_step=game_settings.get('BROADCAST_MAX_STEP', MAX_BROADCAST_STEP),
+        )
+        self.load_meter = LoadMeter()
+        # room_name -> smoothed round trip per player, in seconds
+        self.rtts = {}
+        # room_name -> tick of the next broadcast, and the rate it was paced at
+        self.next_broadcast = {}
+        self.broadcast_rates = {}
+        # channel_name -> (room_name, player_index) for every player in a room
+        self.players = {}
+        self.consumers = {}
+        self.outbox_size = game_settings.get('LOCAL_OUTBOX_SIZE', 100)
+        self.input_rate = game_settings.get('INPUT_RATE_LIMIT', 2 * tick_rate)
+        self.input_burst = game_settings.get('INPUT_BURST', tick_rate // 2)
+        self.deliveries = {"local": 0, "remote": 0, "dropped": 0}
+        self.input_stats = {"accepted": 0, "coalesced": 0, "dropped": 0}
+        self.ticks = 0
+        self.batch = None
+        self.pool = None
+        self.channel_layer = None
+        self.directory = directory or get_room_directory()
+        # Channel other workers use to reach the rooms owned by this one
+        self.worker_channel = None
+        self._start_lock = asyncio.Lock()
+        self._task = None
+        self._worker_tasks = []
+        # Spectator frames are sent every `spectator_interval` ticks
+        self.spectator_interval = max(1, round(tick_rate / game_settings.get('SPECTATOR_RATE', SPECTATOR_RATE)))
+        self.next_spectator_tick = 0
+        self.spectator_trackers = {}
+        # room_name -> {relay worker channel: expiry} for owned rooms
+        self.relays = {}
+        # Rooms seen without an owner by the last `adopt_rooms`
+        self.orphaned = set()
+        self.relay = SpectatorRelay(game_settings.get('RELAY_QUEUE_SIZE', RELAY_QUEUE_SIZE))
+        # room_name -> state of rooms dropped after an error, until `run` announces them
+        self.aborted = {}
+        # GameHistoryWriter, created by `start` in the serving process
+        self.history = None
+        self.recorder = None
+        if game_settings.get('REPLAY_ENABLED'):
+            self.recorder = ReplayRecorder(
+                game_settings.get('REPLAY_DIR', 'replays'),
+                game_settings.get('MAX_GAME_DURATION', 600) * tick_rate,
+                tick_rate,
+            )
+
+        if workers:
+            from .shards import SHARD_STEP_TIMEOUT, ShardPool
+            self.pool = ShardPool(
+                workers, backend, game_settings.get('FRAME_RING_CAPACITY', FRAME_RING_CAPACITY),
+                game_settings.get('SHARD_STEP_TIMEOUT', SHARD_STEP_TIMEOUT),
+            )
+        elif backend == 'numpy':
+            from .batch import BatchPhysics
+            self.batch = BatchPhysics()
+
+    @property
+    def running(self):
+        return self._task is not None and not self._task.done()
+
+    async def start(self):
+        """
+        Open this worker's channel and start serving it. Safe to call from
+        every connection; only the first call does anything.
+        """
+        async with self._start_lock:
+            if self.worker_channel is not None:
+                return
+            if self.channel_layer is None:
+                self.channel_layer = get_channel_layer()
+            if self.history is None:
+                # Imported here so simulation shard processes never load the models
+                from .persistence import GameHistoryWriter
+                game_settings = getattr(settings, 'GAME_SETTINGS', {})
+                self.history = GameHistoryWriter(
+                    game_settings.get('HISTORY_BATCH_SIZE', 500),
+                    game_settings.get('HISTORY_FLUSH_INTERVAL', 1.0),
+                )
+            if self.pool is not None and not self.pool.started:
+                await asyncio.get_running_loop().run_in_executor(None, self.pool.start)
+            self.worker_channel = await self.channel_layer.new_channel('game.worker')
+            self._worker_tasks = [
+                asyncio.create_task(self.serve()),
+                asyncio.create_task(self.maintain()),
+            ]
+
+    def attach(self, consumer):
+        self.consumers[consumer.channel_name] = consumer
+
+    def detach(self, channel_name):
+        self.consumers.pop(channel_name, None)
+
+    def publish(self, members, message, pending):
+        """
+        Deliver ``message`` to every local member right away and queue
+        ``(channel_name, message)`` in ``pending`` for the others.
+        """
+        for channel_name in members:
+            consumer = self.consumers.get(channel_name)
+            if consumer is None:
+                pending.append((channel_name, message))
+            elif consumer.deliver(message):
+                self.deliveries["local"] += 1
+            else:
+                self.deliveries["dropped"] += 1
+
+    async def flush(self, pending):
+        """
+        Send queued remote messages through the channel layer, keeping the
+        order of messages per channel.
+        """
+        if not pending:
+            return
+        if self.channel_layer is None:
+            self.channel_layer = get_channel_layer()
+
+        by_channel = {}
+        for channel_name, message in pending:
+            by_channel.setdefault(channel_name, []).append(message)
+
+        async def send_in_order(channel_name, messages):
+            for message in messages:
+                await self.channel_layer.send(channel_name, message)
+
+        await asyncio.gather(*(send_in_order(c, m) for c, m in by_channel.items()))
+        self.deliveries["remote"] += len(pending)
+
+    async def send_room(self, members, message):
+        pending = []
+        self.publish(members, message, pending)
+        await self.flush(pending)
+
+    async def place_room(self, room_name, state):
+        """
+        Store the initial snapshot of a new room and return the worker
+        channel of its owner: this worker, since it hosts the joining
+        player, so the room's frames and inputs stay in process for them.
+        """
+        await self.directory.save_state(room_name, state)
+        return self.worker_channel
+
+    async def open_room(self, owner, state):
+        """
+        Start simulating a room placed with ``place_room`` on its owner.
+        """
+        if owner == self.worker_channel:
+            await self.claim_room(state["id"], state)
+        else:
+            await self.channel_layer.send(owner, {"type": "room.start", "state": state})
+
+    async def claim_room(self, room_name, state):
+        if not await self.directory.claim(room_name, self.worker_channel):
+            return False
+        self.add_room(room_name, state)
+        return True
+
+    def add_room(self, room_name, state):
+        self.games[room_name] = state
+        self.inputs[room_name] = {}
+        self.tick_origins[room_name] = self.ticks - state.get("tick", 0)
+        self.rtts[room_name] = [None, None]
+        self.next_broadcast[room_name] = self.ticks
+        self.trackers[room_name] = DeltaTracker(self.keyframe_interval)
+        for player_index, channel_name in enumerate(room_members(state)):
+            self.players[channel_name] = (room_name, player_index)
+        if self.pool is not None:
+            self.pool.add_room(room_name, state)
+        if self.batch is not None:
+            self.batch.add_room(room_name, state)
+        if self.recorder is not None:
+            self.recorder.open(room_name, state["players"])
+        if not self.running:
+            self._task = asyncio.create_task(self.run())
+
+    def remove_room(self, room_name):
+        """
+        Stop simulating a room and return its up-to-date state dict.
+        """
+        self.inputs.pop(room_name, None)
+        self.input_seqs.pop(room_name, None)
+        self.tick_origins.pop(room_name, None)
+        self.rtts.pop(room_name, None)
+        self.next_broadcast.pop(room_name, None)
+        self.broadcast_rates.pop(room_name, None)
+        self.trackers.pop(room_name, None)
+        state = self.games.pop(room_name, None)
+        if state is not None:
+            for channel_name in room_members(state):
+                if self.players.get(channel_name, (None,))[0] == room_name:
+                    del self.players[channel_name]
+        if self.pool is not None and room_name in self.pool:
+            self.pool.remove_room(room_name)
+        if self.batch is not None and room_name in self.batch:
+            self.batch.export(room_name, state)
+            self.batch.remove_room(room_name)
+        if self.recorder is not None:
+            self.recorder.close(room_name)
+        return state
+
+    def find_player(self, channel_name):
+        """
+        Return ``(room_name, player_index)`` for a channel, or ``(None, None)``.
+        """
+        return self.players.get(channel_name, (None, None))
+
+    def request_keyframe(self, room_name):
+        tracker = self.trackers.get(room_name)
+        if tracker is not None:
+            tracker.request_keyframe()
+
+    def snapshot(self, room_name):
+        state = self.games.get(room_name)
+        if state is not None and self.batch is not None:
+            self.batch.export(room_name, state)
+        return state
+
+    def apply_input(self, room_name, player_index, data):
+        if data.get("type") == "resync":
+            self.request_keyframe(room_name)
+
+        elif data.get("type") == "move":
+            y_position = parse_position(data.get("y_position"))
+            if y_position is not None:
+                self.submit_input(room_name, player_index, y_position, parse_sequence(data.get("seq")))
+
+        elif data.get("type") == "rtt":
+            rtt = parse_position(data.get("rtt"))
+            rtts = self.rtts.get(room_name)
+            if rtt is not None and rtt >= 0 and rtts is not None:
+                rtts[player_index] = smooth(rtts[player_index], rtt)
+
+    async def end_room(self, room_name, leaving_channel):
+        """
+        End a room owned by this worker because ``leaving_channel`` left.
+        """
+        game = self.remove_room(room_name)
+        if game is None:
+            return
+        # Force an immediate win for the other player
+        if leaving_channel == game["players"][0][0]:
+            game["score"]["p2"] = WINNING_SCORE
+        else:
+            game["score"]["p1"] = WINNING_SCORE
+
+        opponents = [c for c in room_members(game) if c != leaving_channel]
+        await self.send_room(opponents, {"type": "score_update", "score": game["score"]})
+        await self.send_room(opponents, {"type": "game_end", "message": "Opponent disconnected, YOU WIN"})
+        self.finish_game(game)
+        pending = []
+        self.end_spectators(room_name, game, "A player disconnected", pending)
+        await self.flush(pending)
+        await self.directory.release(room_name, self.worker_channel)
+
+    async def serve(self):
+        """
+        Handle messages sent to this worker's channel by other workers.
+        """
+        while True:
+            message = await self.channel_layer.receive(self.worker_channel)
+            try:
+                if message["type"] == "room.start":
+                    await self.claim_room(message["state"]["id"], message["state"])
+                elif message["type"] == "room.input":
+                    self.apply_input(message["room"], message["player_index"], message["data"])
+                elif message["type"] == "room.leave":
+                    await self.end_room(message["room"], message["channel"])
+                elif message["type"] == "room.watch":
+                    self.add_relay(message["room"], message["relay"], message["keyframe"])
+                elif message["type"] in ("spectator.frame", "spectator.end"):
+                    self.relay.push(message["room"], message)
+            except Exception as e:
+                logger.error(f"Failed to handle {message.get('type')} on {self.worker_channel}: {str(e)}")
+
+    async def maintain(self):
+        """
+        Renew the leases of owned rooms and take over rooms whose owner died.
+        """
+        while True:
+            await asyncio.sleep(self.directory.lease_ttl / 3)
+            try:
+                await self.renew_rooms()
+                await self.adopt_rooms()
+                await self.refresh_watches()
+            except Exception as e:
+                logger.error(f"Room ownership upkeep failed: {str(e)}")
+
+    async def renew_rooms(self):
+        states = {room_name: self.snapshot(room_name) for room_name in list(self.games)}
+        for room_name in await self.directory.renew(self.worker_channel, states):
+            if room_name in self.games:
+                logger.warning(f"Lost ownership of room {room_name}")
+                self.remove_room(room_name)
+                self.relays.pop(room_name, None)
+                self.spectator_trackers.pop(room_name, None)
+
+    async def adopt_rooms(self):
+        """
+        Check the owner of every room a local player is in but that runs
+        elsewhere, and claim the room when its lease lapsed. The worker the
+        hash ring picks for the room claims it at once; others wait one more
+        round, so when both players' workers are alive only one of them
+        usually resumes the room.
+        """
+        watched = {}
+        for consumer in list(self.consumers.values()):
+            room_name = getattr(consumer, "room_name", None)
+            if room_name and room_name not in self.games:
+                watched.setdefault(room_name, []).append(consumer)
+
+        orphaned, ring = set(), None
+        for room_name, consumers in watched.items():
+            owner = await self.directory.owner(room_name)
+            if owner is None:
+                orphaned.add(room_name)
+                if ring is None:
+                    ring = HashRing(set(await self.directory.live_workers()) | {self.worker_channel})
+                if ring.node_for(room_name) != self.worker_channel and room_name not in self.orphaned:
+                    continue
+                state = await self.directory.load_state(room_name)
+                if state is None or not await self.claim_room(room_name, state):
+                    continue
+                logger.warning(f"Took over room {room_name}")
+                owner = self.worker_channel
+                for consumer in consumers:
+                    consumer.room_host = owner
+                await self.send_room(
+                    room_members(state), {"type": "room_moved", "room": room_name, "host": owner}
+                )
+                continue
+            for consumer in consumers:
+                consumer.room_host = owner
+        self.orphaned = orphaned
+
+    async def watch_room(self, room_name, consumer):
+        """
+        Subscribe a spectator connected to this worker to a room. Returns the
+        room's state, or None when no worker is running the room.
+        """
+        if room_name in self.games:
+            self.relay.watch(room_name, consumer)
+            self.request_spectator_keyframe(room_name)
+            return self.snapshot(room_name)
+
+        owner = await self.directory.owner(room_name)
+        state = await self.directory.load_state(room_name) if owner else None
+        if state is None:
+            return None
+        self.relay.watch(room_name, consumer)
+        # Ask for a keyframe so the new spectator can start rendering
+        await self.channel_layer.send(owner, {
+            "type": "room.watch",
+            "room": room_name,
+            "relay": self.worker_channel,
+            "keyframe": True,
+        })
+        return state
+
+    def unwatch_room(self, room_name, channel_name):
+        # The owner keeps sending to this relay until its subscription expires
+        self.relay.unwatch(room_name, channel_name)
+
+    def add_relay(self, room_name, relay, keyframe=False):
+        if room_name not in self.games:
+            return
+        self.relays.setdefault(room_name, {})[relay] = time.monotonic() + 2 * self.directory.lease_ttl
+        if keyframe:
+            self.request_spectator_keyframe(room_name)
+
+    def request_spectator_keyframe(self, room_name):
+        tracker = self.spectator_trackers.get(room_name)
+        if tracker is not None:
+            tracker.request_keyframe()
+
+    async def request_spectator_resync(self, room_name):
+        if room_name in self.games:
+            self.request_spectator_keyframe(room_name)
+            return
+        owner = await self.directory.owner(room_name)
+        if owner is not None:
+            await self.channel_layer.send(owner, {
+                "type": "room.watch",
+                "room": room_name,
+                "relay": self.worker_channel,
+                "keyframe": True,
+            })
+
+    async def refresh_watches(self):
+        """
+        Renew this worker's subscription to every remote room it relays, so
+        the owner keeps sending frames and a new owner learns about it.
+        """
+        for room_name in list(self.relay.watchers):
+            if room_name in self.games:
+                continue
+            owner = await self.directory.owner(room_name)
+            if owner is not None:
+                await self.channel_layer.send(owner, {
+                    "type": "room.watch",
+                    "room": room_name,
+                    "relay": self.worker_channel,
+                    "keyframe": False,
+                })
+
+    async def release_rooms(self, room_names):
+        for room_name in room_names:
+            try:
+                await self.directory.release(room_name, self.worker_channel)
+            except Exception as e:
+                logger.error(f"Failed to release room {room_name}: {str(e)}")
+
+    def submit_input(self, room_name, player_index, y_position, seq=None):
+        """
+        Record a paddle position for the next tick. Only the latest position
+        per player and tick is kept; earlier ones are counted as coalesced.
+
+        ``seq`` is the client's sequence number for the input, counted from
+        1; it is echoed in the frames once the step applying the input has
+        run. Inputs with a sequence number not above the last acknowledged
+        one are stale and ignored.
+        """
+        pending = self.inputs.get(room_name)
+        if pending is None:
+            return
+        if seq is not None:
+            seqs = self.input_seqs.setdefault(room_name, {})
+            acks = self.games[room_name].get("acks") or {}
+            if seq <= max(seqs.get(player_index, 0), acks.get(f"p{player_index+1}", 0)):
+                self.input_stats["dropped"] += 1
+                return
+            seqs[player_index] = seq
+        key = f"p{player_index+1}_y"
+        if key in pending:
+            self.input_stats["coalesced"] += 1
+        else:
+            self.input_stats["accepted"] += 1
+        pending[key] = y_position
+
+    def acknowledge_inputs(self):
+        """
+        Mark the sequence numbers of the pending inputs as applied; called
+        right before the step that consumes those inputs.
+        """
+        for room_name, seqs in self.input_seqs.items():
+            acks = self.games[room_name].setdefault("acks", {"p1": 0, "p2": 0})
+            for player_index, seq in seqs.items():
+                acks[f"p{player_index+1}"] = seq
+        self.input_seqs.clear()
+
+    def tick(self, dt, steps=1):
+        """
+        Step every room ``steps`` times. Returns ``(room_events, finished)``
+        where ``room_events`` maps rooms to the events they produced and
+        ``finished`` maps rooms that ended to ``(state, winner_index)``.
+        Finished rooms are removed from the engine. With a shard pool, `run`
+        calls `step_pool` instead.
+        """
+        if steps:
+            self.acknowledge_inputs()
+
+        room_events = {}
+        finished = {}
+        for _ in range(steps):
+            if self.recorder is not None:
+                self.abort_rooms(self.recorder.note_inputs(self.inputs))
+            if self.batch is not None:
+                events = self.step_batch(dt)
+            else:
+                events = self.step_rooms(dt)
+            if self.recorder is not None:
+                self.abort_rooms(self.recorder.record(self.snapshot))
+
+            for room_name, room_event_list in events.items():
+                if room_name in self.aborted:
+                    continue
+                room_events.setdefault(room_name, []).extend(room_event_list)
+                for kind, payload in room_event_list:
+                    if kind == "game_over":
+                        finished[room_name] = (self.remove_room(room_name), payload)
+            self.ticks += 1
+        return room_events, finished
+
+    async def step_pool(self, dt, steps):
+        """
+        `tick` with the physics run by the shard pool, awaiting the shards
+        without blocking the other coroutines of this worker.
+        """
+        if steps:
+            self.acknowledge_inputs()
+        inputs = {}
+        for room_name, room_inputs in self.inputs.items():
+            if room_inputs:
+                inputs[room_name] = room_inputs
+                self.inputs[room_name] = {}
+        if self.recorder is not None:
+            self.abort_rooms(self.recorder.note_inputs(inputs))
+        room_events, ended = await self.pool.step(dt, steps, inputs)
+        if self.recorder is not None:
+            # Shards only publish the state after their last step
+            self.abort_rooms(self.recorder.record(self.snapshot, steps))
+
+        finished = {}
+        for room_name, (state, winner_index) in ended.items():
+            # Rooms ended by a leaving player while the shards were stepping
+            if self.remove_room(room_name) is None:
+                continue
+            finished[room_name] = (state, winner_index)
+        self.ticks += steps
+        return room_events, finished
+
+    def step_rooms(self, dt):
+        room_events = {}
+        failed = []
+        for room_name, state in self.games.items():
+            inputs = self.inputs.get(room_name)
+            if inputs:
+                self.inputs[room_name] = {}
+            try:
+                events = step(state, inputs or {}, dt)
+            except Exception as e:
+                logger.error(f"Failed to step room {room_name}: {str(e)}")
+                failed.append(room_name)
+                continue
+            if events:
+                room_events[room_name] = events
+        self.abort_rooms(failed)
+        return room_events
+
+    def abort_rooms(self, room_names):
+        """
+        Stop simulating rooms that failed; `run` tells their players and
+        spectators on the next broadcast.
+        """
+        for room_name in room_names:
+            state = self.remove_room(room_name)
+            if state is not None:
+                self.aborted[room_name] = state
+
+    def publish_abort(self, room_name, game, pending):
+        message = "Game aborted after a server error"
+        self.publish(room_members(game), {"type": "game_end", "message": message}, pending)
+        self.end_spectators(room_name, game, message, pending)
+
+    def step_batch(self, dt):
+        for room_name, inputs in self.inputs.items():
+            if inputs:
+                for key, y_position in inputs.items():
+                    self.batch.set_paddle(room_name, key, y_position)
+                self.inputs[room_name] = {}
+        return self.batch.step(dt)
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        next_tick = loop.time()
+
+        while self.games:
+            steps = 0
+            while next_tick <= loop.time() and steps < MAX_CATCHUP_STEPS:
+                next_tick += self.dt
+                steps += 1
+            self.load_meter.start()
+            try:
+                if self.pool is not None:
+                    room_events, finished = await self.step_pool(self.dt, steps)
+                else:
+                    room_events, finished = self.tick(self.dt, steps)
+            except Exception as e:
+                # Failures of single rooms are handled by tick; keep serving the others
+                logger.error(f"Game engine tick failed: {str(e)}")
+                room_events, finished = {}, {}
+
+            if next_tick <= loop.time():
+                skipped = round((loop.time() - next_tick) / self.dt)
+                logger.warning(f"Game engine behind schedule, skipping {skipped} ticks")
+                next_tick = loop.time()
+
+            spectate = self.ticks >= self.next_spectator_tick
+            if spectate:
+                self.next_spectator_tick = self.ticks + self.spectator_interval
+
+            pending = []
+            for room_name in list(self.games) + list(finished):
+                self.publish_room(
+                    room_name, room_events.get(room_name, []), finished.get(room_name), pending, spectate
+                )
+            aborted, self.aborted = self.aborted, {}
+            for room_name, game in aborted.items():
+                self.publish_abort(room_name, game, pending)
+            self.load_meter.stop(steps * self.dt)
+            try:
+                await self.flush(pending)
+            except Exception as e:
+                logger.error(f"Game engine broadcast failed: {str(e)}")
+            if (finished or aborted) and self.worker_channel is not None:
+                asyncio.create_task(self.release_rooms(list(finished) + list(aborted)))
+
+            await asyncio.sleep(max(0, next_tick - loop.time()))
+
+        self._task = None
+
+    def publish_room(self, room_name, events, finished, pending, spectate=False):
+        game = finished[0] if finished else self.games.get(room_name)
+        if game is None:
+            return
+        members = room_members(game)
+
+        for kind, payload in events:
+            if kind == "score":
+                self.publish(members, {"type": "score_update", "score": payload}, pending)
+
+        if finished:
+            winner_index = finished[1]
+            winner_name = game["players"][winner_index][1]
+            self.publish(
+                members,
+                {"type": "game_end", "message": f"Game over, {winner_name}"},
+                pending
+            )
+            self.finish_game(game)
+            self.end_spectators(room_name, game, f"Game over, {winner_name}", pending)
+            return
+
+        tracker = self.trackers.get(room_name)
+        if tracker is None:
+            return
+
+        game["tick"] = self.ticks - self.tick_origins.get(room_name, 0)
+        # Scores and resyncs go out right away, other frames at the paced rate
+        if events or tracker.force_keyframe or self.ticks >= self.next_broadcast.get(room_name, 0):
+            self.next_broadcast[room_name] = self.ticks + self.pacer.ticks_between(self.broadcast_rate(room_name))
+            # Broadcast a keyframe or only the fields that changed
+            frame = tracker.next_frame(self.snapshot(room_name))
+            if frame is not None:
+                self.publish(members, {"type": "game_state_update", **encode_payloads(frame)}, pending)
+        if spectate:
+            self.publish_spectators(room_name, pending)
+
+    def finish_game(self, game):
+        """
+        Queue the result of a game that ended on this worker. Only the owner
+        reports a result, once per room.
+        """
+        if self.history is not None:
+            self.history.game_finished(game)
+
+    def broadcast_rate(self, room_name):
+        """
+        Pace a room by its ball speed, the round trip of its fastest player
+        and the engine load, and remember the rate for monitoring.
+        """
+        rtts = [rtt for rtt in self.rtts.get(room_name, ()) if rtt is not None]
+        rate = self.pacer.rate(
+            self.games[room_name]["speed"], min(rtts) if rtts else None, self.load_meter.load
+        )
+        self.broadcast_rates[room_name] = rate
+        return rate
+
+    def spectator_targets(self, room_name):
+        """
+        Return the live remote relays of a room, dropping expired ones.
+        """
+        relays = self.relays.get(room_name)
+        if not relays:
+            return []
+        now = time.monotonic()
+        for relay, expires in list(relays.items()):
+            if expires < now:
+                del relays[relay]
+        return list(relays)
+
+    def publish_spectators(self, room_name, pending):
+        """
+        Encode one spectator frame for a watched room and hand it to the
+        local relay and to every remote relay.
+        """
+        targets = self.spectator_targets(room_name)
+        if not targets and room_name not in self.relay:
+            return
+        tracker = self.spectator_trackers.get(room_name)
+        if tracker is None:
+            tracker = self.spectator_trackers[room_name] = DeltaTracker(self.keyframe_interval)
+        frame = tracker.next_frame(self.snapshot(room_name))
+        if frame is None:
+            return
+        message = {"type": "spectator.frame", "room": room_name, **encode_payloads(frame)}
+        self.relay.push(room_name, message)
+        pending.extend((relay, message) for relay in targets)
+
+    def end_spectators(self, room_name, game, text, pending):
+        targets = self.spectator_targets(room_name)
+        self.relays.pop(room_name, None)
+        self.spectator_trackers.pop(room_name, None)
+        message = {"type": "spectator.end", "room": room_name, "score": game["score"], "message": text}
+        self.relay.push(room_name, message)
+        pending.extend((relay, message) for relay in targets)
+
+
+engine = GameEngine()
@@ -0,0 +1,111 @@
+import struct
+from multiprocessing import shared_memory
+
+# room id, tick, ball x, ball y, ball dx, ball dy, speed, paddle 1 y, paddle 2 y,
+# score p1, score p2
+STATE_RECORD = struct.Struct('<IQ7d2B2x')
+# Total number of records ever written
+HEADER = struct.Struct('<Q')
+
+# Records per ring; one record per room and step, so this bounds the rooms a
+# shard can publish between two reads
+FRAME_RING_CAPACITY = 65536
+
+
+def state_record(room_id, tick, state):
+    ball = state["ball"]
+    return (
+        room_id, tick,
+        ball["x"], ball["y"], ball["dx"], ball["dy"], state["speed"],
+        state["paddles"]["p1_y"], state["paddles"]["p2_y"],
+        state["score"]["p1"], state["score"]["p2"],
+    )
+
+
+def apply_record(state, record):
+    """
+    Copy an unpacked STATE_RECORD into a state dict in place.
+    """
+    _, _, x, y, dx, dy, speed, p1_y, p2_y, score_1, score_2 = record
+    state["ball"].update({"x": x, "y": y, "dx": dx, "dy": dy})
+    state["speed"] = speed
+    state["paddles"]["p1_y"] = p1_y
+    state["paddles"]["p2_y"] = p2_y
+    state["score"]["p1"] = score_1
+    state["score"]["p2"] = score_2
+
+
+class FrameRing:
+    """
+    Single-producer ring buffer of fixed-size STATE_RECORDs in shared memory.
+
+    The creating process owns the segment and unlinks it on ``close``; the
+    producer attaches by ``name``. The producer copies a batch of packed
+    records into the buffer and publishes it by bumping the header counter,
+    and the reader unpacks records straight from views of the segment
+    without copying it. Every record carries a room's full state, so a reader that
+    falls more than ``capacity`` records behind only loses stale frames;
+    those are counted in ``overruns``.
+    """
+
+    def __init__(self, capacity=FRAME_RING_CAPACITY, name=None):
+        self.capacity = capacity
+        self.owner = name is None
+        self.shm = shared_memory.SharedMemory(
+            name=name, create=self.owner, size=HEADER.size + capacity * STATE_RECORD.size
+        )
+        self.buf = self.shm.buf
+        self.read_count = self.written()
+        self.overruns = 0
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def written(self):
+        return HEADER.unpack_from(self.buf, 0)[0]
+
+    def spans(self, start, stop):
+        """
+        Byte ranges of the buffer holding records ``start`` to ``stop``,
+        split where the ring wraps around.
+        """
+        while start < stop:
+            slot = start % self.capacity
+            end = min(stop, start - slot + self.capacity)
+            yield HEADER.size + slot * STATE_RECORD.size, end - start
+            start = end
+
+    def write(self, records):
+        data = b"".join([STATE_RECORD.pack(*record) for record in records])
+        count = self.written()
+        position = 0
+        for offset, length in self.spans(count, count + len(data) // STATE_RECORD.size):
+            size = length * STATE_RECORD.size
+            self.buf[offset:offset + size] = data[position:position + size]
+            position += size
+        HEADER.pack_into(self.buf, 0, count + len(data) // STATE_RECORD.size)
+
+    def read_latest(self):
+        """
+        Return ``{room_id: record}`` with the newest record of every room
+        written since the previous call.
+        """
+        count = self.written()
+        start = max(self.read_count, count - self.capacity)
+        self.overruns += start - self.read_count
+        self.read_count = count
+
+        latest = {}
+        for offset, length in self.spans(start, count):
+            # Later records overwrite earlier ones of the same room
+            with self.buf[offset:offset + length * STATE_RECORD.size] as records:
+                latest.update((record[0], record) for record in STATE_RECORD.iter_unpack(records))
+        return latest
+
+    def close(self):
+        self.buf.release()
+        self.buf = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
@@ -0,0 +1,16 @@
+import os
+import time
+import uuid
+
+
+def uuid7(now=None):
+    """
+    Time-ordered UUID (RFC 9562 version 7): 48 bits of Unix milliseconds
+    followed by random bits. Ids generated later sort later, so new game
+    rows are appended to the end of the primary key index.
+    """
+    milliseconds = int((time.time() if now is None else now) * 1000)
+    value = (milliseconds & 0xFFFF_FFFF_FFFF) << 80 | int.from_bytes(os.urandom(10), 'big')
+    value = value & ~(0xF << 76) | 0x7 << 76
+    value = value & ~(0x3 << 62) | 0x2 << 62
+    return uuid.UUID(int=value)
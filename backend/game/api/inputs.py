@@ -0,0 +1,53 @@
+import time
+
+# Largest client message we bother to parse; a move is ~40 bytes
+MAX_INPUT_MESSAGE_SIZE = 512
+
+
+class TokenBucket:
+    """
+    Per-connection rate limiter: ``rate`` tokens per second, holding at most
+    ``burst`` tokens. Each accepted message costs one token.
+    """
+
+    def __init__(self, rate, burst, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.clock = clock
+        self.updated = clock()
+
+    def allow(self):
+        now = self.clock()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+
+def parse_position(value):
+    """
+    Return a paddle position as a float, or None when the client sent
+    something that is not a finite number.
+    """
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return None
+    value = float(value)
+    if value != value or value in (float('inf'), float('-inf')):
+        return None
+    return value
+
+
+def parse_sequence(value):
+    """
+    Return an input sequence number as an int, or None when it is missing
+    or not a positive integer that fits the frame's 32-bit ack field.
+    Sequences start at 1, since an ack of 0 means no input applied yet.
+    """
+    if isinstance(value, bool) or not isinstance(value, int):
+        return None
+    if not 0 < value < 2 ** 32:
+        return None
+    return value
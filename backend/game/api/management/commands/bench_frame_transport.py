@@ -0,0 +1,147 @@
+import asyncio
+import multiprocessing
+import statistics
+import time
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from api.engine import new_game_state
+from api.framebuffer import STATE_RECORD, FrameRing, state_record
+
+
+def make_states(rooms):
+    return [new_game_state(f"room-{i}", [("a", "p1"), ("b", "p2")]) for i in range(rooms)]
+
+
+def shm_producer(conn, ring_name, capacity, rooms):
+    ring = FrameRing(capacity, name=ring_name)
+    states = make_states(rooms)
+    try:
+        while conn.recv():
+            now = time.monotonic_ns()
+            ring.write(state_record(room_id, now, state) for room_id, state in enumerate(states))
+            conn.send(True)
+    finally:
+        ring.close()
+
+
+def pipe_producer(conn, rooms):
+    states = make_states(rooms)
+    while conn.recv():
+        now = time.monotonic_ns()
+        conn.send({room_id: state_record(room_id, now, state) for room_id, state in enumerate(states)})
+
+
+def channel_layer_producer(conn, channel_name, rooms):
+    async def produce():
+        layer = get_channel_layer()
+        states = make_states(rooms)
+        while conn.recv():
+            now = time.monotonic_ns()
+            await asyncio.gather(*(
+                layer.send(channel_name, {
+                    "type": "game.frame",
+                    "bytes": STATE_RECORD.pack(*state_record(room_id, now, state)),
+                })
+                for room_id, state in enumerate(states)
+            ))
+            conn.send(True)
+    asyncio.run(produce())
+
+
+class Command(BaseCommand):
+    help = 'Compare frames per second and latency of the shared-memory frame ring, pipes and the channel layer'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rooms', type=int, nargs='+', default=[100, 1000, 10000])
+        parser.add_argument('--batches', type=int, default=200)
+        parser.add_argument('--transports', nargs='+', default=['shm', 'pipe', 'channel_layer'],
+                            choices=['shm', 'pipe', 'channel_layer'])
+
+    def handle(self, *args, **options):
+        self.context = multiprocessing.get_context('spawn')
+        self.stdout.write(f"{'transport':>14} {'rooms':>7} {'frames/s':>12} {'p50 us':>9} {'p99 us':>9}")
+        for rooms in options['rooms']:
+            for transport in options['transports']:
+                result = getattr(self, f"bench_{transport}")(rooms, options['batches'])
+                if result is None:
+                    continue
+                elapsed, latencies = result
+                latencies.sort()
+                self.stdout.write(
+                    f"{transport:>14} {rooms:>7} {rooms * options['batches'] / elapsed:>12.0f} "
+                    f"{statistics.median(latencies) / 1e3:>9.1f} "
+                    f"{latencies[int(len(latencies) * 0.99)] / 1e3:>9.1f}"
+                )
+
+    def run_producer(self, target, args, consume, batches):
+        parent, child = self.context.Pipe()
+        process = self.context.Process(target=target, args=(child, *args), daemon=True)
+        process.start()
+        latencies = []
+        try:
+            # One untimed batch so process start-up is not measured
+            parent.send(True)
+            consume(parent)
+            start = time.perf_counter()
+            for _ in range(batches):
+                parent.send(True)
+                latencies.extend(consume(parent))
+            elapsed = time.perf_counter() - start
+        finally:
+            parent.send(False)
+            process.join(timeout=5)
+        return elapsed, latencies
+
+    def bench_shm(self, rooms, batches):
+        ring = FrameRing(capacity=rooms)
+
+        def consume(conn):
+            conn.recv()
+            now = time.monotonic_ns()
+            return [now - record[1] for record in ring.read_latest().values()]
+
+        try:
+            return self.run_producer(shm_producer, (ring.name, rooms, rooms), consume, batches)
+        finally:
+            ring.close()
+
+    def bench_pipe(self, rooms, batches):
+        def consume(conn):
+            records = conn.recv()
+            now = time.monotonic_ns()
+            return [now - record[1] for record in records.values()]
+
+        return self.run_producer(pipe_producer, (rooms,), consume, batches)
+
+    def bench_channel_layer(self, rooms, batches):
+        if 'InMemory' in settings.CHANNEL_LAYERS['default']['BACKEND']:
+            self.stdout.write(f"{'channel_layer':>14} {rooms:>7} skipped, needs a cross-process channel layer")
+            return None
+        loop = asyncio.new_event_loop()
+        layer = get_channel_layer()
+        try:
+            channel_name = loop.run_until_complete(layer.new_channel('bench'))
+            loop.run_until_complete(asyncio.wait_for(layer.send(channel_name, {"type": "ping"}), 5))
+            loop.run_until_complete(asyncio.wait_for(layer.receive(channel_name), 5))
+        except Exception as e:
+            self.stdout.write(f"{'channel_layer':>14} {rooms:>7} skipped, {e}")
+            loop.close()
+            return None
+
+        async def receive_batch():
+            latencies = []
+            for _ in range(rooms):
+                message = await layer.receive(channel_name)
+                latencies.append(time.monotonic_ns() - STATE_RECORD.unpack(message["bytes"])[1])
+            return latencies
+
+        def consume(conn):
+            latencies = loop.run_until_complete(receive_batch())
+            conn.recv()
+            return latencies
+
+        try:
+            return self.run_producer(channel_layer_producer, (channel_name, rooms), consume, batches)
+        finally:
+            loop.close()
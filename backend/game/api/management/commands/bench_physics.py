@@ -0,0 +1,63 @@
+import random
+import time
+from django.core.management.base import BaseCommand
+from api.batch import BatchPhysics
+from api.engine import new_game_state, step
+
+
+class Command(BaseCommand):
+    help = 'Compare the per-room scalar physics loop against the NumPy batch backend'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rooms', type=int, nargs='+', default=[10, 100, 1000, 10000])
+        parser.add_argument('--ticks', type=int, default=600)
+        parser.add_argument('--tick-rate', type=int, default=60,
+                            help='Physics steps per simulated second; lower rates take longer steps')
+
+    def make_rooms(self, count):
+        rooms = {}
+        for i in range(count):
+            room_name = f"room-{i}"
+            state = new_game_state(room_name, [(f"chan-{i}-1", "p1"), (f"chan-{i}-2", "p2")])
+            # Random paddles so that both hits and misses happen
+            state["paddles"] = {"p1_y": random.uniform(0, 100), "p2_y": random.uniform(0, 100)}
+            rooms[room_name] = state
+        return rooms
+
+    def bench_scalar(self, rooms, ticks, dt):
+        start = time.perf_counter()
+        for _ in range(ticks):
+            for state in rooms.values():
+                if step(state, {}, dt):
+                    state["score"].update({"p1": 0, "p2": 0})
+        return time.perf_counter() - start
+
+    def bench_batch(self, rooms, ticks, dt):
+        batch = BatchPhysics(capacity=len(rooms))
+        for room_name, state in rooms.items():
+            batch.add_room(room_name, state)
+
+        start = time.perf_counter()
+        for _ in range(ticks):
+            for room_name in batch.step(dt):
+                batch.score[batch.slots[room_name]] = 0
+        return time.perf_counter() - start
+
+    def handle(self, *args, **options):
+        ticks = options['ticks']
+        tick_rate = options['tick_rate']
+        dt = 1 / tick_rate
+        self.stdout.write(f"{tick_rate} Hz, CPU per simulated second in ms")
+        self.stdout.write(
+            f"{'rooms':>8} {'scalar us/tick':>15} {'numpy us/tick':>15} {'scalar ms/s':>12} "
+            f"{'numpy ms/s':>11} {'speedup':>8}"
+        )
+        for count in options['rooms']:
+            random.seed(count)
+            scalar = self.bench_scalar(self.make_rooms(count), ticks, dt) / ticks
+            random.seed(count)
+            batch = self.bench_batch(self.make_rooms(count), ticks, dt) / ticks
+            self.stdout.write(
+                f"{count:>8} {scalar * 1e6:>15.1f} {batch * 1e6:>15.1f} {scalar * tick_rate * 1e3:>12.1f} "
+                f"{batch * tick_rate * 1e3:>11.1f} {scalar / batch:>7.1f}x"
+            )
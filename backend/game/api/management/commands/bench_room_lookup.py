@@ -0,0 +1,44 @@
+import random
+import time
+from django.core.management.base import BaseCommand
+from api.engine import GameEngine, new_game_state
+
+
+class Command(BaseCommand):
+    help = 'Compare the per-input room scan against the channel_name index'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rooms', type=int, default=5000)
+        parser.add_argument('--lookups', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        game_engine = GameEngine()
+        for i in range(options['rooms']):
+            room_name = f"room-{i}"
+            game_engine.games[room_name] = new_game_state(
+                room_name, [(f"chan-{i}-1", f"user-{i}-1"), (f"chan-{i}-2", f"user-{i}-2")]
+            )
+            game_engine.players[f"chan-{i}-1"] = (room_name, 0)
+            game_engine.players[f"chan-{i}-2"] = (room_name, 1)
+
+        games = game_engine.games
+        channels = [random.choice(list(game_engine.players)) for _ in range(options['lookups'])]
+
+        start = time.perf_counter()
+        for channel_name in channels:
+            # What receive() did before the index existed
+            room_name = next(
+                (r for r, g in games.items() if channel_name in [p[0] for p in g["players"]]),
+                None
+            )
+            [p[0] for p in games[room_name]["players"]].index(channel_name)
+        scan = (time.perf_counter() - start) / len(channels)
+
+        start = time.perf_counter()
+        for channel_name in channels:
+            game_engine.find_player(channel_name)
+        indexed = (time.perf_counter() - start) / len(channels)
+
+        self.stdout.write(f"rooms={options['rooms']} lookups={len(channels)}")
+        self.stdout.write(f"scan:  {scan * 1e6:>10.2f} us/input")
+        self.stdout.write(f"index: {indexed * 1e6:>10.2f} us/input ({scan / indexed:.0f}x faster)")
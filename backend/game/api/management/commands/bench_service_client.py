@@ -0,0 +1,66 @@
+import asyncio
+import time
+import aiohttp
+from aiohttp import web
+from django.core.management.base import BaseCommand
+from api.clients import ServiceClient
+
+
+class Command(BaseCommand):
+    help = 'Compare a session per call against the pooled service client on a local stub auth service'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--calls', type=int, default=2000)
+        parser.add_argument('--concurrency', type=int, default=20)
+
+    async def start_stub(self):
+        async def verify(request):
+            return web.json_response({'valid': True, 'user': {'id': 'user-1', 'username': 'stub'}})
+
+        app = web.Application()
+        app.router.add_post('/api/auth/verify/', verify)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        return runner, f"http://127.0.0.1:{port}/api/auth/verify/"
+
+    async def run_calls(self, call, calls, concurrency):
+        remaining = iter(range(calls))
+
+        async def worker():
+            for _ in remaining:
+                await call()
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return calls / (time.perf_counter() - start)
+
+    async def bench(self, calls, concurrency):
+        runner, url = await self.start_stub()
+        try:
+            async def session_per_call():
+                # What the service helpers did before the pooled client
+                async with aiohttp.ClientSession() as session:
+                    async with session.post(url) as response:
+                        await response.json()
+
+            client = ServiceClient(limit_per_host=concurrency)
+
+            async def pooled():
+                async with client.post(url) as response:
+                    await response.json()
+
+            per_call = await self.run_calls(session_per_call, calls, concurrency)
+            pooled_rate = await self.run_calls(pooled, calls, concurrency)
+            await client.close()
+        finally:
+            await runner.cleanup()
+        return per_call, pooled_rate
+
+    def handle(self, *args, **options):
+        per_call, pooled = asyncio.run(self.bench(options['calls'], options['concurrency']))
+        self.stdout.write(f"calls={options['calls']} concurrency={options['concurrency']}")
+        self.stdout.write(f"session per call: {per_call:>8.0f} calls/s")
+        self.stdout.write(f"pooled client:    {pooled:>8.0f} calls/s ({pooled / per_call:.1f}x)")
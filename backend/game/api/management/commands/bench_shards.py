@@ -0,0 +1,82 @@
+import asyncio
+import os
+import random
+import time
+from django.core.management.base import BaseCommand
+from api.engine import INTERVAL, new_game_state
+from api.shards import Shard, ShardPool
+
+
+class Command(BaseCommand):
+    help = 'Measure how room throughput scales with the number of simulation shard processes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rooms', type=int, nargs='+', default=[1000, 5000, 20000])
+        parser.add_argument('--workers', type=int, nargs='+', default=None)
+        parser.add_argument('--ticks', type=int, default=120)
+        parser.add_argument('--backend', choices=['scalar', 'numpy'], default='scalar')
+
+    def make_room(self, room_name):
+        state = new_game_state(room_name, [(f"{room_name}-1", "p1"), (f"{room_name}-2", "p2")])
+        state["paddles"] = {"p1_y": random.uniform(0, 100), "p2_y": random.uniform(0, 100)}
+        return state
+
+    def bench_in_process(self, count, ticks, backend):
+        shard = Shard(backend)
+        for i in range(count):
+            shard.add_room(f"room-{i}", i, self.make_room(f"room-{i}"))
+
+        start = time.perf_counter()
+        for _ in range(ticks):
+            _, finished = shard.step(INTERVAL, 1, {})
+            for room_name in finished:
+                shard.add_room(room_name, int(room_name.split("-")[1]), self.make_room(room_name))
+        return time.perf_counter() - start
+
+    async def bench_pool(self, count, ticks, workers, backend):
+        # Wait for every shard however long a step takes
+        pool = ShardPool(workers, backend, step_timeout=None)
+        pool.start()
+        try:
+            for i in range(count):
+                pool.add_room(f"room-{i}", self.make_room(f"room-{i}"))
+            # Let every shard finish loading before timing
+            await pool.step(INTERVAL, 1, {})
+
+            start = time.perf_counter()
+            for _ in range(ticks):
+                _, finished = await pool.step(INTERVAL, 1, {})
+                for room_name in finished:
+                    pool.add_room(room_name, self.make_room(room_name))
+            return time.perf_counter() - start
+        finally:
+            pool.stop()
+
+    def handle(self, *args, **options):
+        ticks = options['ticks']
+        backend = options['backend']
+        cores = os.cpu_count() or 1
+        worker_counts = options['workers'] or sorted({1, 2, 4, cores})
+        self.stdout.write(f"{cores} cores available, {backend} physics, {ticks} ticks")
+        self.stdout.write(
+            f"{'rooms':>8} {'workers':>8} {'ms/tick':>9} {'rooms/s':>12} {'rooms@60Hz':>11} {'per worker':>11}"
+        )
+
+        for count in options['rooms']:
+            random.seed(count)
+            elapsed = self.bench_in_process(count, ticks, backend)
+            self.report(count, 'inline', elapsed, ticks, 1)
+            for workers in worker_counts:
+                random.seed(count)
+                elapsed = asyncio.run(self.bench_pool(count, ticks, workers, backend))
+                self.report(count, workers, elapsed, ticks, workers)
+
+    def report(self, count, workers, elapsed, ticks, processes):
+        per_tick = elapsed / ticks
+        rooms_per_second = count / per_tick
+        # Rooms that fit in one tick's time budget at 60 Hz
+        capacity = int(rooms_per_second * INTERVAL)
+        self.stdout.write(
+            f"{count:>8} {workers:>8} {per_tick * 1e3:>9.2f} {rooms_per_second:>12.0f} "
+            f"{capacity:>11} {capacity // processes:>11}"
+        )
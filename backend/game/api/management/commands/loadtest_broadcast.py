@@ -0,0 +1,97 @@
+import json
+import random
+from django.core.management.base import BaseCommand
+from api.engine import INTERVAL, new_game_state, step
+from api.protocol import FIELDS, DeltaTracker, decode_binary, encode_binary, encode_json
+
+
+class SimulatedClient:
+    """
+    Minimal binary client: applies keyframes and deltas to a local view and
+    asks for a resync when it sees a sequence gap.
+    """
+
+    def __init__(self):
+        self.view = None
+        self.last_seq = None
+        self.resyncs = 0
+
+    def receive(self, data):
+        frame = decode_binary(data)
+        if not frame["keyframe"] and (self.view is None or frame["seq"] != self.last_seq + 1):
+            self.view = None
+            self.resyncs += 1
+            return True
+        if frame["keyframe"]:
+            self.view = dict(frame["fields"])
+        else:
+            self.view.update(frame["fields"])
+        self.last_seq = frame["seq"]
+        return False
+
+
+class Command(BaseCommand):
+    help = 'Measure broadcast bandwidth of full-state, JSON delta and binary delta frames with simulated clients'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rooms', type=int, default=100)
+        parser.add_argument('--seconds', type=int, default=60)
+        parser.add_argument('--move-rate', type=float, default=0.05,
+                            help='Probability that a player moves their paddle on a given tick')
+        parser.add_argument('--loss', type=float, default=0.001,
+                            help='Probability that a frame is dropped before reaching a client')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        rooms = []
+        for i in range(options['rooms']):
+            state = new_game_state(f"room-{i}", [(f"chan-{i}-1", f"user-{i}-1"), (f"chan-{i}-2", f"user-{i}-2")])
+            rooms.append((state, DeltaTracker(), [SimulatedClient(), SimulatedClient()]))
+
+        ticks = options['seconds'] * round(1 / INTERVAL)
+        full_bytes = json_bytes = binary_bytes = frames = keyframes = 0
+        in_sync = desynced = 0
+
+        for _ in range(ticks):
+            for state, tracker, clients in rooms:
+                inputs = {}
+                for key in ("p1_y", "p2_y"):
+                    if rng.random() < options['move_rate']:
+                        inputs[key] = state["paddles"][key] + rng.uniform(-5, 5)
+                step(state, inputs, INTERVAL, rng)
+                if state["score"]["p1"] >= 5 or state["score"]["p2"] >= 5:
+                    state["score"].update({"p1": 0, "p2": 0})
+
+                full_bytes += len(json.dumps({"type": "game_state_update", "data": state}).encode()) * len(clients)
+                frame = tracker.next_frame(state)
+                if frame is None:
+                    continue
+                frames += 1
+                keyframes += frame["keyframe"]
+                json_bytes += len(encode_json(frame).encode()) * len(clients)
+                data = encode_binary(frame)
+                binary_bytes += len(data) * len(clients)
+
+                for client in clients:
+                    if rng.random() < options['loss']:
+                        continue
+                    if client.receive(data):
+                        tracker.request_keyframe()
+                    elif client.view is not None:
+                        expected = dict(zip(FIELDS, (state["ball"]["x"], state["ball"]["y"],
+                                                     state["paddles"]["p1_y"], state["paddles"]["p2_y"])))
+                        if all(abs(client.view[name] - expected[name]) < 1e-3 for name in FIELDS):
+                            in_sync += 1
+                        else:
+                            desynced += 1
+
+        resyncs = sum(client.resyncs for _, _, clients in rooms for client in clients)
+        seconds = options['seconds']
+        self.stdout.write(f"rooms={options['rooms']} seconds={seconds} frames={frames} keyframes={keyframes} resyncs={resyncs}")
+        self.stdout.write(f"client views in sync: {in_sync}, out of sync: {desynced}")
+        for label, total in (("full JSON state", full_bytes), ("JSON deltas", json_bytes), ("binary deltas", binary_bytes)):
+            self.stdout.write(
+                f"{label:>16}: {total / seconds / 1024:>10.1f} KiB/s "
+                f"{total / (frames * 2):>7.1f} B/frame {100 * (1 - total / full_bytes):>6.1f}% saved"
+            )
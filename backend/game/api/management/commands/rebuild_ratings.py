@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from api.ratings import rebuild_ratings
+
+
+class Command(BaseCommand):
+    help = 'Recompute Elo ratings for every player from GameHistory'
+
+    def handle(self, *args, **options):
+        count = rebuild_ratings()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt ratings for {count} players"))
@@ -0,0 +1,251 @@
+import bisect
+import time
+from collections import deque
+import redis.asyncio as redis
+from django.conf import settings
+
+# Waiting players inspected on each side of a rating when pairing
+SEARCH_WIDTH = 16
+# Recent wait times kept for percentile reporting
+WAIT_SAMPLES = 1000
+
+# Pair the caller with the closest acceptable rating, or enqueue it. Two
+# players match when their rating gap fits in the wider of their two search
+# windows; a window starts at base_window and widens by widen_rate per
+# second waited, up to max_window. Entries whose worker stopped refreshing
+# them for longer than the timeout are purged first so nobody gets paired
+# with a dead connection. A retry never re-enqueues a player that is no
+# longer waiting, since it was most likely just paired by someone else.
+PAIR_SCRIPT = """
+local queue, joined, seen, users, waits = KEYS[1], KEYS[2], KEYS[3], KEYS[4], KEYS[5]
+local channel, user_id, rating = ARGV[1], ARGV[2], tonumber(ARGV[3])
+local now, timeout = tonumber(ARGV[4]), tonumber(ARGV[5])
+local base_window, widen_rate, max_window = tonumber(ARGV[6]), tonumber(ARGV[7]), tonumber(ARGV[8])
+local width, samples, retry = tonumber(ARGV[9]), tonumber(ARGV[10]), ARGV[11] == '1'
+
+local function forget(member)
+    redis.call('ZREM', queue, member)
+    redis.call('ZREM', joined, member)
+    redis.call('ZREM', seen, member)
+    redis.call('HDEL', users, member)
+end
+
+local function window(joined_at)
+    return math.min(max_window, base_window + widen_rate * (now - joined_at))
+end
+
+for _, member in ipairs(redis.call('ZRANGEBYSCORE', seen, '-inf', now - timeout)) do
+    forget(member)
+end
+
+local own_joined = tonumber(redis.call('ZSCORE', joined, channel))
+if retry and not own_joined then
+    -- Already paired by another player, or purged
+    return false
+end
+own_joined = own_joined or now
+local own_window = window(own_joined)
+
+local best, best_diff, best_joined
+local function consider(candidates)
+    for i = 1, #candidates, 2 do
+        local member = candidates[i]
+        if member ~= channel then
+            local diff = math.abs(tonumber(candidates[i + 1]) - rating)
+            local member_joined = tonumber(redis.call('ZSCORE', joined, member)) or now
+            if diff <= math.max(own_window, window(member_joined)) and (not best or diff < best_diff) then
+                best, best_diff, best_joined = member, diff, member_joined
+            end
+        end
+    end
+end
+consider(redis.call('ZREVRANGEBYSCORE', queue, rating, '-inf', 'WITHSCORES', 'LIMIT', 0, width))
+consider(redis.call('ZRANGEBYSCORE', queue, '(' .. rating, '+inf', 'WITHSCORES', 'LIMIT', 0, width))
+
+if best then
+    local opponent_user_id = redis.call('HGET', users, best)
+    forget(best)
+    forget(channel)
+    redis.call('LPUSH', waits, now - best_joined, now - own_joined)
+    redis.call('LTRIM', waits, 0, samples - 1)
+    return {best, opponent_user_id}
+end
+
+redis.call('ZADD', queue, rating, channel)
+redis.call('ZADD', joined, 'NX', now, channel)
+redis.call('ZADD', seen, now, channel)
+redis.call('HSET', users, channel, user_id)
+return false
+"""
+
+
+def percentiles(samples, points=(50, 90, 99)):
+    """
+    Nearest-rank percentiles of ``samples`` as ``{"p50": ..., ...}``.
+    """
+    ordered = sorted(samples)
+    return {
+        f"p{point}": round(ordered[min(len(ordered) - 1, len(ordered) * point // 100)], 3) if ordered else None
+        for point in points
+    }
+
+
+class SearchWindow:
+    """
+    Largest rating gap accepted for a player who has waited ``waited`` seconds.
+    """
+
+    def __init__(self, base=50, widen_rate=10, maximum=400):
+        self.base = base
+        self.widen_rate = widen_rate
+        self.maximum = maximum
+
+    def __call__(self, waited):
+        return min(self.maximum, self.base + self.widen_rate * waited)
+
+
+class LocalMatchmaker:
+    """
+    In-process matchmaking queue. Only correct with a single game worker;
+    kept for development and tests. Applies the same pairing rule as
+    RedisMatchmaker over a list kept sorted by rating.
+    """
+
+    def __init__(self, timeout=60, window=None, retry_interval=2, clock=time.time):
+        self.timeout = timeout
+        self.retry_interval = retry_interval
+        self.window = window or SearchWindow()
+        self.clock = clock
+        # (rating, channel_name), sorted
+        self.ratings = []
+        # channel_name -> (rating, user_id, joined_at)
+        self.queue = {}
+        self.waits = deque(maxlen=WAIT_SAMPLES)
+
+    async def pair_or_enqueue(self, channel_name, user_id, rating, retry=False):
+        if retry and channel_name not in self.queue:
+            return None
+        now = self.clock()
+        own_joined = self.queue[channel_name][2] if channel_name in self.queue else now
+        own_window = self.window(now - own_joined)
+
+        position = bisect.bisect_left(self.ratings, (rating, ''))
+        best = None
+        for other_rating, other_channel in self.ratings[max(0, position - SEARCH_WIDTH):position + SEARCH_WIDTH]:
+            if other_channel == channel_name:
+                continue
+            diff = abs(other_rating - rating)
+            other_joined = self.queue[other_channel][2]
+            if diff <= max(own_window, self.window(now - other_joined)) and (best is None or diff < best[0]):
+                best = (diff, other_channel, other_joined)
+
+        if best is None:
+            if channel_name not in self.queue:
+                self.queue[channel_name] = (rating, user_id, now)
+                bisect.insort(self.ratings, (rating, channel_name))
+            return None
+
+        _, opponent_channel, opponent_joined = best
+        opponent_user_id = self.queue[opponent_channel][1]
+        await self.remove(opponent_channel)
+        await self.remove(channel_name)
+        self.waits.extend((now - opponent_joined, now - own_joined))
+        return opponent_channel, opponent_user_id
+
+    async def remove(self, channel_name):
+        entry = self.queue.pop(channel_name, None)
+        if entry is not None:
+            self.ratings.remove((entry[0], channel_name))
+
+    async def size(self):
+        return len(self.queue)
+
+    async def wait_percentiles(self):
+        return percentiles(self.waits)
+
+
+class RedisMatchmaker:
+    """
+    Skill-based matchmaking queue shared by every game worker.
+
+    Waiting channels live in a sorted set scored by rating, so looking up
+    the nearest opponents and removing a player are both O(log n). Join
+    times, used to widen each player's search window, and the last refresh
+    from the owning worker are kept in two more sorted sets. Pairing runs as
+    a single Lua script, which makes it atomic across workers. Waiting
+    consumers retry periodically, which also refreshes their entry; entries
+    not refreshed within ``timeout`` seconds are purged.
+    """
+
+    def __init__(self, client=None, prefix='game:matchmaking', timeout=60, window=None, retry_interval=2):
+        self.client = client
+        self.timeout = timeout
+        self.retry_interval = retry_interval
+        self.window = window or SearchWindow()
+        self.queue_key = f"{prefix}:queue"
+        self.joined_key = f"{prefix}:joined"
+        self.seen_key = f"{prefix}:seen"
+        self.users_key = f"{prefix}:users"
+        self.waits_key = f"{prefix}:waits"
+        self._pair = None
+
+    def get_client(self):
+        if self.client is None:
+            self.client = redis.Redis(
+                host=settings.REDIS_HOST,
+                port=settings.REDIS_PORT,
+                password=settings.REDIS_PASSWORD,
+                decode_responses=True,
+            )
+        return self.client
+
+    async def pair_or_enqueue(self, channel_name, user_id, rating, retry=False):
+        client = self.get_client()
+        if self._pair is None:
+            self._pair = client.register_script(PAIR_SCRIPT)
+        result = await self._pair(
+            keys=[self.queue_key, self.joined_key, self.seen_key, self.users_key, self.waits_key],
+            args=[
+                channel_name, user_id, rating, time.time(), self.timeout,
+                self.window.base, self.window.widen_rate, self.window.maximum,
+                SEARCH_WIDTH, WAIT_SAMPLES, int(retry),
+            ],
+        )
+        return tuple(result) if result else None
+
+    async def remove(self, channel_name):
+        async with self.get_client().pipeline(transaction=True) as pipe:
+            pipe.zrem(self.queue_key, channel_name)
+            pipe.zrem(self.joined_key, channel_name)
+            pipe.zrem(self.seen_key, channel_name)
+            pipe.hdel(self.users_key, channel_name)
+            await pipe.execute()
+
+    async def size(self):
+        return await self.get_client().zcard(self.queue_key)
+
+    async def wait_percentiles(self):
+        samples = await self.get_client().lrange(self.waits_key, 0, -1)
+        return percentiles(float(sample) for sample in samples)
+
+
+def get_matchmaker():
+    game_settings = getattr(settings, 'GAME_SETTINGS', {})
+    timeout = game_settings.get('MATCHMAKING_TIMEOUT', 60)
+    retry_interval = game_settings.get('MATCHMAKING_RETRY_INTERVAL', 2)
+    window = SearchWindow(
+        base=game_settings.get('MATCHMAKING_BASE_WINDOW', 50),
+        widen_rate=game_settings.get('MATCHMAKING_WIDEN_RATE', 10),
+        maximum=game_settings.get('MATCHMAKING_MAX_WINDOW', 400),
+    )
+    if game_settings.get('MATCHMAKING_BACKEND', 'redis') == 'local':
+        return LocalMatchmaker(timeout=timeout, window=window, retry_interval=retry_interval)
+    return RedisMatchmaker(
+        prefix=game_settings.get('MATCHMAKING_KEY_PREFIX', 'game:matchmaking'),
+        timeout=timeout,
+        window=window,
+        retry_interval=retry_interval,
+    )
+
+
+matchmaker = get_matchmaker()
@@ -1,7 +1,7 @@
 from urllib.parse import parse_qs
 from channels.middleware import BaseMiddleware
 from django.conf import settings
-from .utils import verify_token_with_auth_service
+from .tokens import verify_token
 import logging
 
 logger = logging.getLogger(__name__)
@@ -20,7 +20,7 @@ class WebSocketAuthMiddleware(BaseMiddleware):
                 return await self.close_connection_safe(send, "Authentication required")
 
         
-            user_data = await verify_token_with_auth_service(token)
+            user_data = await verify_token(token)
     
             logger.info(f"Token verification result: {bool(user_data)}")
 
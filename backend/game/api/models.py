@@ -1,16 +1,26 @@
-import uuid
 from django.db import models
+from django.utils import timezone
+from .ids import uuid7
 
 class GameHistory(models.Model):
-    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    id = models.UUIDField(primary_key=True, default=uuid7, editable=False)
     player_1_id = models.UUIDField()
     player_2_id = models.UUIDField()
     player_1_score = models.IntegerField(default=0)
     player_2_score = models.IntegerField(default=0)
     winner_id = models.UUIDField(null=True, blank=True)
-    ended_at = models.DateTimeField(auto_now_add=True)
+    # Set from the end of the game, not when the batch holding it is written
+    ended_at = models.DateTimeField(default=timezone.now)
 
     def __str__(self):
         return f"Game: {self.player_1_id} vs {self.player_2_id} | Winner: {self.winner_id}"
 
 
+class PlayerRating(models.Model):
+    user_id = models.UUIDField(primary_key=True)
+    rating = models.FloatField(default=1000)
+    games_played = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.user_id}: {round(self.rating)}"
@@ -0,0 +1,194 @@
+import bisect
+import hashlib
+import json
+import time
+import redis.asyncio as redis
+from django.conf import settings
+
+# Extend the lease and refresh the state snapshot of every room this worker
+# still owns, record the worker's heartbeat and return the rooms whose
+# lease now belongs to someone else.
+RENEW_SCRIPT = """
+local workers, prefix = KEYS[1], ARGV[1]
+local worker, now, ttl = ARGV[2], tonumber(ARGV[3]), tonumber(ARGV[4])
+
+redis.call('ZADD', workers, now, worker)
+redis.call('ZREMRANGEBYSCORE', workers, '-inf', now - 10 * ttl / 1000)
+
+local lost = {}
+for i = 5, #ARGV, 2 do
+    local room = ARGV[i]
+    local owner_key = prefix .. ':' .. room .. ':owner'
+    if redis.call('GET', owner_key) == worker then
+        redis.call('PEXPIRE', owner_key, ttl)
+        redis.call('SET', prefix .. ':' .. room .. ':state', ARGV[i + 1], 'PX', 6 * ttl)
+    else
+        table.insert(lost, room)
+    end
+end
+return lost
+"""
+
+# Drop a room's lease and snapshot, but only while this worker holds it
+RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    redis.call('DEL', KEYS[1], KEYS[2])
+    return 1
+end
+return 0
+"""
+
+
+def ring_hash(value):
+    return int.from_bytes(hashlib.md5(value.encode()).digest()[:8], 'big')
+
+
+class HashRing:
+    """
+    Consistent hash ring over worker channels. Each worker gets ``replicas``
+    points on the ring, so adding or removing a worker only moves the rooms
+    that hashed next to its points.
+    """
+
+    def __init__(self, nodes=(), replicas=64):
+        self.points = sorted(
+            (ring_hash(f"{node}#{replica}"), node)
+            for node in set(nodes)
+            for replica in range(replicas)
+        )
+        self.hashes = [point for point, _ in self.points]
+
+    def node_for(self, key):
+        if not self.points:
+            return None
+        index = bisect.bisect(self.hashes, ring_hash(key)) % len(self.points)
+        return self.points[index][1]
+
+
+class LocalRoomDirectory:
+    """
+    Single-worker room directory: the local worker owns every room. Kept
+    for development and tests.
+    """
+
+    def __init__(self, lease_ttl=5):
+        self.lease_ttl = lease_ttl
+        self.owners = {}
+        self.states = {}
+
+    async def live_workers(self):
+        return []
+
+    async def claim(self, room_name, worker):
+        return self.owners.setdefault(room_name, worker) == worker
+
+    async def owner(self, room_name):
+        return self.owners.get(room_name)
+
+    async def save_state(self, room_name, state):
+        self.states[room_name] = state
+
+    async def load_state(self, room_name):
+        return self.states.get(room_name)
+
+    async def renew(self, worker, states):
+        for room_name, state in states.items():
+            self.states[room_name] = state
+        return [room_name for room_name in states if self.owners.get(room_name) != worker]
+
+    async def release(self, room_name, worker):
+        if self.owners.get(room_name) == worker:
+            del self.owners[room_name]
+            self.states.pop(room_name, None)
+
+
+class RedisRoomDirectory:
+    """
+    Records which game worker owns each room.
+
+    Ownership is a lease: ``{prefix}:{room}:owner`` holds the owning worker's
+    channel and expires after ``lease_ttl`` seconds unless the owner renews
+    it. Every renewal also stores a JSON snapshot of the room and a
+    heartbeat for the worker, so when a worker dies its leases lapse and
+    another worker can claim the room and resume it from the snapshot.
+    """
+
+    def __init__(self, client=None, prefix='game:rooms', lease_ttl=5):
+        self.client = client
+        self.prefix = prefix
+        self.lease_ttl = lease_ttl
+        self.workers_key = f"{prefix}:workers"
+        self._renew = None
+        self._release = None
+
+    def get_client(self):
+        if self.client is None:
+            self.client = redis.Redis(
+                host=settings.REDIS_HOST,
+                port=settings.REDIS_PORT,
+                password=settings.REDIS_PASSWORD,
+                decode_responses=True,
+            )
+        return self.client
+
+    def owner_key(self, room_name):
+        return f"{self.prefix}:{room_name}:owner"
+
+    def state_key(self, room_name):
+        return f"{self.prefix}:{room_name}:state"
+
+    @property
+    def ttl_ms(self):
+        return int(self.lease_ttl * 1000)
+
+    async def live_workers(self):
+        return await self.get_client().zrangebyscore(
+            self.workers_key, time.time() - self.lease_ttl, '+inf'
+        )
+
+    async def claim(self, room_name, worker):
+        """
+        Take the lease of a room nobody owns. Returns False when another
+        worker holds it.
+        """
+        return bool(await self.get_client().set(self.owner_key(room_name), worker, nx=True, px=self.ttl_ms))
+
+    async def owner(self, room_name):
+        return await self.get_client().get(self.owner_key(room_name))
+
+    async def save_state(self, room_name, state):
+        await self.get_client().set(self.state_key(room_name), json.dumps(state), px=6 * self.ttl_ms)
+
+    async def load_state(self, room_name):
+        state = await self.get_client().get(self.state_key(room_name))
+        return json.loads(state) if state else None
+
+    async def renew(self, worker, states):
+        """
+        Renew the leases of ``states`` (room name -> state dict) and return
+        the rooms this worker no longer owns.
+        """
+        client = self.get_client()
+        if self._renew is None:
+            self._renew = client.register_script(RENEW_SCRIPT)
+        args = [self.prefix, worker, time.time(), self.ttl_ms]
+        for room_name, state in states.items():
+            args += [room_name, json.dumps(state)]
+        return await self._renew(keys=[self.workers_key], args=args)
+
+    async def release(self, room_name, worker):
+        client = self.get_client()
+        if self._release is None:
+            self._release = client.register_script(RELEASE_SCRIPT)
+        await self._release(keys=[self.owner_key(room_name), self.state_key(room_name)], args=[worker])
+
+
+def get_room_directory():
+    game_settings = getattr(settings, 'GAME_SETTINGS', {})
+    lease_ttl = game_settings.get('ROOM_LEASE_TTL', 5)
+    if game_settings.get('ROOM_DIRECTORY_BACKEND', 'redis') == 'local':
+        return LocalRoomDirectory(lease_ttl=lease_ttl)
+    return RedisRoomDirectory(
+        prefix=game_settings.get('ROOM_KEY_PREFIX', 'game:rooms'),
+        lease_ttl=lease_ttl,
+    )
@@ -0,0 +1,78 @@
+import time
+
+# Court units the ball may travel between two broadcasts; clients
+# interpolate in between
+MAX_BROADCAST_STEP = 2
+# Lowest rate a room is broadcast at, whatever the load
+MIN_BROADCAST_RATE = 10
+# Round trip below which clients get the full rate; slower clients already
+# buffer frames for longer and get proportionally fewer
+RTT_TARGET = 0.1
+# Share of the tick budget the engine may spend before broadcasts slow down
+LOAD_TARGET = 0.5
+# Smoothing factor of the moving averages of round trips and load
+SMOOTHING = 0.2
+# Seconds between two pings of a player socket
+PING_INTERVAL = 2
+
+
+def smooth(average, sample):
+    return sample if average is None else average + SMOOTHING * (sample - average)
+
+
+class BroadcastPacer:
+    """
+    Picks how many simulation ticks pass between two broadcasts of a room.
+
+    Physics always steps at the tick rate. The broadcast rate is the rate at
+    which the ball moves at most MAX_BROADCAST_STEP between frames, scaled
+    down for players with a long round trip and, when the engine spends
+    more than LOAD_TARGET of each tick, by the load over that target. Under
+    overload the engine thus sends fewer frames before it has to skip
+    simulation ticks. Rates never drop below MIN_BROADCAST_RATE.
+    """
+
+    def __init__(self, tick_rate, interval, min_rate=MIN_BROADCAST_RATE, max_step=MAX_BROADCAST_STEP,
+                 rtt_target=RTT_TARGET, load_target=LOAD_TARGET):
+        self.tick_rate = tick_rate
+        # Seconds per unit of ball speed
+        self.interval = interval
+        self.min_rate = min(min_rate, tick_rate)
+        self.max_step = max_step
+        self.rtt_target = rtt_target
+        self.load_target = load_target
+
+    def rate(self, speed, rtt=None, load=0):
+        """
+        Broadcasts per second for a ball moving at ``speed`` with clients at
+        ``rtt`` seconds round trip while the engine runs at ``load``.
+        """
+        rate = speed / self.interval / self.max_step
+        if rtt is not None and rtt > self.rtt_target:
+            rate *= self.rtt_target / rtt
+        if load > self.load_target:
+            rate *= self.load_target / load
+        return max(self.min_rate, min(self.tick_rate, rate))
+
+    def ticks_between(self, rate):
+        return max(1, round(self.tick_rate / rate))
+
+
+class LoadMeter:
+    """
+    Moving average of the share of each tick's budget spent on work.
+    """
+
+    def __init__(self, clock=time.perf_counter):
+        self.clock = clock
+        self.load = 0
+        self.started = None
+
+    def start(self):
+        self.started = self.clock()
+
+    def stop(self, budget):
+        if self.started is None or budget <= 0:
+            return
+        self.load = smooth(self.load, (self.clock() - self.started) / budget)
+        self.started = None
@@ -0,0 +1,127 @@
+import asyncio
+import logging
+import uuid
+from asgiref.sync import sync_to_async
+from django.db import transaction
+from django.utils import timezone
+from .models import GameHistory
+from .ratings import record_results
+
+logger = logging.getLogger(__name__)
+
+# Games written per transaction, and seconds a game waits at most in the buffer
+HISTORY_BATCH_SIZE = 500
+HISTORY_FLUSH_INTERVAL = 1.0
+
+
+def game_result(game):
+    """
+    Turn a finished room state into the GameHistory fields to store.
+    """
+    player_1_id = uuid.UUID(str(game["players"][0][1]))
+    player_2_id = uuid.UUID(str(game["players"][1][1]))
+    return {
+        "player_1_id": player_1_id,
+        "player_2_id": player_2_id,
+        "player_1_score": game["score"]["p1"],
+        "player_2_score": game["score"]["p2"],
+        "winner_id": player_1_id if game["score"]["p1"] > game["score"]["p2"] else player_2_id,
+        "ended_at": timezone.now(),
+    }
+
+
+def write_games(finished):
+    """
+    Insert the ``finished`` games ({id: game_result}) in one transaction and
+    update the ratings of every game inserted. Games already in the table
+    are skipped, so replaying a batch after a failure cannot count a game
+    twice.
+    """
+    with transaction.atomic():
+        existing = set(GameHistory.objects.filter(id__in=list(finished)).values_list('id', flat=True))
+        created = [
+            GameHistory(id=game_id, **result)
+            for game_id, result in finished.items()
+            if game_id not in existing
+        ]
+        GameHistory.objects.bulk_create(created)
+        if created:
+            record_results([(game.player_1_id, game.player_2_id, game.winner_id) for game in created])
+    return len(created)
+
+
+class GameHistoryWriter:
+    """
+    Buffers game results in memory and writes them to the database in
+    batches from a background task, so the end of a game never waits for
+    Postgres. Games only get a row once they end.
+
+    Results are keyed by game id, so repeated results of a room collapse
+    into one. A batch that fails is put back in front of newer results and
+    retried on the next flush.
+    """
+
+    def __init__(self, batch_size=HISTORY_BATCH_SIZE, flush_interval=HISTORY_FLUSH_INTERVAL):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.finished = {}
+        self.written = 0
+        self._wake = asyncio.Event()
+        self._task = None
+
+    def __len__(self):
+        return len(self.finished)
+
+    def game_finished(self, game):
+        self.finished[uuid.UUID(str(game["id"]))] = game_result(game)
+        self.schedule()
+
+    def schedule(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run())
+        if len(self) >= self.batch_size:
+            self._wake.set()
+
+    async def run(self):
+        while self:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            await self.flush()
+
+    async def flush(self):
+        while self:
+            finished = dict(list(self.finished.items())[:self.batch_size])
+            for game_id in finished:
+                del self.finished[game_id]
+            try:
+                self.written += await sync_to_async(write_games)(finished)
+            except asyncio.CancelledError:
+                # Writing is idempotent, so the batch can be written again
+                self.finished = {**finished, **self.finished}
+                raise
+            except Exception as e:
+                logger.error(f"Failed to write {len(finished)} games: {str(e)}")
+                # Keep results that arrived meanwhile, they are newer
+                self.finished = {**finished, **self.finished}
+                return
+
+    async def close(self):
+        """
+        Stop the background task and write every buffered game, for
+        shutdown. Games that still cannot be written are logged.
+        """
+        task, self._task = self._task, None
+        if task is not None and not task.done():
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        await self.flush()
+        if self:
+            logger.error(
+                f"{len(self)} finished games were not written: {', '.join(str(game_id) for game_id in self.finished)}"
+            )
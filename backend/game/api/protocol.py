@@ -0,0 +1,213 @@
+import json
+import struct
+from urllib.parse import parse_qs
+
+PROTOCOL_JSON = 'json'
+PROTOCOL_BINARY = 'binary'
+
+# WebSocket subprotocol a client can request instead of ?protocol=binary
+BINARY_SUBPROTOCOL = 'pong.binary.v1'
+
+FRAME_KEY = 1
+FRAME_DELTA = 2
+
+# Per-frame fields, in wire order. Bit i of a delta's mask is FIELDS[i].
+FIELDS = ("ball_x", "ball_y", "p1_y", "p2_y")
+# Last input sequence applied per player; bit len(FIELDS) + i of a delta's
+# mask is ACKS[i]
+ACKS = ("p1", "p2")
+
+# type tag, sequence, tick, ball x, ball y, paddle 1 y, paddle 2 y, score p1,
+# score p2, input ack p1, input ack p2
+KEY_FRAME = struct.Struct('<BII4f2B2I')
+# type tag, sequence, tick, changed-field mask; followed by one float per set
+# field bit, then one uint32 per set ack bit
+DELTA_HEADER = struct.Struct('<BIIB')
+FIELD = struct.Struct('<f')
+ACK = struct.Struct('<I')
+
+# Frames between two periodic keyframes
+KEYFRAME_INTERVAL = 60
+
+
+def negotiate(scope):
+    """
+    Pick the wire protocol for a game socket. Returns ``(protocol, subprotocol)``
+    where ``subprotocol`` is the value to echo back in ``accept`` (or None).
+    Clients opt into binary frames either by offering BINARY_SUBPROTOCOL or
+    with a ``protocol=binary`` query parameter; everyone else gets JSON.
+    """
+    if BINARY_SUBPROTOCOL in scope.get('subprotocols', []):
+        return PROTOCOL_BINARY, BINARY_SUBPROTOCOL
+
+    try:
+        query_params = parse_qs(scope.get('query_string', b'').decode())
+    except Exception:
+        query_params = {}
+    if query_params.get('protocol', [None])[0] == PROTOCOL_BINARY:
+        return PROTOCOL_BINARY, None
+    return PROTOCOL_JSON, None
+
+
+def state_values(game):
+    ball = game["ball"]
+    paddles = game["paddles"]
+    return (ball["x"], ball["y"], paddles["p1_y"], paddles["p2_y"])
+
+
+def state_acks(game):
+    acks = game.get("acks") or {}
+    return tuple(acks.get(player, 0) for player in ACKS)
+
+
+class DeltaTracker:
+    """
+    Turns successive game states of one room into sequenced keyframes and
+    deltas.
+
+    A keyframe carries every field plus the score and is emitted on the
+    first frame, every ``keyframe_interval`` frames, whenever the score
+    changes and after ``request_keyframe``. Other frames only carry the
+    fields that differ from the previous frame, so a room with idle paddles
+    sends just the ball position. Sequence numbers increase by one per
+    emitted frame, letting clients spot a gap and ask for a resync.
+
+    Every frame is stamped with the room's simulation tick and carries the
+    sequence number of the last input applied for each player when it
+    changed (keyframes always do), so clients can drop the inputs the
+    server already applied and replay the rest on top of the frame.
+    """
+
+    def __init__(self, keyframe_interval=KEYFRAME_INTERVAL):
+        self.keyframe_interval = keyframe_interval
+        self.seq = 0
+        self.last_values = None
+        self.last_score = None
+        self.last_acks = None
+        self.since_keyframe = 0
+        self.force_keyframe = True
+
+    def request_keyframe(self):
+        self.force_keyframe = True
+
+    def next_frame(self, game):
+        """
+        Return the frame dict for ``game`` or None when nothing changed.
+        """
+        values = state_values(game)
+        acks = state_acks(game)
+        score = (game["score"]["p1"], game["score"]["p2"])
+        keyframe = (
+            self.force_keyframe
+            or score != self.last_score
+            or self.since_keyframe >= self.keyframe_interval
+        )
+
+        if keyframe:
+            fields = dict(zip(FIELDS, values))
+            self.force_keyframe = False
+            self.since_keyframe = 0
+        else:
+            fields = {
+                name: value
+                for name, value, previous in zip(FIELDS, values, self.last_values)
+                if value != previous
+            }
+            if not fields and acks == self.last_acks:
+                return None
+            self.since_keyframe += 1
+
+        self.seq += 1
+        frame = {"seq": self.seq, "tick": game.get("tick", 0), "keyframe": keyframe, "fields": fields}
+        if keyframe:
+            frame["score"] = {"p1": score[0], "p2": score[1]}
+        if keyframe or acks != self.last_acks:
+            frame["acks"] = dict(zip(ACKS, acks))
+        self.last_values = values
+        self.last_score = score
+        self.last_acks = acks
+        return frame
+
+
+def encode_binary(frame):
+    fields = frame["fields"]
+    if frame["keyframe"]:
+        score = frame["score"]
+        return KEY_FRAME.pack(
+            FRAME_KEY, frame["seq"], frame["tick"], *(fields[name] for name in FIELDS),
+            score["p1"], score["p2"], *(frame["acks"][player] for player in ACKS)
+        )
+
+    mask = 0
+    payload = b""
+    for bit, name in enumerate(FIELDS):
+        if name in fields:
+            mask |= 1 << bit
+            payload += FIELD.pack(fields[name])
+    if "acks" in frame:
+        for bit, player in enumerate(ACKS, len(FIELDS)):
+            mask |= 1 << bit
+            payload += ACK.pack(frame["acks"][player])
+    return DELTA_HEADER.pack(FRAME_DELTA, frame["seq"], frame["tick"], mask) + payload
+
+
+def decode_binary(data):
+    """
+    Inverse of encode_binary, used by tests and the simulated load-test clients.
+    """
+    if data[0] == FRAME_KEY:
+        _, seq, tick, *values, p1, p2, ack_1, ack_2 = KEY_FRAME.unpack(data)
+        return {
+            "seq": seq,
+            "tick": tick,
+            "keyframe": True,
+            "fields": dict(zip(FIELDS, values)),
+            "score": {"p1": p1, "p2": p2},
+            "acks": {"p1": ack_1, "p2": ack_2},
+        }
+
+    _, seq, tick, mask = DELTA_HEADER.unpack_from(data)
+    fields = {}
+    offset = DELTA_HEADER.size
+    for bit, name in enumerate(FIELDS):
+        if mask & (1 << bit):
+            fields[name] = FIELD.unpack_from(data, offset)[0]
+            offset += FIELD.size
+    frame = {"seq": seq, "tick": tick, "keyframe": False, "fields": fields}
+    if mask >> len(FIELDS):
+        frame["acks"] = {}
+        for player in ACKS:
+            frame["acks"][player] = ACK.unpack_from(data, offset)[0]
+            offset += ACK.size
+    return frame
+
+
+def encode_json(frame):
+    return json.dumps({"type": "game_state_update", **frame})
+
+
+def encode_payloads(frame):
+    """
+    Encode a frame once for every protocol. The result goes straight into
+    the channel layer message so each consumer only forwards the payload
+    matching its protocol instead of serializing the frame again.
+    """
+    return {"text": encode_json(frame), "bytes": encode_binary(frame)}
+
+
+def frame_layout():
+    """
+    Description of the binary frames sent to clients in match_found.
+    """
+    return {
+        "byte_order": "little",
+        "fields": list(FIELDS),
+        "acks": list(ACKS),
+        "keyframe": {"tag": FRAME_KEY, "format": KEY_FRAME.format},
+        "delta": {
+            "tag": FRAME_DELTA,
+            "header": DELTA_HEADER.format,
+            "field": FIELD.format,
+            "ack": ACK.format,
+        },
+    }
@@ -0,0 +1,91 @@
+from django.db import transaction
+from django.utils import timezone
+from .models import GameHistory, PlayerRating
+
+DEFAULT_RATING = 1000
+K_FACTOR = 32
+
+
+def expected_score(rating, opponent_rating):
+    return 1 / (1 + 10 ** ((opponent_rating - rating) / 400))
+
+
+def elo_update(rating_1, rating_2, score_1, k=K_FACTOR):
+    """
+    Return the new ratings after a game where player 1 scored ``score_1``
+    (1 for a win, 0 for a loss).
+    """
+    delta = k * (score_1 - expected_score(rating_1, rating_2))
+    return rating_1 + delta, rating_2 - delta
+
+
+def get_rating(user_id):
+    rating = PlayerRating.objects.filter(user_id=user_id).values_list('rating', flat=True).first()
+    return DEFAULT_RATING if rating is None else rating
+
+
+def record_result(player_1_id, player_2_id, winner_id):
+    record_results([(player_1_id, player_2_id, winner_id)])
+
+
+def record_results(results):
+    """
+    Apply ``(player_1_id, player_2_id, winner_id)`` results in order, locking
+    and writing every rating involved once.
+    """
+    user_ids = {user_id for player_1_id, player_2_id, _ in results for user_id in (player_1_id, player_2_id)}
+    with transaction.atomic():
+        existing = {
+            rating.user_id: rating
+            for rating in PlayerRating.objects.select_for_update().filter(user_id__in=user_ids)
+        }
+        created = {}
+        for player_1_id, player_2_id, winner_id in results:
+            players = []
+            for user_id in (player_1_id, player_2_id):
+                player = existing.get(user_id) or created.get(user_id)
+                if player is None:
+                    player = created[user_id] = PlayerRating(user_id=user_id, rating=DEFAULT_RATING)
+                players.append(player)
+            player_1, player_2 = players
+            player_1.rating, player_2.rating = elo_update(
+                player_1.rating, player_2.rating, 1 if winner_id == player_1_id else 0
+            )
+            player_1.games_played += 1
+            player_2.games_played += 1
+
+        # bulk_update skips auto_now, so stamp updated_at explicitly
+        now = timezone.now()
+        for rating in existing.values():
+            rating.updated_at = now
+        PlayerRating.objects.bulk_update(list(existing.values()), ['rating', 'games_played', 'updated_at'])
+        PlayerRating.objects.bulk_create(list(created.values()))
+
+
+def rebuild_ratings():
+    """
+    Recompute every rating by replaying finished games in order.
+    """
+    ratings = {}
+    games_played = {}
+    finished_games = (
+        GameHistory.objects.filter(winner_id__isnull=False)
+        .order_by('ended_at')
+        .values_list('player_1_id', 'player_2_id', 'winner_id')
+    )
+    for player_1_id, player_2_id, winner_id in finished_games.iterator():
+        ratings[player_1_id], ratings[player_2_id] = elo_update(
+            ratings.get(player_1_id, DEFAULT_RATING),
+            ratings.get(player_2_id, DEFAULT_RATING),
+            1 if winner_id == player_1_id else 0
+        )
+        games_played[player_1_id] = games_played.get(player_1_id, 0) + 1
+        games_played[player_2_id] = games_played.get(player_2_id, 0) + 1
+
+    with transaction.atomic():
+        PlayerRating.objects.all().delete()
+        PlayerRating.objects.bulk_create([
+            PlayerRating(user_id=user_id, rating=rating, games_played=games_played[user_id])
+            for user_id, rating in ratings.items()
+        ])
+    return len(ratings)
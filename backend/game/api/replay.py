@@ -0,0 +1,239 @@
+import logging
+import mmap
+import os
+import struct
+import uuid
+from array import array
+
+logger = logging.getLogger(__name__)
+
+REPLAY_MAGIC = b'PRPL'
+REPLAY_VERSION = 2
+# magic, version, tick rate, fixed-point scale, records written, player 1
+# and player 2 user ids
+REPLAY_HEADER = struct.Struct('<4sBHHI16s16s')
+RECORD_COUNT = struct.Struct('<I')
+RECORD_COUNT_OFFSET = struct.calcsize('<4sBHH')
+# input flags, physics steps, then the changes of ball x, ball y, paddle 1 y,
+# paddle 2 y since the previous record, the requested paddle 1 and 2
+# positions, and the score
+TICK_RECORD = struct.Struct('<BB4h2h2B')
+
+# Positions are stored in hundredths of a court unit
+FIXED_POINT_SCALE = 100
+INPUT_FLAGS = {"p1_y": 1, "p2_y": 2}
+TRACKED = (("ball", "x"), ("ball", "y"), ("paddles", "p1_y"), ("paddles", "p2_y"))
+
+
+def to_fixed(value):
+    return int(round(value * FIXED_POINT_SCALE))
+
+
+def replay_path(directory, room_name):
+    # Room names are GameHistory ids; parsing them keeps paths inside `directory`
+    return os.path.join(directory, f"{uuid.UUID(str(room_name))}.replay")
+
+
+class ReplayLog:
+    """
+    Append-only tick log of one room in a memory-mapped file.
+
+    The file is sized for ``max_ticks`` records when opened, so appending a
+    tick only packs integers into the mapping: positions are delta encoded
+    against the previous record as int16 fixed-point values, kept in
+    preallocated arrays. The header names both players, so a game can be
+    authorized from its log while it is still being played. Reopening an
+    existing log continues after its last record, which lets a worker that
+    takes over a room keep recording it.
+    """
+
+    def __init__(self, path, max_ticks, tick_rate, players=()):
+        self.path = path
+        self.max_ticks = max_ticks
+        self.last = array('h', [0] * len(TRACKED))
+        self.inputs = array('h', [0] * len(INPUT_FLAGS))
+        self.flags = 0
+        self.dropped = 0
+
+        exists = os.path.exists(path)
+        self.file = open(path, 'r+b' if exists else 'w+b')
+        size = REPLAY_HEADER.size + max_ticks * TICK_RECORD.size
+        if os.fstat(self.file.fileno()).st_size < size:
+            self.file.truncate(size)
+        self.map = mmap.mmap(self.file.fileno(), size)
+
+        if exists and self.map[:len(REPLAY_MAGIC) + 1] == REPLAY_MAGIC + bytes([REPLAY_VERSION]):
+            self.count = RECORD_COUNT.unpack_from(self.map, RECORD_COUNT_OFFSET)[0]
+            for tick in decode_records(self.map, self.count):
+                for i, (group, key) in enumerate(TRACKED):
+                    self.last[i] = to_fixed(tick[group][key])
+        else:
+            self.count = 0
+            user_ids = [uuid.UUID(str(user_id)).bytes for _, user_id in players] or [b'', b'']
+            REPLAY_HEADER.pack_into(
+                self.map, 0, REPLAY_MAGIC, REPLAY_VERSION, tick_rate, FIXED_POINT_SCALE, 0, *user_ids
+            )
+
+    def note_input(self, key, y_position):
+        flag = INPUT_FLAGS[key]
+        # Clamped like `step` does, clients may send any finite number
+        self.inputs[flag - 1] = to_fixed(max(0, min(100, y_position)))
+        self.flags |= flag
+
+    def record(self, state, steps=1):
+        if self.count >= self.max_ticks:
+            self.dropped += 1
+            return
+        ball = state["ball"]
+        paddles = state["paddles"]
+        last = self.last
+        x, y = to_fixed(ball["x"]), to_fixed(ball["y"])
+        p1_y, p2_y = to_fixed(paddles["p1_y"]), to_fixed(paddles["p2_y"])
+        TICK_RECORD.pack_into(
+            self.map, REPLAY_HEADER.size + self.count * TICK_RECORD.size,
+            self.flags, min(steps, 255),
+            x - last[0], y - last[1], p1_y - last[2], p2_y - last[3],
+            self.inputs[0], self.inputs[1],
+            state["score"]["p1"], state["score"]["p2"],
+        )
+        last[0], last[1], last[2], last[3] = x, y, p1_y, p2_y
+        self.flags = 0
+        self.count += 1
+        RECORD_COUNT.pack_into(self.map, RECORD_COUNT_OFFSET, self.count)
+
+    def close(self):
+        self.map.flush()
+        self.map.close()
+        # Give back the space reserved for ticks that were never played
+        self.file.truncate(REPLAY_HEADER.size + self.count * TICK_RECORD.size)
+        self.file.close()
+
+
+def decode_records(buffer, count, offset=REPLAY_HEADER.size):
+    """
+    Yield one dict per record with absolute positions.
+    """
+    values = [0] * len(TRACKED)
+    tick = 0
+    for index in range(count):
+        flags, steps, *deltas, input_1, input_2, score_1, score_2 = TICK_RECORD.unpack_from(
+            buffer, offset + index * TICK_RECORD.size
+        )
+        for i, delta in enumerate(deltas):
+            values[i] += delta
+        tick += steps
+        inputs = {}
+        if flags & INPUT_FLAGS["p1_y"]:
+            inputs["p1_y"] = input_1 / FIXED_POINT_SCALE
+        if flags & INPUT_FLAGS["p2_y"]:
+            inputs["p2_y"] = input_2 / FIXED_POINT_SCALE
+        yield {
+            "tick": tick,
+            "ball": {"x": values[0] / FIXED_POINT_SCALE, "y": values[1] / FIXED_POINT_SCALE},
+            "paddles": {"p1_y": values[2] / FIXED_POINT_SCALE, "p2_y": values[3] / FIXED_POINT_SCALE},
+            "inputs": inputs,
+            "score": {"p1": score_1, "p2": score_2},
+        }
+
+
+def read_replay(path):
+    """
+    Yield the ticks of a replay log, including one still being recorded.
+    """
+    with open(path, 'rb') as replay_file, \
+            mmap.mmap(replay_file.fileno(), 0, access=mmap.ACCESS_READ) as replay:
+        magic, version, _, _, count, _, _ = REPLAY_HEADER.unpack_from(replay, 0)
+        if magic != REPLAY_MAGIC or version != REPLAY_VERSION:
+            raise ValueError(f"{path} is not a replay log")
+        count = min(count, (len(replay) - REPLAY_HEADER.size) // TICK_RECORD.size)
+        yield from decode_records(replay, count)
+
+
+def read_players(path):
+    """
+    Return the user ids of both players as strings, or None when ``path``
+    is not a replay log naming them.
+    """
+    with open(path, 'rb') as replay_file:
+        header = replay_file.read(REPLAY_HEADER.size)
+    if len(header) < REPLAY_HEADER.size:
+        return None
+    magic, version, _, _, _, player_1, player_2 = REPLAY_HEADER.unpack(header)
+    if magic != REPLAY_MAGIC or version != REPLAY_VERSION or not any(player_1 + player_2):
+        return None
+    return str(uuid.UUID(bytes=player_1)), str(uuid.UUID(bytes=player_2))
+
+
+def read_raw(path, chunk_size=64 * 1024):
+    """
+    Yield the used part of a replay log as bytes chunks.
+    """
+    with open(path, 'rb') as replay_file:
+        header = replay_file.read(REPLAY_HEADER.size)
+        remaining = RECORD_COUNT.unpack_from(header, RECORD_COUNT_OFFSET)[0] * TICK_RECORD.size
+        yield header
+        while remaining > 0:
+            chunk = replay_file.read(min(chunk_size, remaining))
+            if not chunk:
+                return
+            remaining -= len(chunk)
+            yield chunk
+
+
+class ReplayRecorder:
+    """
+    Keeps a ReplayLog open for every room simulated by the engine.
+    """
+
+    def __init__(self, directory, max_ticks, tick_rate):
+        self.directory = directory
+        self.max_ticks = max_ticks
+        self.tick_rate = tick_rate
+        self.logs = {}
+        os.makedirs(directory, exist_ok=True)
+
+    def open(self, room_name, players=()):
+        try:
+            self.logs[room_name] = ReplayLog(
+                replay_path(self.directory, room_name), self.max_ticks, self.tick_rate, players
+            )
+        except (OSError, ValueError) as e:
+            logger.error(f"Replay recording disabled for room {room_name}: {str(e)}")
+
+    def close(self, room_name):
+        log = self.logs.pop(room_name, None)
+        if log is not None:
+            log.close()
+
+    def note_inputs(self, inputs):
+        """
+        Remember the paddle positions requested for the coming step.
+        Returns the rooms whose log failed.
+        """
+        failed = []
+        for room_name, log in self.logs.items():
+            pending = inputs.get(room_name)
+            if pending:
+                try:
+                    for key, y_position in pending.items():
+                        log.note_input(key, y_position)
+                except Exception as e:
+                    logger.error(f"Replay recording failed for room {room_name}: {str(e)}")
+                    failed.append(room_name)
+        return failed
+
+    def record(self, snapshot, steps=1):
+        """
+        Append the current state of every recorded room. Returns the rooms
+        whose log failed.
+        """
+        failed = []
+        for room_name, log in self.logs.items():
+            state = snapshot(room_name)
+            if state is not None:
+                try:
+                    log.record(state, steps)
+                except Exception as e:
+                    logger.error(f"Replay recording failed for room {room_name}: {str(e)}")
+                    failed.append(room_name)
+        return failed
@@ -1,6 +1,7 @@
 from django.urls import re_path
-from .consumers import PongGameConsumer
+from .consumers import PongGameConsumer, SpectatorConsumer
 
 websocket_urlpatterns = [
+    re_path(r'ws/game/spectate/(?P<room_name>[0-9a-f-]+)/$', SpectatorConsumer.as_asgi()),
     re_path(r'ws/game/', PongGameConsumer.as_asgi()),
 ]
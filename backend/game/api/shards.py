@@ -0,0 +1,321 @@
+import asyncio
+import atexit
+import itertools
+import logging
+import multiprocessing
+from .engine import step
+from .framebuffer import FRAME_RING_CAPACITY, FrameRing, apply_record, state_record
+
+logger = logging.getLogger(__name__)
+
+# Seconds the engine waits for a shard to finish a step before moving on without it
+SHARD_STEP_TIMEOUT = 0.1
+
+
+class Shard:
+    """
+    Rooms simulated by one shard process. After every step command the
+    state of each room is packed into the shard's FrameRing, so only events
+    and finished games travel back over the pipe.
+    """
+
+    def __init__(self, backend='scalar', ring=None):
+        self.ring = ring
+        self.games = {}
+        self.room_ids = {}
+        self.ticks = 0
+        self.batch = None
+        if backend == 'numpy':
+            from .batch import BatchPhysics
+            self.batch = BatchPhysics()
+
+    def add_room(self, room_name, room_id, state):
+        self.games[room_name] = state
+        self.room_ids[room_name] = room_id
+        if self.batch is not None:
+            self.batch.add_room(room_name, state)
+
+    def remove_room(self, room_name):
+        self.room_ids.pop(room_name, None)
+        state = self.games.pop(room_name, None)
+        if self.batch is not None and room_name in self.batch:
+            self.batch.export(room_name, state)
+            self.batch.remove_room(room_name)
+        return state
+
+    def step(self, dt, steps, inputs):
+        """
+        Run ``steps`` physics steps and publish every room's state. Returns
+        ``(room_events, finished)`` like ``GameEngine.tick``.
+        """
+        room_events = {}
+        finished = {}
+        for _ in range(steps):
+            if self.batch is not None:
+                for room_name, room_inputs in inputs.items():
+                    for key, y_position in room_inputs.items():
+                        self.batch.set_paddle(room_name, key, y_position)
+                events = self.batch.step(dt)
+            else:
+                events = {}
+                for room_name, state in self.games.items():
+                    room_step = step(state, inputs.get(room_name, {}), dt)
+                    if room_step:
+                        events[room_name] = room_step
+            inputs = {}
+
+            for room_name, room_step in events.items():
+                room_events.setdefault(room_name, []).extend(room_step)
+                for kind, payload in room_step:
+                    if kind == "game_over":
+                        finished[room_name] = (self.remove_room(room_name), payload)
+            self.ticks += 1
+
+        if self.ring is not None:
+            self.ring.write(self.records())
+        return room_events, finished
+
+    def records(self):
+        for room_name, state in self.games.items():
+            if self.batch is not None:
+                self.batch.export(room_name, state)
+            yield state_record(self.room_ids[room_name], self.ticks, state)
+
+
+def shard_main(conn, backend, ring_name, ring_capacity):
+    """
+    Entry point of a shard process: serve commands from the front-end until
+    the pipe closes.
+    """
+    ring = FrameRing(ring_capacity, name=ring_name)
+    shard = Shard(backend, ring)
+    try:
+        while True:
+            try:
+                command, *args = conn.recv()
+            except (EOFError, KeyboardInterrupt):
+                return
+            if command == "step":
+                conn.send(shard.step(*args))
+            elif command == "add":
+                shard.add_room(*args)
+            elif command == "remove":
+                shard.remove_room(*args)
+    finally:
+        ring.close()
+
+
+class ShardPool:
+    """
+    Runs room physics in ``workers`` child processes, one per core.
+
+    Each room lives on the least loaded shard. Commands travel over pipes
+    (Unix domain sockets): a step is sent to every shard before any reply
+    is read, so the shards simulate in parallel, and the replies are
+    awaited on the event loop for at most ``step_timeout`` seconds. A shard
+    that has not answered by then is late: it is left out of the following
+    steps until its reply arrives, and the inputs and steps meant for it
+    meanwhile are sent once it has caught up. Room states come back
+    through one shared-memory FrameRing per shard and are copied into the
+    state dicts the engine holds, so the rest of the engine works as with
+    in-process physics. A shard that dies is restarted and reloaded from
+    those states.
+    """
+
+    def __init__(self, workers, backend='scalar', ring_capacity=FRAME_RING_CAPACITY,
+                 step_timeout=SHARD_STEP_TIMEOUT):
+        self.workers = workers
+        self.backend = backend
+        self.ring_capacity = ring_capacity
+        self.step_timeout = step_timeout
+        self.context = multiprocessing.get_context('spawn')
+        self.processes = [None] * workers
+        self.connections = [None] * workers
+        self.rings = [None] * workers
+        # room_name -> shard index
+        self.rooms = {}
+        # room_name -> state dict shared with the engine
+        self.states = {}
+        self.room_ids = {}
+        self.id_rooms = {}
+        self.next_id = itertools.count()
+        # shard index -> (inputs, steps) held back while its last step is unanswered
+        self.late = {}
+
+    def __contains__(self, room_name):
+        return room_name in self.rooms
+
+    @property
+    def started(self):
+        return all(process is not None for process in self.processes)
+
+    def start(self):
+        if not any(self.processes):
+            atexit.register(self.stop)
+        for index in range(self.workers):
+            if self.processes[index] is None:
+                self.spawn(index)
+
+    def spawn(self, index):
+        if self.rings[index] is None:
+            self.rings[index] = FrameRing(self.ring_capacity)
+        parent, child = self.context.Pipe()
+        process = self.context.Process(
+            target=shard_main,
+            args=(child, self.backend, self.rings[index].name, self.ring_capacity),
+            name=f"game-shard-{index}",
+            daemon=True,
+        )
+        process.start()
+        child.close()
+        self.processes[index] = process
+        self.connections[index] = parent
+
+    def stop(self):
+        for index, process in enumerate(self.processes):
+            if process is None:
+                continue
+            self.connections[index].close()
+            process.join(timeout=1)
+            if process.is_alive():
+                process.terminate()
+            self.rings[index].close()
+            self.processes[index] = self.connections[index] = self.rings[index] = None
+
+    def restart(self, index):
+        logger.error(f"Simulation shard {index} died, restarting it")
+        process = self.processes[index]
+        if process is not None and process.is_alive():
+            process.terminate()
+        self.spawn(index)
+        for room_name, shard_index in self.rooms.items():
+            if shard_index == index:
+                self.send(index, ("add", room_name, self.room_ids[room_name], self.states[room_name]))
+
+    def send(self, index, message):
+        try:
+            self.connections[index].send(message)
+            return True
+        except OSError:
+            self.restart(index)
+            return False
+
+    def load(self):
+        counts = [0] * self.workers
+        for index in self.rooms.values():
+            counts[index] += 1
+        return counts
+
+    def add_room(self, room_name, state):
+        if not self.started:
+            self.start()
+        counts = self.load()
+        index = counts.index(min(counts))
+        room_id = next(self.next_id)
+        self.rooms[room_name] = index
+        self.states[room_name] = state
+        self.room_ids[room_name] = room_id
+        self.id_rooms[room_id] = room_name
+        self.send(index, ("add", room_name, room_id, state))
+
+    def remove_room(self, room_name):
+        index = self.forget(room_name)
+        if index is not None:
+            self.send(index, ("remove", room_name))
+
+    def forget(self, room_name):
+        self.states.pop(room_name, None)
+        self.id_rooms.pop(self.room_ids.pop(room_name, None), None)
+        return self.rooms.pop(room_name, None)
+
+    async def step(self, dt, steps, inputs):
+        """
+        Step every shard ``steps`` times and refresh the room states from
+        the frame rings. Returns ``(room_events, finished)``; finished rooms
+        are dropped from the pool.
+        """
+        by_shard = [{} for _ in range(self.workers)]
+        for room_name, room_inputs in inputs.items():
+            index = self.rooms.get(room_name)
+            if index is not None:
+                by_shard[index][room_name] = room_inputs
+        shard_steps = [steps] * self.workers
+
+        room_events, finished = {}, {}
+        for index in list(self.late):
+            held_inputs, held_steps = self.late[index]
+            for room_name, room_inputs in by_shard[index].items():
+                held_inputs.setdefault(room_name, {}).update(room_inputs)
+            if not self.connections[index].poll():
+                self.late[index] = (held_inputs, held_steps + steps)
+                continue
+            del self.late[index]
+            self.receive(index, room_events, finished)
+            by_shard[index], shard_steps[index] = held_inputs, held_steps + steps
+
+        sent = [index for index, shard_inputs in enumerate(by_shard)
+                if index not in self.late and self.send(index, ("step", dt, shard_steps[index], shard_inputs))]
+
+        replied = await self.wait(sent)
+        for index in sent:
+            if index in replied:
+                self.receive(index, room_events, finished)
+            else:
+                logger.warning(f"Simulation shard {index} did not finish its step within {self.step_timeout}s")
+                self.late[index] = ({}, 0)
+        return room_events, finished
+
+    async def wait(self, indexes):
+        """
+        Wait until the shards ``indexes`` have a reply to read, for at most
+        ``step_timeout`` seconds, without blocking the event loop. Returns
+        the shards that replied.
+        """
+        loop = asyncio.get_running_loop()
+        waiting = {self.connections[index].fileno(): index for index in indexes}
+        replied = set()
+        if not waiting:
+            return replied
+        done = loop.create_future()
+
+        def readable(fileno):
+            # A dead shard reads as EOF, which `receive` handles
+            loop.remove_reader(fileno)
+            replied.add(waiting[fileno])
+            if len(replied) == len(waiting) and not done.done():
+                done.set_result(None)
+
+        for fileno in waiting:
+            loop.add_reader(fileno, readable, fileno)
+        try:
+            await asyncio.wait_for(done, self.step_timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            for fileno in waiting:
+                loop.remove_reader(fileno)
+        return replied
+
+    def receive(self, index, room_events, finished):
+        """
+        Read the reply of shard ``index`` to its last step into
+        ``room_events`` and ``finished``, and apply its latest records.
+        """
+        try:
+            shard_events, shard_finished = self.connections[index].recv()
+        except (EOFError, OSError):
+            self.restart(index)
+            return
+        room_events.update(shard_events)
+        for room_name, (state, winner_index) in shard_finished.items():
+            mirror = self.states.get(room_name)
+            if mirror is not None:
+                mirror.update(state)
+                state = mirror
+            self.forget(room_name)
+            finished[room_name] = (state, winner_index)
+
+        for room_id, record in self.rings[index].read_latest().items():
+            room_name = self.id_rooms.get(room_id)
+            if room_name is not None:
+                apply_record(self.states[room_name], record)
@@ -0,0 +1,63 @@
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Spectator frames per second, well below the player tick rate
+SPECTATOR_RATE = 10
+RELAY_QUEUE_SIZE = 1024
+
+
+class SpectatorRelay:
+    """
+    Fans spectator frames out to the spectators connected to this worker.
+
+    The owner of a room encodes each spectator frame once and sends it to
+    one relay per worker that has spectators of the room, so its cost does
+    not grow with the audience. A relay queues the frame and a separate task
+    copies it into the outbox of every watcher, keeping the fan-out off the
+    simulation tick. Frames that do not fit in the queue are dropped and
+    counted; spectators recover with the next keyframe.
+    """
+
+    def __init__(self, queue_size=RELAY_QUEUE_SIZE):
+        # room_name -> {channel_name: consumer}
+        self.watchers = {}
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.dropped = 0
+        self._task = None
+
+    def __contains__(self, room_name):
+        return room_name in self.watchers
+
+    def watch(self, room_name, consumer):
+        self.watchers.setdefault(room_name, {})[consumer.channel_name] = consumer
+
+    def unwatch(self, room_name, channel_name):
+        watchers = self.watchers.get(room_name)
+        if watchers is None:
+            return
+        watchers.pop(channel_name, None)
+        if not watchers:
+            del self.watchers[room_name]
+
+    def push(self, room_name, message):
+        if room_name not in self.watchers:
+            return
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run())
+        try:
+            self.queue.put_nowait((room_name, message))
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+    async def run(self):
+        while True:
+            room_name, message = await self.queue.get()
+            if message["type"] == "spectator.end":
+                watchers = self.watchers.pop(room_name, {})
+            else:
+                watchers = self.watchers.get(room_name, {})
+            for consumer in list(watchers.values()):
+                if not consumer.deliver(message):
+                    self.dropped += 1
@@ -0,0 +1,954 @@
+import asyncio
+import base64
+import datetime
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+import uuid
+import jwt
+from unittest import mock
+from django.core.cache.backends.locmem import LocMemCache
+from django.test import SimpleTestCase, override_settings
+from rest_framework.test import APIRequestFactory, force_authenticate
+from .batch import BatchPhysics
+from .clients import BackgroundLoop, LifespanApp, ServiceClient
+from .engine import (
+    GameEngine,
+    INTERVAL,
+    MAX_BALL_SPEED,
+    WINNING_SCORE,
+    new_game_state,
+    step,
+)
+from .framebuffer import FrameRing, apply_record, state_record
+from .ids import uuid7
+from .inputs import TokenBucket, parse_position, parse_sequence
+from .matchmaking import LocalMatchmaker, SearchWindow, percentiles
+from .models import GameHistory
+from .ownership import HashRing, LocalRoomDirectory
+from .pacing import BroadcastPacer, LoadMeter
+from .persistence import GameHistoryWriter, game_result
+from .ratings import elo_update
+from .replay import REPLAY_HEADER, TICK_RECORD, ReplayLog, ReplayRecorder, read_players, read_replay, replay_path
+from .shards import ShardPool
+from .spectators import SpectatorRelay
+from .token_cache import REVOKED, TokenCache, token_key
+from .tokens import KeyUnavailable, LocalTokenVerifier
+from .views import replay_stream
+from .protocol import (
+    BINARY_SUBPROTOCOL,
+    PROTOCOL_BINARY,
+    PROTOCOL_JSON,
+    DeltaTracker,
+    decode_binary,
+    encode_binary,
+    negotiate,
+)
+
+
+PLAYER_IDS = ("8d2b9c1e-3f4a-4c5d-9e6f-7a8b9c0d1e2f", "1f2e3d4c-5b6a-4978-8695-a4b3c2d1e0f9")
+
+
+def make_state(**ball):
+    state = new_game_state("room", [("chan-1", PLAYER_IDS[0]), ("chan-2", PLAYER_IDS[1])])
+    state["ball"].update({"x": 49, "y": 49, "dx": 1, "dy": 0})
+    state["ball"].update(ball)
+    return state
+
+
+class StepTests(SimpleTestCase):
+    def test_ball_moves_by_speed_per_interval(self):
+        state = make_state(dx=0.5, dy=-0.5)
+        events = step(state, {}, INTERVAL)
+
+        self.assertEqual(events, [])
+        self.assertAlmostEqual(state["ball"]["x"], 49 + 0.5 * state["speed"])
+        self.assertAlmostEqual(state["ball"]["y"], 49 - 0.5 * state["speed"])
+
+    def test_dt_scales_movement(self):
+        state = make_state()
+        step(state, {}, INTERVAL * 2)
+
+        self.assertAlmostEqual(state["ball"]["x"], 49 + 2 * state["speed"])
+
+    def test_inputs_are_clamped(self):
+        state = make_state()
+        step(state, {"p1_y": -20, "p2_y": 140}, INTERVAL)
+
+        self.assertEqual(state["paddles"], {"p1_y": 0, "p2_y": 100})
+
+    def test_paddle_hit_bounces_and_speeds_up(self):
+        state = make_state(x=2.5, y=50, dx=-1)
+        state["speed"] = MAX_BALL_SPEED
+        step(state, {}, INTERVAL)
+
+        # Bounces off the paddle line at 2 and travels the rest of the step
+        self.assertAlmostEqual(state["ball"]["x"], 3.5)
+        self.assertEqual(state["ball"]["dx"], 1)
+        self.assertEqual(state["speed"], MAX_BALL_SPEED)
+
+    def test_hit_is_checked_where_the_ball_crosses_the_paddle(self):
+        # At 15 Hz the ball ends the step far past the paddle line and out of
+        # the paddle's reach, but crossed the line within it
+        state = make_state(x=6, y=50, dx=-0.94, dy=0.34)
+        state["speed"] = MAX_BALL_SPEED
+        state["paddles"]["p1_y"] = 42
+        events = step(state, {}, 4 * INTERVAL)
+
+        self.assertEqual(events, [])
+        self.assertEqual(state["ball"]["dx"], 0.94)
+        self.assertGreater(state["ball"]["x"], 2)
+
+    def test_trajectory_does_not_depend_on_tick_rate(self):
+        positions = []
+        for steps in (60, 30, 15):
+            state = make_state(x=20, y=90, dx=-0.77, dy=0.64)
+            state["paddles"] = {"p1_y": 75, "p2_y": 30}
+            for _ in range(steps):
+                step(state, {}, 60 / steps * INTERVAL, rng=random.Random(0))
+            positions.append((state["ball"]["x"], state["ball"]["y"], state["speed"], state["score"]))
+
+        for position in positions[1:]:
+            for value, expected in zip(position[:3], positions[0][:3]):
+                self.assertAlmostEqual(value, expected)
+            self.assertEqual(position[3], positions[0][3])
+
+    def test_miss_scores_and_resets(self):
+        state = make_state(x=2.5, y=90, dx=-1)
+        events = step(state, {}, INTERVAL, rng=random.Random(0))
+
+        self.assertEqual(events, [("score", {"p1": 0, "p2": 1})])
+        self.assertEqual((state["ball"]["x"], state["ball"]["y"]), (49, 49))
+
+    def test_winning_point_ends_game(self):
+        state = make_state(x=97.5, y=10, dx=1)
+        state["score"]["p1"] = WINNING_SCORE - 1
+        events = step(state, {}, INTERVAL)
+
+        self.assertEqual(events[-1], ("game_over", 0))
+
+
+class GameEngineTests(SimpleTestCase):
+    def test_tick_steps_every_room_and_drops_finished(self):
+        game_engine = GameEngine(tick_rate=60)
+        finishing = make_state(x=97.5, y=10, dx=1)
+        finishing["score"]["p1"] = WINNING_SCORE - 1
+        game_engine.games.update({"a": make_state(), "b": finishing})
+        game_engine.inputs.update({"a": {}, "b": {}})
+
+        game_engine.submit_input("a", 1, 30)
+        events, finished = game_engine.tick(game_engine.dt)
+
+        self.assertEqual(list(game_engine.games), ["a"])
+        self.assertEqual(game_engine.games["a"]["paddles"]["p2_y"], 30)
+        self.assertEqual(finished["b"][1], 0)
+        self.assertIn("b", events)
+
+    def test_failing_room_is_dropped_and_announced(self):
+        game_engine = GameEngine(tick_rate=60)
+        broken = make_state()
+        broken["ball"]["dx"] = None
+        game_engine.games.update({"a": make_state(), "b": broken})
+        game_engine.inputs.update({"a": {}, "b": {}})
+
+        game_engine.tick(game_engine.dt)
+        self.assertEqual(list(game_engine.games), ["a"])
+        self.assertIs(game_engine.aborted["b"], broken)
+
+        pending = []
+        game_engine.publish_abort("b", broken, pending)
+        self.assertEqual([channel_name for channel_name, _ in pending], ["chan-1", "chan-2"])
+        self.assertEqual(pending[0][1]["type"], "game_end")
+
+    def test_publish_delivers_locally_and_queues_remote_members(self):
+        class LocalConsumer:
+            channel_name = "local"
+            received = []
+
+            def deliver(self, message):
+                self.received.append(message)
+                return True
+
+        game_engine = GameEngine(tick_rate=60)
+        consumer = LocalConsumer()
+        game_engine.attach(consumer)
+        pending = []
+        game_engine.publish(["local", "remote"], {"type": "score_update"}, pending)
+
+        self.assertEqual(consumer.received, [{"type": "score_update"}])
+        self.assertEqual(pending, [("remote", {"type": "score_update"})])
+        self.assertEqual(game_engine.deliveries["local"], 1)
+
+    async def test_player_index_follows_room_lifecycle(self):
+        game_engine = GameEngine(tick_rate=60)
+        game_engine.add_room("room", make_state())
+
+        self.assertEqual(game_engine.find_player("chan-2"), ("room", 1))
+        game_engine.remove_room("room")
+        self.assertEqual(game_engine.find_player("chan-2"), (None, None))
+        self.assertEqual(game_engine.players, {})
+
+    def test_inputs_are_coalesced_per_tick(self):
+        game_engine = GameEngine(tick_rate=60)
+        game_engine.games["room"] = make_state()
+        game_engine.inputs["room"] = {}
+        for y_position in (10, 20, 30):
+            game_engine.submit_input("room", 0, y_position)
+        game_engine.tick(game_engine.dt)
+
+        self.assertEqual(game_engine.games["room"]["paddles"]["p1_y"], 30)
+        self.assertEqual(game_engine.input_stats, {"accepted": 1, "coalesced": 2, "dropped": 0})
+
+    async def test_frames_carry_tick_and_applied_input_sequence(self):
+        game_engine = GameEngine(tick_rate=60)
+        state = make_state()
+        state["tick"] = 100
+        game_engine.ticks = 40
+        game_engine.add_room("room", state)
+        game_engine.apply_input("room", 0, {"type": "move", "y_position": 20, "seq": 5})
+        game_engine.apply_input("room", 0, {"type": "move", "y_position": 25, "seq": 6})
+        game_engine.apply_input("room", 0, {"type": "move", "y_position": 90, "seq": 4})
+        game_engine.tick(game_engine.dt, steps=2)
+
+        pending = []
+        game_engine.publish_room("room", [], None, pending)
+        frame = json.loads(pending[0][1]["text"])
+        self.assertEqual(frame["tick"], 102)
+        self.assertEqual(frame["acks"], {"p1": 6, "p2": 0})
+        self.assertEqual(frame["fields"]["p1_y"], 25)
+
+        game_engine.apply_input("room", 0, {"type": "move", "y_position": 30, "seq": 6})
+        self.assertEqual(game_engine.inputs["room"], {})
+        self.assertEqual(game_engine.input_stats["dropped"], 2)
+        game_engine.remove_room("room")
+
+    async def test_first_input_of_a_game_is_applied_and_acknowledged(self):
+        game_engine = GameEngine(tick_rate=60)
+        game_engine.add_room("room", make_state())
+        self.assertIsNone(parse_sequence(0))
+        self.assertEqual(parse_sequence(1), 1)
+
+        # A client counting from 0 still gets its first move applied, unacknowledged
+        game_engine.apply_input("room", 0, {"type": "move", "y_position": 20, "seq": 0})
+        game_engine.apply_input("room", 1, {"type": "move", "y_position": 70, "seq": 1})
+        game_engine.tick(game_engine.dt)
+
+        self.assertEqual(game_engine.games["room"]["paddles"], {"p1_y": 20, "p2_y": 70})
+        self.assertEqual(game_engine.games["room"]["acks"], {"p1": 0, "p2": 1})
+        self.assertEqual(game_engine.input_stats["dropped"], 0)
+        game_engine.remove_room("room")
+
+
+class ShardPoolTests(SimpleTestCase):
+    async def test_shards_match_in_process_engine(self):
+        pool = ShardPool(2, step_timeout=30)
+        self.addCleanup(pool.stop)
+        local = {}
+        mirrors = {}
+        for i in range(4):
+            mirrors[f"room-{i}"] = make_state(dx=0.5, dy=-0.94)
+            local[f"room-{i}"] = make_state(dx=0.5, dy=-0.94)
+            pool.add_room(f"room-{i}", mirrors[f"room-{i}"])
+        self.assertEqual(sorted(pool.load()), [2, 2])
+
+        events, finished = await pool.step(INTERVAL, 3, {"room-1": {"p1_y": 30}})
+        for room_name, state in local.items():
+            step(state, {"p1_y": 30} if room_name == "room-1" else {}, INTERVAL)
+            step(state, {}, INTERVAL)
+            step(state, {}, INTERVAL)
+
+        self.assertEqual((events, finished), ({}, {}))
+        self.assertEqual(mirrors, local)
+        pool.remove_room("room-1")
+        self.assertNotIn("room-1", pool)
+
+    async def test_late_shard_is_caught_up_on_a_later_step(self):
+        pool = ShardPool(1, step_timeout=0)
+        self.addCleanup(pool.stop)
+        mirror, local = make_state(dx=0.5, dy=-0.94), make_state(dx=0.5, dy=-0.94)
+        pool.add_room("room", mirror)
+
+        with self.assertLogs("api.shards", "WARNING"):
+            self.assertEqual(await pool.step(INTERVAL, 1, {"room": {"p1_y": 30}}), ({}, {}))
+        self.assertIn(0, pool.late)
+        self.assertTrue(pool.connections[0].poll(30))
+
+        pool.step_timeout = 30
+        await pool.step(INTERVAL, 2, {"room": {"p2_y": 70}})
+        step(local, {"p1_y": 30}, INTERVAL)
+        step(local, {"p2_y": 70}, INTERVAL)
+        step(local, {}, INTERVAL)
+        self.assertEqual(pool.late, {})
+        self.assertEqual(mirror, local)
+
+
+class FrameRingTests(SimpleTestCase):
+    def test_reader_gets_latest_record_per_room(self):
+        ring = FrameRing(capacity=4)
+        self.addCleanup(ring.close)
+        producer = FrameRing(capacity=4, name=ring.name)
+        self.addCleanup(producer.close)
+        state = make_state()
+
+        producer.write([state_record(1, 1, state), state_record(2, 1, state)])
+        state["ball"]["x"] = 60
+        producer.write([state_record(1, 2, state)])
+        latest = ring.read_latest()
+
+        self.assertEqual(set(latest), {1, 2})
+        self.assertEqual(latest[1][1], 2)
+        mirror = make_state(x=0)
+        apply_record(mirror, latest[1])
+        self.assertEqual(mirror, state)
+        self.assertEqual(ring.read_latest(), {})
+
+    def test_overrun_keeps_newest_records(self):
+        ring = FrameRing(capacity=2)
+        self.addCleanup(ring.close)
+        state = make_state()
+        ring.write([state_record(room_id, 1, state) for room_id in range(5)])
+
+        self.assertEqual(set(ring.read_latest()), {3, 4})
+        self.assertEqual(ring.overruns, 3)
+
+        ring.write([state_record(room_id, 2, state) for room_id in range(5, 8)])
+        self.assertEqual(set(ring.read_latest()), {6, 7})
+        ring.write([state_record(8, 3, state)])
+        self.assertEqual(list(ring.read_latest()), [8])
+
+
+class ReplayTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    async def test_engine_records_ticks_and_inputs(self):
+        game_engine = GameEngine(tick_rate=60)
+        game_engine.recorder = ReplayRecorder(self.directory, max_ticks=100, tick_rate=60)
+        room_name = str(uuid.uuid4())
+        state = make_state()
+        game_engine.add_room(room_name, state)
+
+        game_engine.submit_input(room_name, 0, 30.5)
+        game_engine.tick(game_engine.dt)
+        game_engine.tick(game_engine.dt, steps=2)
+        game_engine.remove_room(room_name)
+
+        path = replay_path(self.directory, room_name)
+        ticks = list(read_replay(path))
+        self.assertEqual([tick["tick"] for tick in ticks], [1, 2, 3])
+        self.assertEqual(ticks[0]["inputs"], {"p1_y": 30.5})
+        self.assertEqual(ticks[1]["inputs"], {})
+        self.assertEqual(ticks[-1]["paddles"]["p1_y"], 30.5)
+        self.assertAlmostEqual(ticks[-1]["ball"]["x"], state["ball"]["x"], places=2)
+        self.assertEqual(os.path.getsize(path), REPLAY_HEADER.size + 3 * TICK_RECORD.size)
+
+    async def test_out_of_range_position_is_clamped_in_the_log(self):
+        game_engine = GameEngine(tick_rate=60)
+        game_engine.recorder = ReplayRecorder(self.directory, max_ticks=100, tick_rate=60)
+        room_name = str(uuid.uuid4())
+        game_engine.add_room(room_name, make_state())
+
+        game_engine.submit_input(room_name, 0, 1000)
+        game_engine.submit_input(room_name, 1, -1e9)
+        game_engine.tick(game_engine.dt)
+        game_engine.remove_room(room_name)
+
+        self.assertEqual(game_engine.aborted, {})
+        ticks = list(read_replay(replay_path(self.directory, room_name)))
+        self.assertEqual(ticks[0]["inputs"], {"p1_y": 100, "p2_y": 0})
+
+    def test_reopened_log_continues_and_stops_when_full(self):
+        path = replay_path(self.directory, uuid.uuid4())
+        state = make_state()
+        log = ReplayLog(path, max_ticks=3, tick_rate=60)
+        log.record(state)
+        log.close()
+
+        state["ball"]["x"] = 12.34
+        log = ReplayLog(path, max_ticks=3, tick_rate=60)
+        for _ in range(3):
+            log.record(state)
+        log.close()
+
+        ticks = list(read_replay(path))
+        self.assertEqual(len(ticks), 3)
+        self.assertEqual(ticks[1]["ball"]["x"], 12.34)
+        self.assertEqual(log.dropped, 1)
+
+    def test_live_game_replay_is_authorized_from_the_log(self):
+        state = make_state()
+        game_id = uuid.uuid4()
+        path = replay_path(self.directory, game_id)
+        log = ReplayLog(path, max_ticks=10, tick_rate=60, players=state["players"])
+        self.addCleanup(log.close)
+        log.record(state)
+        self.assertEqual(read_players(path), PLAYER_IDS)
+
+        def get(user_id):
+            request = APIRequestFactory().get(f"/api/game/replays/{game_id}/")
+            force_authenticate(request, user=mock.Mock(id=user_id, is_authenticated=True))
+            # No history row exists yet, and the database is not queried
+            with override_settings(GAME_SETTINGS={"REPLAY_DIR": self.directory}):
+                return replay_stream(request, game_id=game_id)
+
+        response = get(PLAYER_IDS[1])
+        self.assertEqual(response.status_code, 200)
+        ticks = [json.loads(line) for line in b"".join(response.streaming_content).splitlines()]
+        self.assertEqual([tick["tick"] for tick in ticks], [1])
+        self.assertEqual(get(str(uuid.uuid4())).status_code, 403)
+
+
+class HistoryTests(SimpleTestCase):
+    def make_game(self, p1=WINNING_SCORE, p2=3):
+        players = [("chan-1", str(uuid.uuid4())), ("chan-2", str(uuid.uuid4()))]
+        state = new_game_state(str(uuid.uuid4()), players)
+        state["score"].update({"p1": p1, "p2": p2})
+        return state
+
+    async def test_results_collapse_and_failed_batch_is_retried(self):
+        writer = GameHistoryWriter(batch_size=10, flush_interval=60)
+        game, other = self.make_game(), self.make_game(p1=1, p2=WINNING_SCORE)
+        writer.game_finished(game)
+        self.addCleanup(writer._task.cancel)
+        writer.game_finished(game)
+        self.assertEqual(list(writer.finished), [uuid.UUID(game["id"])])
+
+        with mock.patch("api.persistence.write_games", side_effect=RuntimeError("db down")):
+            with self.assertLogs("api.persistence", "ERROR"):
+                await writer.flush()
+        writer.game_finished(other)
+        self.assertEqual(list(writer.finished), [uuid.UUID(game["id"]), uuid.UUID(other["id"])])
+
+        with mock.patch("api.persistence.write_games", return_value=2) as write_games:
+            await writer.flush()
+        finished = write_games.call_args.args[0]
+        self.assertEqual(finished[uuid.UUID(game["id"])]["winner_id"], uuid.UUID(game["players"][0][1]))
+        self.assertEqual(finished[uuid.UUID(other["id"])]["winner_id"], uuid.UUID(other["players"][1][1]))
+        self.assertEqual((len(writer), writer.written), (0, 2))
+
+    def test_stored_end_time_is_when_the_game_ended(self):
+        result = game_result(self.make_game())
+        result["ended_at"] -= datetime.timedelta(minutes=5)
+        row = GameHistory(id=uuid7(), **result)
+        # bulk_create calls pre_save on every field before inserting
+        self.assertEqual(GameHistory._meta.get_field("ended_at").pre_save(row, add=True), result["ended_at"])
+
+    def test_uuid7_sorts_by_creation_time(self):
+        ids = [uuid7(now=1700000000 + i / 1000) for i in range(100)]
+        self.assertEqual(sorted(ids), ids)
+        self.assertTrue(all(game_id.version == 7 for game_id in ids))
+        self.assertEqual(ids[0].variant, uuid.RFC_4122)
+
+    def test_owner_reports_finished_game_once(self):
+        game_engine = GameEngine(tick_rate=60)
+        game_engine.history = mock.Mock()
+        game = self.make_game()
+        game_engine.games[game["id"]] = game
+        game_engine.trackers[game["id"]] = DeltaTracker()
+
+        pending = []
+        game_engine.publish_room(game["id"], [], (game, 0), pending)
+
+        game_engine.history.game_finished.assert_called_once_with(game)
+        self.assertNotIn("game", pending[0][1])
+
+
+class Watcher:
+    def __init__(self, channel_name):
+        self.channel_name = channel_name
+        self.received = []
+
+    def deliver(self, message):
+        self.received.append(message)
+        return True
+
+
+class SpectatorTests(SimpleTestCase):
+    def make_engine(self):
+        game_engine = GameEngine(tick_rate=60)
+        game_engine.games["room"] = make_state()
+        game_engine.inputs["room"] = {}
+        game_engine.trackers["room"] = DeltaTracker()
+        return game_engine
+
+    async def test_spectator_frame_is_encoded_once_for_every_relay(self):
+        game_engine = self.make_engine()
+        watchers = [Watcher(f"spectator-{i}") for i in range(3)]
+        for watcher in watchers:
+            game_engine.relay.watch("room", watcher)
+        game_engine.add_relay("room", "worker-2")
+
+        pending = []
+        game_engine.publish_room("room", [], None, pending)
+        self.assertEqual([channel_name for channel_name, _ in pending], ["chan-1", "chan-2"])
+
+        game_engine.publish_room("room", [], None, pending, spectate=True)
+        self.addCleanup(game_engine.relay._task.cancel)
+        relayed = [message for channel_name, message in pending if channel_name == "worker-2"]
+        self.assertEqual(len(relayed), 1)
+        self.assertEqual(relayed[0]["type"], "spectator.frame")
+        self.assertEqual(decode_binary(relayed[0]["bytes"])["keyframe"], True)
+
+        await asyncio.sleep(0)
+        for watcher in watchers:
+            self.assertEqual(len(watcher.received), 1)
+            self.assertIs(watcher.received[0], relayed[0])
+
+    async def test_game_end_closes_relays(self):
+        game_engine = self.make_engine()
+        watcher = Watcher("spectator")
+        game_engine.relay.watch("room", watcher)
+        game_engine.add_relay("room", "worker-2")
+        game_engine.add_relay("room", "worker-3")
+        game_engine.relays["room"]["worker-3"] = 0
+
+        pending = []
+        game_engine.end_spectators("room", game_engine.games["room"], "Game over", pending)
+        self.addCleanup(game_engine.relay._task.cancel)
+        self.assertEqual([channel_name for channel_name, _ in pending], ["worker-2"])
+        self.assertEqual(game_engine.relays, {})
+
+        await asyncio.sleep(0)
+        self.assertEqual(watcher.received[0]["type"], "spectator.end")
+        self.assertNotIn("room", game_engine.relay)
+
+    async def test_relay_counts_frames_beyond_queue(self):
+        relay = SpectatorRelay(queue_size=1)
+        relay.watch("room", Watcher("spectator"))
+        relay.push("room", {"type": "spectator.frame"})
+        self.addCleanup(relay._task.cancel)
+        relay.push("room", {"type": "spectator.frame"})
+        relay.push("other", {"type": "spectator.frame"})
+
+        self.assertEqual(relay.dropped, 1)
+        relay.unwatch("room", "spectator")
+        self.assertNotIn("room", relay)
+
+
+class PacingTests(SimpleTestCase):
+    def test_rate_follows_ball_speed_rtt_and_load(self):
+        pacer = BroadcastPacer(tick_rate=60, interval=INTERVAL, min_rate=10, max_step=2)
+
+        self.assertAlmostEqual(pacer.rate(0.75), 22.5)
+        self.assertEqual(pacer.rate(MAX_BALL_SPEED), 60)
+        self.assertAlmostEqual(pacer.rate(0.75, rtt=0.2), 11.25)
+        self.assertAlmostEqual(pacer.rate(1, load=1), 15)
+        self.assertEqual(pacer.rate(0.75, rtt=1, load=2), 10)
+        self.assertEqual(pacer.ticks_between(22.5), 3)
+
+    def test_load_meter_averages_busy_share(self):
+        now = [0.0]
+        meter = LoadMeter(clock=lambda: now[0])
+        meter.start()
+        now[0] += 0.01
+        meter.stop(0.02)
+        self.assertEqual(meter.load, 0.1)
+
+    def test_frames_are_paced_but_scores_go_out_at_once(self):
+        game_engine = GameEngine(tick_rate=60)
+        game_engine.games["room"] = make_state()
+        game_engine.inputs["room"] = {}
+        game_engine.trackers["room"] = DeltaTracker()
+        sent = []
+        for tick in range(7):
+            game_engine.ticks = tick
+            game_engine.games["room"]["ball"]["x"] += 1
+            pending = []
+            game_engine.publish_room("room", [], None, pending)
+            sent.append(len(pending) > 0)
+
+        self.assertEqual(sent, [True, False, False, True, False, False, True])
+        self.assertAlmostEqual(game_engine.broadcast_rates["room"], 22.5)
+
+        game_engine.ticks = 7
+        game_engine.games["room"]["score"]["p1"] = 1
+        pending = []
+        game_engine.publish_room("room", [("score", {"p1": 1, "p2": 0})], None, pending)
+        self.assertEqual([message["type"] for _, message in pending][-1], "game_state_update")
+
+
+class InputTests(SimpleTestCase):
+    def test_token_bucket_limits_bursts_and_refills(self):
+        now = [0.0]
+        bucket = TokenBucket(rate=10, burst=3, clock=lambda: now[0])
+
+        self.assertEqual([bucket.allow() for _ in range(4)], [True, True, True, False])
+        now[0] += 0.1
+        self.assertTrue(bucket.allow())
+        self.assertFalse(bucket.allow())
+
+    def test_parse_position_rejects_non_numbers(self):
+        self.assertEqual(parse_position(42), 42.0)
+        for value in ("42", None, True, float("nan"), float("inf"), [1]):
+            self.assertIsNone(parse_position(value))
+
+
+class BatchPhysicsTests(SimpleTestCase):
+    def test_matches_scalar_step(self):
+        states = [
+            make_state(dx=0.5, dy=-0.94),
+            make_state(x=2.5, y=50, dx=-1),
+            make_state(x=97.5, y=10, dx=1),
+            make_state(y=97.5, dy=1),
+        ]
+        states.append(make_state(x=6, y=50, dx=-0.94, dy=0.34))
+        states[-1]["speed"] = MAX_BALL_SPEED
+        states[-1]["paddles"]["p1_y"] = 42
+        states.append(make_state(x=5, y=96, dx=-0.77, dy=0.64))
+        for dt in (INTERVAL, 4 * INTERVAL):
+            with self.subTest(dt=dt):
+                room_states = [json.loads(json.dumps(state)) for state in states]
+                batch = BatchPhysics(capacity=2)
+                for i, state in enumerate(room_states):
+                    batch.add_room(str(i), state)
+
+                batch_events = batch.step(dt)
+                for i, state in enumerate(room_states):
+                    scalar_events = step(state, {}, dt)
+                    exported = make_state()
+                    batch.export(str(i), exported)
+
+                    self.assertEqual(batch_events.get(str(i), []), scalar_events)
+                    self.assertEqual(exported["score"], state["score"])
+                    if not scalar_events:
+                        for key in ("x", "y", "dx", "dy"):
+                            self.assertAlmostEqual(exported["ball"][key], state["ball"][key])
+                        self.assertAlmostEqual(exported["speed"], state["speed"])
+
+    def test_remove_room_keeps_slots_dense(self):
+        batch = BatchPhysics()
+        batch.add_room("a", make_state(x=10))
+        batch.add_room("b", make_state(x=20))
+        batch.remove_room("a")
+
+        self.assertEqual(batch.rooms, ["b"])
+        self.assertEqual(batch.slots, {"b": 0})
+        self.assertEqual(batch.x[0], 20)
+
+
+class MatchmakingTests(SimpleTestCase):
+    async def test_local_matchmaker_pairs_closest_rating(self):
+        matchmaker = LocalMatchmaker(window=SearchWindow(base=50))
+
+        self.assertIsNone(await matchmaker.pair_or_enqueue("chan-1", "user-1", 1000))
+        self.assertIsNone(await matchmaker.pair_or_enqueue("chan-2", "user-2", 1300))
+        self.assertIsNone(await matchmaker.pair_or_enqueue("chan-3", "user-3", 1080))
+        self.assertEqual(await matchmaker.pair_or_enqueue("chan-4", "user-4", 1060), ("chan-3", "user-3"))
+        self.assertEqual(await matchmaker.size(), 2)
+
+    async def test_search_window_widens_while_waiting(self):
+        now = [0.0]
+        matchmaker = LocalMatchmaker(window=SearchWindow(base=50, widen_rate=10, maximum=200), clock=lambda: now[0])
+        await matchmaker.pair_or_enqueue("chan-1", "user-1", 1000)
+        await matchmaker.pair_or_enqueue("chan-2", "user-2", 1150)
+
+        now[0] = 5
+        self.assertIsNone(await matchmaker.pair_or_enqueue("chan-1", "user-1", 1000, retry=True))
+        now[0] = 10
+        self.assertEqual(
+            await matchmaker.pair_or_enqueue("chan-1", "user-1", 1000, retry=True), ("chan-2", "user-2")
+        )
+        # A paired player retrying late must not be queued again
+        self.assertIsNone(await matchmaker.pair_or_enqueue("chan-2", "user-2", 1150, retry=True))
+        self.assertEqual(await matchmaker.size(), 0)
+        self.assertEqual(await matchmaker.wait_percentiles(), {"p50": 10, "p90": 10, "p99": 10})
+
+    def test_percentiles(self):
+        self.assertEqual(percentiles(range(1, 101)), {"p50": 51, "p90": 91, "p99": 100})
+        self.assertEqual(percentiles([]), {"p50": None, "p90": None, "p99": None})
+
+    def test_elo_update(self):
+        self.assertEqual(elo_update(1000, 1000, 1), (1016, 984))
+        winner, loser = elo_update(1200, 1000, 1)
+        self.assertLess(winner - 1200, 16)
+        self.assertAlmostEqual(winner + loser, 2200)
+
+
+class OwnershipTests(SimpleTestCase):
+    def test_hash_ring_only_moves_rooms_of_removed_worker(self):
+        rooms = [f"room-{i}" for i in range(500)]
+        before = HashRing(["w1", "w2", "w3"])
+        after = HashRing(["w1", "w2"])
+
+        owners = {room: before.node_for(room) for room in rooms}
+        self.assertEqual(set(owners.values()), {"w1", "w2", "w3"})
+        for room, owner in owners.items():
+            if owner != "w3":
+                self.assertEqual(after.node_for(room), owner)
+        self.assertIsNone(HashRing().node_for("room"))
+
+    async def test_worker_adopts_room_without_owner(self):
+        directory = LocalRoomDirectory()
+        game_engine = GameEngine(tick_rate=60, directory=directory)
+        game_engine.worker_channel = "worker-2"
+        state = make_state()
+        await directory.save_state("room", state)
+
+        class WatchingConsumer:
+            room_name = "room"
+            room_host = "worker-1"
+
+            def __init__(self, channel_name):
+                self.channel_name = channel_name
+
+            def deliver(self, message):
+                return True
+
+        for channel_name in ("chan-1", "chan-2"):
+            game_engine.attach(WatchingConsumer(channel_name))
+        await game_engine.adopt_rooms()
+
+        self.assertIn("room", game_engine.games)
+        self.assertEqual(await directory.owner("room"), "worker-2")
+        self.assertEqual(game_engine.consumers["chan-1"].room_host, "worker-2")
+        self.assertFalse(await directory.claim("room", "worker-3"))
+        game_engine.remove_room("room")
+
+    async def test_placing_worker_owns_room_and_ring_only_orders_successors(self):
+        directory = LocalRoomDirectory()
+        game_engine = GameEngine(tick_rate=60, directory=directory)
+        game_engine.worker_channel = "worker-2"
+        state = make_state()
+        self.assertEqual(await game_engine.place_room("room", state), "worker-2")
+
+        # The owner died; the ring prefers the other live worker for this room
+        ring = HashRing(["worker-2", "worker-3"])
+        room_name = next(f"room-{i}" for i in range(100) if ring.node_for(f"room-{i}") == "worker-3")
+        await directory.save_state(room_name, state)
+        for channel_name in ("chan-1", "chan-2"):
+            game_engine.attach(mock.Mock(channel_name=channel_name, room_name=room_name, room_host="worker-1"))
+        with mock.patch.object(directory, "live_workers", return_value=["worker-3"]):
+            await game_engine.adopt_rooms()
+            self.assertIsNone(await directory.owner(room_name))
+            await game_engine.adopt_rooms()
+        self.assertEqual(await directory.owner(room_name), "worker-2")
+        game_engine.remove_room(room_name)
+
+
+class ProtocolTests(SimpleTestCase):
+    def test_negotiate(self):
+        self.assertEqual(negotiate({}), (PROTOCOL_JSON, None))
+        self.assertEqual(negotiate({"query_string": b"protocol=binary"}), (PROTOCOL_BINARY, None))
+        self.assertEqual(
+            negotiate({"subprotocols": [BINARY_SUBPROTOCOL]}),
+            (PROTOCOL_BINARY, BINARY_SUBPROTOCOL)
+        )
+
+    def test_binary_frames_round_trip(self):
+        tracker = DeltaTracker()
+        state = make_state(x=12.5, y=80.25)
+        state["paddles"] = {"p1_y": 30, "p2_y": 70.5}
+        keyframe = tracker.next_frame(state)
+        state["ball"]["x"] = 13.5
+        delta = tracker.next_frame(state)
+
+        self.assertEqual(decode_binary(encode_binary(keyframe)), keyframe)
+        self.assertEqual(decode_binary(encode_binary(delta)), delta)
+
+    def test_idle_paddles_shrink_frames_to_ball_position(self):
+        state = new_game_state(str(uuid.uuid4()), [
+            ("specific..inmemory!abcdefghijkl", str(uuid.uuid4())),
+            ("specific..inmemory!mnopqrstuvwx", str(uuid.uuid4())),
+        ])
+        full_json = json.dumps({"type": "game_state_update", "data": state}).encode()
+        tracker = DeltaTracker()
+        tracker.next_frame(state)
+        step(state, {}, INTERVAL)
+        delta = tracker.next_frame(state)
+
+        self.assertEqual(delta["seq"], 2)
+        self.assertEqual(set(delta["fields"]), {"ball_x", "ball_y"})
+        self.assertEqual(len(encode_binary(delta)), 18)
+        self.assertGreater(len(full_json), 10 * len(encode_binary(delta)))
+
+    def test_keyframes_on_interval_score_and_request(self):
+        tracker = DeltaTracker(keyframe_interval=2)
+        state = make_state()
+        keyframes = []
+        for i in range(6):
+            if i == 4:
+                state["score"]["p1"] += 1
+            state["ball"]["x"] += 1
+            keyframes.append(tracker.next_frame(state)["keyframe"])
+        tracker.request_keyframe()
+        state["ball"]["x"] += 1
+        keyframes.append(tracker.next_frame(state)["keyframe"])
+
+        self.assertEqual(keyframes, [True, False, False, True, True, False, True])
+
+    def test_acks_are_sent_when_they_change(self):
+        tracker = DeltaTracker()
+        state = make_state()
+        tracker.next_frame(state)
+        state["tick"] = 2
+        state["acks"]["p2"] = 7
+        delta = tracker.next_frame(state)
+
+        self.assertEqual(delta["fields"], {})
+        self.assertEqual(delta["acks"], {"p1": 0, "p2": 7})
+        self.assertEqual(decode_binary(encode_binary(delta)), delta)
+        state["tick"] = 3
+        self.assertIsNone(tracker.next_frame(state))
+
+    def test_unchanged_state_emits_nothing(self):
+        tracker = DeltaTracker()
+        state = make_state()
+        tracker.next_frame(state)
+
+        self.assertIsNone(tracker.next_frame(state))
+        self.assertEqual(tracker.seq, 1)
+
+
+class TokenTests(SimpleTestCase):
+    def make_token(self, key, lifetime=60, **claims):
+        payload = {"user_id": "user-1", "token_type": "access", "exp": int(time.time()) + lifetime}
+        payload.update(claims)
+        return jwt.encode(payload, self.signing_key(key), algorithm="HS256")
+
+    def signing_key(self, name):
+        return f"{name}-signing-key".ljust(32, "0")
+
+    async def test_verifies_signature_expiry_and_type_locally(self):
+        verifier = LocalTokenVerifier(keys=[self.signing_key("current"), self.signing_key("previous")])
+
+        self.assertEqual((await verifier.verify(self.make_token("current")))["user_id"], "user-1")
+        self.assertEqual((await verifier.verify(self.make_token("previous")))["user_id"], "user-1")
+        self.assertIsNone(await verifier.verify(self.make_token("forged")))
+        self.assertIsNone(await verifier.verify(self.make_token("current", lifetime=-60)))
+        self.assertIsNone(await verifier.verify(self.make_token("current", token_type="refresh")))
+        self.assertIsNone(await verifier.verify("not a token"))
+
+    async def test_unknown_key_id_refetches_key_set_once(self):
+        verifier = LocalTokenVerifier(keys=[], jwks_url="http://auth/keys")
+        fetches = []
+
+        async def fetch_public_keys():
+            fetches.append(time.monotonic())
+            verifier.fetched_at = time.monotonic()
+            verifier.public_keys = {"new": jwt.PyJWK({"kty": "oct", "k": base64.urlsafe_b64encode(self.signing_key("secret").encode()).decode(), "alg": "HS256", "kid": "new"})}
+
+        verifier.fetch_public_keys = fetch_public_keys
+        token = jwt.encode({"user_id": "user-1", "exp": int(time.time()) + 60}, self.signing_key("secret"), "HS256", {"kid": "new"})
+        self.assertEqual((await verifier.verify(token))["user_id"], "user-1")
+
+        stale = jwt.encode({"user_id": "user-1", "exp": int(time.time()) + 60}, self.signing_key("secret"), "HS256", {"kid": "old"})
+        for _ in range(3):
+            with self.assertRaises(KeyUnavailable):
+                await verifier.verify(stale)
+        self.assertEqual(len(fetches), 1)
+
+    def make_cache(self, **kwargs):
+        return TokenCache(backend=LocMemCache(str(uuid.uuid4()), {}), **kwargs)
+
+    def test_cache_verifies_once_until_exp(self):
+        token_cache = self.make_cache(ttl=300)
+        token = self.make_token("key", lifetime=60)
+        calls = []
+
+        def verify(token):
+            calls.append(token)
+            return {"id": "user-1"}
+
+        self.assertEqual(token_cache.get(token, verify), {"id": "user-1"})
+        self.assertEqual(token_cache.get(token, verify), {"id": "user-1"})
+        # Another process finds it in the shared cache
+        other = TokenCache(backend=token_cache.backend)
+        self.assertEqual(other.get(token, verify), {"id": "user-1"})
+        self.assertEqual(len(calls), 1)
+        expires_at, _ = token_cache.local[token_key(token)]
+        self.assertLessEqual(expires_at, time.time() + token_cache.local_ttl)
+
+    def test_concurrent_misses_share_one_verification(self):
+        token_cache = self.make_cache()
+        token = self.make_token("key")
+        release = threading.Event()
+        calls = []
+
+        def verify(token):
+            calls.append(token)
+            release.wait(5)
+            return {"id": "user-1"}
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(token_cache.get(token, verify))) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        while not calls:
+            time.sleep(0.001)
+        time.sleep(0.05)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [{"id": "user-1"}] * 8)
+
+    def test_revoked_token_is_not_cached_over(self):
+        token_cache = self.make_cache(local_ttl=0)
+        token = self.make_token("key")
+        token_cache.get(token, lambda token: {"id": "user-1"})
+
+        # Logout in the auth service replaces the entry
+        token_cache.backend.set(token_key(token), REVOKED)
+        self.assertIsNone(token_cache.get(token, lambda token: {"id": "user-1"}))
+        self.assertTrue(token_cache.revoked(token))
+
+
+class ServiceClientTests(SimpleTestCase):
+    async def test_session_is_reused_per_loop_until_closed(self):
+        client = ServiceClient(limit_per_host=4)
+        session = client.session()
+        self.assertIs(client.session(), session)
+        self.assertEqual(session.connector.limit_per_host, 4)
+
+        await client.close()
+        self.assertTrue(session.closed)
+        self.assertIsNot(client.session(), session)
+        await client.close()
+
+    async def test_lifespan_acknowledges_startup_and_shutdown(self):
+        messages = asyncio.Queue()
+        sent = []
+        for message_type in ("lifespan.startup", "lifespan.shutdown"):
+            messages.put_nowait({"type": message_type})
+
+        async def send(message):
+            sent.append(message["type"])
+
+        await LifespanApp()({"type": "lifespan"}, messages.get, send)
+        self.assertEqual(sent, ["lifespan.startup.complete", "lifespan.shutdown.complete"])
+
+    async def test_shutdown_writes_buffered_game_results(self):
+        writer = GameHistoryWriter(batch_size=10, flush_interval=60)
+        game = new_game_state(str(uuid.uuid4()), [("chan-1", PLAYER_IDS[0]), ("chan-2", PLAYER_IDS[1])])
+        writer.game_finished(game)
+        messages = asyncio.Queue()
+        messages.put_nowait({"type": "lifespan.shutdown"})
+
+        async def send(message):
+            pass
+
+        with mock.patch("api.engine.engine.history", writer), \
+                mock.patch("api.persistence.write_games", return_value=1) as write_games:
+            await LifespanApp()({"type": "lifespan"}, messages.get, send)
+        self.assertEqual(list(write_games.call_args.args[0]), [uuid.UUID(game["id"])])
+        self.assertEqual((len(writer), writer.written), (0, 1))
+        self.assertIsNone(writer._task)
+
+    def test_background_loop_is_reused_across_calls(self):
+        background_loop = BackgroundLoop()
+
+        async def running_loop():
+            return asyncio.get_running_loop()
+
+        loop = background_loop.run(running_loop(), timeout=5)
+        self.assertIs(background_loop.run(running_loop(), timeout=5), loop)
+        self.assertIs(loop, background_loop.loop)
+
+        asyncio.run(background_loop.stop())
+        self.assertIsNone(background_loop.loop)
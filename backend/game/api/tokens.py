@@ -0,0 +1,136 @@
+import asyncio
+import logging
+import time
+import aiohttp
+import jwt
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from .clients import service_client
+from .token_cache import token_cache
+from .utils import verify_token_with_auth_service
+
+logger = logging.getLogger(__name__)
+
+# Seconds between two fetches of the key set when tokens name unknown keys
+KEY_REFRESH_INTERVAL = 60
+# Seconds of clock skew tolerated on exp and iat
+LEEWAY = 10
+
+
+class KeyUnavailable(Exception):
+    """The key a token was signed with is not known locally"""
+    pass
+
+
+class LocalTokenVerifier:
+    """
+    Verifies access tokens in-process: signature, expiry and token type.
+
+    Tokens without a key id are checked against the shared ``keys`` in
+    order, so the signing key can be rotated by listing the previous key
+    after the new one. When ``jwks_url`` is set, public keys are fetched
+    from it on first use and cached by key id; a token naming an unknown
+    key refetches the set, at most once per ``refresh_interval`` however
+    many handshakes ask for it.
+    """
+
+    def __init__(self, keys, algorithm='HS256', jwks_url=None, user_id_claim='user_id',
+                 refresh_interval=KEY_REFRESH_INTERVAL):
+        self.keys = [key for key in keys if key]
+        self.algorithm = algorithm
+        self.jwks_url = jwks_url
+        self.user_id_claim = user_id_claim
+        self.refresh_interval = refresh_interval
+        self.public_keys = {}
+        self.fetched_at = None
+        self._fetch_lock = asyncio.Lock()
+
+    async def verify(self, token):
+        """
+        Return the claims of a valid access token, or None when it is
+        invalid or expired. Raise KeyUnavailable when no local key can tell.
+        """
+        try:
+            key_id = jwt.get_unverified_header(token).get('kid')
+        except jwt.InvalidTokenError:
+            return None
+
+        if key_id is not None and self.jwks_url:
+            public_key = await self.get_public_key(key_id)
+            candidates = [(public_key.key, public_key.algorithm_name)]
+        elif self.keys:
+            candidates = [(key, self.algorithm) for key in self.keys]
+        else:
+            raise KeyUnavailable("No verifying key configured")
+
+        for key, algorithm in candidates:
+            try:
+                claims = jwt.decode(
+                    token, key, algorithms=[algorithm], leeway=LEEWAY,
+                    options={'require': ['exp', self.user_id_claim]},
+                )
+            except jwt.InvalidSignatureError:
+                continue
+            except jwt.InvalidTokenError:
+                return None
+            if claims.get('token_type', 'access') != 'access':
+                return None
+            return claims
+        return None
+
+    async def get_public_key(self, key_id):
+        if key_id not in self.public_keys:
+            async with self._fetch_lock:
+                if key_id not in self.public_keys and self.can_refresh():
+                    await self.fetch_public_keys()
+        try:
+            return self.public_keys[key_id]
+        except KeyError:
+            raise KeyUnavailable(f"Unknown key id {key_id}")
+
+    def can_refresh(self):
+        return self.fetched_at is None or time.monotonic() - self.fetched_at >= self.refresh_interval
+
+    async def fetch_public_keys(self):
+        self.fetched_at = time.monotonic()
+        try:
+            async with service_client.get(self.jwks_url) as response:
+                response.raise_for_status()
+                key_set = jwt.PyJWKSet.from_dict(await response.json())
+        except (aiohttp.ClientError, asyncio.TimeoutError, jwt.PyJWKSetError) as e:
+            logger.warning(f"Failed to fetch signing keys from {self.jwks_url}: {str(e)}")
+            return
+        # Keys dropped from the set stop verifying tokens
+        self.public_keys = {key.key_id: key for key in key_set.keys if key.key_id}
+
+
+def get_verifier():
+    return LocalTokenVerifier(
+        keys=[settings.SIMPLE_JWT.get('VERIFYING_KEY')] + list(getattr(settings, 'JWT_PREVIOUS_VERIFYING_KEYS', [])),
+        algorithm=settings.SIMPLE_JWT.get('ALGORITHM', 'HS256'),
+        jwks_url=getattr(settings, 'JWT_JWKS_URL', None),
+        user_id_claim=settings.SIMPLE_JWT.get('USER_ID_CLAIM', 'user_id'),
+    )
+
+
+verifier = get_verifier()
+
+
+async def verify_token(token):
+    """
+    Return the user of ``token`` as ``{'id': ...}`` or None. Tokens are
+    checked locally, then against the revocations written on logout; the
+    auth service is only asked when the signing key is unknown here or
+    when JWT_REVOCATION_CHECK requires it to confirm that the user still
+    exists.
+    """
+    try:
+        claims = await verifier.verify(token)
+    except KeyUnavailable as e:
+        logger.info(f"Verifying token with auth service: {str(e)}")
+        return await verify_token_with_auth_service(token)
+    if claims is None or await sync_to_async(token_cache.revoked)(token):
+        return None
+    if getattr(settings, 'JWT_REVOCATION_CHECK', False):
+        return await verify_token_with_auth_service(token)
+    return {'id': str(claims[verifier.user_id_claim])}
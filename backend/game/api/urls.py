@@ -1,10 +1,11 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import health_check
+from .views import health_check, replay_stream
 
 
 urlpatterns = [
     path('game/', include([
         path('health/', health_check, name='health_check'),
+        path('replays/<uuid:game_id>/', replay_stream, name='replay_stream'),
     ])),
 ]
\ No newline at end of file
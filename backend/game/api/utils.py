@@ -2,6 +2,7 @@ import logging
 import aiohttp
 from django.conf import settings
 from typing import Optional, Dict
+from .clients import service_client
 logger = logging.getLogger(__name__)
 
 class AuthServiceError(Exception):
@@ -11,22 +12,20 @@ class AuthServiceError(Exception):
 
 async def get_user_from_id(user_id: str, token: str):
     try:
-        async with aiohttp.ClientSession() as session:
-            headers = {'Authorization': f'Bearer {token}'}
-            cookies = {settings.SIMPLE_JWT['AUTH_COOKIE']: token}
+        headers = {'Authorization': f'Bearer {token}'}
+        cookies = {settings.SIMPLE_JWT['AUTH_COOKIE']: token}
 
-            async with session.get(
-                f"{settings.AUTH_SERVICE_URL}/api/auth/users/{user_id}",
-                headers=headers,
-                cookies=cookies,
-                timeout=aiohttp.ClientTimeout(total=10)
-            ) as response:
-                if response.status == 200:
-                    return await response.json()
-                elif response.status == 401:
-                    return None
-                else:
-                    raise AuthServiceError(f"Auth service returned status {response.status}")
+        async with service_client.get(
+            f"{settings.AUTH_SERVICE_URL}/api/auth/users/{user_id}",
+            headers=headers,
+            cookies=cookies,
+        ) as response:
+            if response.status == 200:
+                return await response.json()
+            elif response.status == 401:
+                return None
+            else:
+                raise AuthServiceError(f"Auth service returned status {response.status}")
     except aiohttp.ClientError as e:
         raise AuthServiceError(f"Failed to communicate with auth service: {str(e)}")
 
@@ -37,25 +36,23 @@ async def verify_token_with_auth_service(token: str) -> Optional[Dict]:
     and header-based token verification for maximum compatibility.
     """
     try:
-        async with aiohttp.ClientSession() as session:
-            headers = {'Authorization': f'Bearer {token}'}
-            cookies = {settings.SIMPLE_JWT['AUTH_COOKIE']: token}
-            
-            async with session.post(
-                settings.JWT_VERIFICATION_URL,
-                headers=headers,
-                cookies=cookies,
-                timeout=aiohttp.ClientTimeout(total=10)
-            ) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    if data.get('valid') and data.get('user'):
-                        return data['user']
-                    return None
-                elif response.status == 401:
-                    return None
-                else:
-                    raise AuthServiceError(f"Auth service returned status {response.status}")
+        headers = {'Authorization': f'Bearer {token}'}
+        cookies = {settings.SIMPLE_JWT['AUTH_COOKIE']: token}
+
+        async with service_client.post(
+            settings.JWT_VERIFICATION_URL,
+            headers=headers,
+            cookies=cookies,
+        ) as response:
+            if response.status == 200:
+                data = await response.json()
+                if data.get('valid') and data.get('user'):
+                    return data['user']
+                return None
+            elif response.status == 401:
+                return None
+            else:
+                raise AuthServiceError(f"Auth service returned status {response.status}")
     except aiohttp.ClientError as e:
         raise AuthServiceError(f"Failed to communicate with auth service: {str(e)}")
 
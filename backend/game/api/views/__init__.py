@@ -1,5 +1,7 @@
 from .system import health_check
+from .replays import replay_stream
 
 __all__ = [
     'health_check',
+    'replay_stream',
 ]
\ No newline at end of file
@@ -0,0 +1,62 @@
+import json
+import os
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from rest_framework import status
+from rest_framework.decorators import api_view
+from rest_framework.response import Response
+from ..models import GameHistory
+from ..replay import read_players, read_raw, read_replay, replay_path
+
+
+@api_view(['GET'])
+def replay_stream(request, game_id):
+    """
+    Stream the recorded ticks of a game to one of its players.
+
+    By default every tick is sent as one JSON object per line with absolute
+    ball and paddle positions, the requested paddle positions and the score.
+    With ``?encoding=binary`` the compact log is streamed as stored. Games
+    still in progress stream the ticks recorded so far: their players are
+    read from the log header, since the history row is only written once
+    the game ends.
+    """
+    path = replay_path(settings.GAME_SETTINGS['REPLAY_DIR'], game_id)
+    players = read_players(path) if os.path.exists(path) else None
+    if players is None:
+        # Logs recorded before the header named the players
+        try:
+            game = GameHistory.objects.get(id=game_id)
+        except GameHistory.DoesNotExist:
+            return Response(
+                {'error': {
+                    'message': 'Game not found'
+                }},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        players = (str(game.player_1_id), str(game.player_2_id))
+
+    if str(request.user.id) not in players:
+        return Response(
+            {'error': {
+                'message': 'Only players of this game can watch its replay'
+            }},
+            status=status.HTTP_403_FORBIDDEN
+        )
+
+    if not os.path.exists(path):
+        return Response(
+            {'error': {
+                'message': 'No replay was recorded for this game'
+            }},
+            status=status.HTTP_404_NOT_FOUND
+        )
+
+    if request.query_params.get('encoding') == 'binary':
+        response = StreamingHttpResponse(read_raw(path), content_type='application/octet-stream')
+        response['Content-Disposition'] = f'attachment; filename="{game_id}.replay"'
+        return response
+    return StreamingHttpResponse(
+        (json.dumps(tick) + '\n' for tick in read_replay(path)),
+        content_type='application/x-ndjson'
+    )
@@ -10,6 +10,9 @@ from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
 from rest_framework.renderers import JSONRenderer
 from django_redis import get_redis_connection
+from asgiref.sync import async_to_sync
+from ..engine import engine
+from ..matchmaking import matchmaker
 
 
 @api_view(['GET'])
@@ -24,7 +27,8 @@ def health_check(request):
     2. Database connection status
     3. Redis connection and functionality
     4. Game service specific features:
-        - Matchmaking queue status
+        - Matchmaking queue status and wait time percentiles
+        - Engine load and the effective broadcast rate of every room
         - Number of active games
         - Database game counts
     
@@ -43,10 +47,23 @@ def health_check(request):
         'metrics': {
             'active_games': 0,
             'total_games': 0,
-            'matchmaking_queue_size': 0
+            'matchmaking_queue_size': 0,
+            'matchmaking_wait_seconds': {},
+            # Rooms simulated by the worker that served this request
+            'engine_load': round(engine.load_meter.load, 3),
+            'broadcast_rates': {
+                room_name: round(rate, 1) for room_name, rate in list(engine.broadcast_rates.items())
+            },
         }
     }
 
+    try:
+        health_status['metrics']['matchmaking_queue_size'] = async_to_sync(matchmaker.size)()
+        health_status['metrics']['matchmaking_wait_seconds'] = async_to_sync(matchmaker.wait_percentiles)()
+        health_status['components']['matchmaking'] = 'healthy'
+    except Exception:
+        health_status['components']['matchmaking'] = 'unhealthy'
+
     response_status = (
         status.HTTP_200_OK
         if health_status['status'] == 'healthy'
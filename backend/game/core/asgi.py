@@ -7,6 +7,7 @@ django_asgi_app = get_asgi_application()
 
 from channels.routing import ProtocolTypeRouter, URLRouter
 from channels.security.websocket import AllowedHostsOriginValidator
+from api.clients import LifespanApp
 from api.middleware import WebSocketAuthMiddleware
 from api.routing import websocket_urlpatterns
 
@@ -15,5 +16,6 @@ application = ProtocolTypeRouter({
     # "websocket": URLRouter(websocket_urlpatterns)
     "websocket": WebSocketAuthMiddleware(
         URLRouter(websocket_urlpatterns)
-    )
+    ),
+    "lifespan": LifespanApp(),
 })
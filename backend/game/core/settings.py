@@ -187,6 +187,21 @@ CORS_ALLOW_HEADERS = [
 AUTH_SERVICE_TIMEOUT = int(os.getenv('AUTH_SERVICE_TIMEOUT', 5))
 AUTH_SERVICE_URL = os.getenv('AUTH_SERVICE_URL', 'http://auth:8000')
 JWT_VERIFICATION_URL = f"{AUTH_SERVICE_URL}/api/auth/verify/"
+# Keys signed with before the current one, still accepted while their tokens live
+JWT_PREVIOUS_VERIFYING_KEYS = [key for key in os.getenv('JWT_PREVIOUS_SIGNING_KEYS', '').split(',') if key]
+# Key set of the auth service, for tokens that carry a key id
+JWT_JWKS_URL = os.getenv('JWT_JWKS_URL')
+# Also ask the auth service about tokens that verify locally, to catch deleted users
+JWT_REVOCATION_CHECK = os.getenv('JWT_REVOCATION_CHECK', 'False').lower() == 'true'
+# Seconds a verified token is cached in Redis at most, and in each process before Redis is asked again
+TOKEN_CACHE_TTL = int(os.getenv('TOKEN_CACHE_TTL', 300))
+LOCAL_TOKEN_CACHE_TTL = int(os.getenv('LOCAL_TOKEN_CACHE_TTL', 10))
+LOCAL_TOKEN_CACHE_SIZE = int(os.getenv('LOCAL_TOKEN_CACHE_SIZE', 10000))
+# Pooled connections to other services, in total and per service, and seconds idle ones stay open
+SERVICE_POOL_SIZE = int(os.getenv('SERVICE_POOL_SIZE', 100))
+SERVICE_POOL_SIZE_PER_HOST = int(os.getenv('SERVICE_POOL_SIZE_PER_HOST', 20))
+SERVICE_KEEPALIVE_TIMEOUT = float(os.getenv('SERVICE_KEEPALIVE_TIMEOUT', 30))
+SERVICE_CONNECT_TIMEOUT = float(os.getenv('SERVICE_CONNECT_TIMEOUT', 2))
 
 LOGGING = {
     'version': 1,
@@ -214,7 +229,8 @@ LOGGING = {
 GAME_SETTINGS = {
     'MATCHMAKING_TIMEOUT': int(os.getenv('MATCHMAKING_TIMEOUT', 60)),
     'MAX_GAME_DURATION': int(os.getenv('MAX_GAME_DURATION', 600)),
-    'GAME_TICK_RATE': int(os.getenv('GAME_TICK_RATE', 60)),
+    # Physics steps per second; contacts are swept within a step, so 30 Hz keeps hits exact
+    'GAME_TICK_RATE': int(os.getenv('GAME_TICK_RATE', 30)),
     'PADDLE_SPEED': float(os.getenv('PADDLE_SPEED', 10)),
     'BALL_SPEED': float(os.getenv('BALL_SPEED', 15)),
     'COURT_WIDTH': int(os.getenv('COURT_WIDTH', 800)),
@@ -222,6 +238,44 @@ GAME_SETTINGS = {
     'DEFAULT_POINTS_TO_WIN': int(os.getenv('DEFAULT_POINTS_TO_WIN', 11)),
     'HARDCORE_BALL_SPEED_MULTIPLIER': float(os.getenv('HARDCORE_BALL_SPEED_MULTIPLIER', 1.5)),
     'HARDCORE_PADDLE_SIZE_MULTIPLIER': float(os.getenv('HARDCORE_PADDLE_SIZE_MULTIPLIER', 0.8)),
+    # 'scalar' steps rooms one by one, 'numpy' advances all rooms in one vectorized step
+    'PHYSICS_BACKEND': os.getenv('PHYSICS_BACKEND', 'scalar'),
+    # Simulation processes per game worker, ideally one per core; 0 simulates in-process
+    'SIMULATION_WORKERS': int(os.getenv('SIMULATION_WORKERS', 0)),
+    # State records each simulation shard can publish between two reads
+    'FRAME_RING_CAPACITY': int(os.getenv('FRAME_RING_CAPACITY', 65536)),
+    # Seconds a tick waits for a simulation shard before leaving it for the next tick
+    'SHARD_STEP_TIMEOUT': float(os.getenv('SHARD_STEP_TIMEOUT', 0.1)),
+    'KEYFRAME_INTERVAL': int(os.getenv('KEYFRAME_INTERVAL', 60)),
+    # Court units the ball may move between two broadcasts, and the lowest broadcast rate
+    'BROADCAST_MAX_STEP': float(os.getenv('BROADCAST_MAX_STEP', 2)),
+    'BROADCAST_MIN_RATE': float(os.getenv('BROADCAST_MIN_RATE', 10)),
+    'LOCAL_OUTBOX_SIZE': int(os.getenv('LOCAL_OUTBOX_SIZE', 100)),
+    # Client messages per second allowed per connection, and the burst on top of it
+    'INPUT_RATE_LIMIT': float(os.getenv('INPUT_RATE_LIMIT', 120)),
+    'INPUT_BURST': int(os.getenv('INPUT_BURST', 30)),
+    # 'redis' shares the queue between all game workers, 'local' keeps it in-process
+    'MATCHMAKING_BACKEND': os.getenv('MATCHMAKING_BACKEND', 'redis'),
+    'MATCHMAKING_KEY_PREFIX': os.getenv('MATCHMAKING_KEY_PREFIX', 'game:matchmaking'),
+    # Rating gap accepted on joining, how fast it widens per second waited and its cap
+    'MATCHMAKING_BASE_WINDOW': float(os.getenv('MATCHMAKING_BASE_WINDOW', 50)),
+    'MATCHMAKING_WIDEN_RATE': float(os.getenv('MATCHMAKING_WIDEN_RATE', 10)),
+    'MATCHMAKING_MAX_WINDOW': float(os.getenv('MATCHMAKING_MAX_WINDOW', 400)),
+    'MATCHMAKING_RETRY_INTERVAL': float(os.getenv('MATCHMAKING_RETRY_INTERVAL', 2)),
+    # 'redis' leases each room to one game worker, 'local' owns every room in-process
+    'ROOM_DIRECTORY_BACKEND': os.getenv('ROOM_DIRECTORY_BACKEND', 'redis'),
+    'ROOM_KEY_PREFIX': os.getenv('ROOM_KEY_PREFIX', 'game:rooms'),
+    # Seconds a room stays owned by a worker that stopped renewing it
+    'ROOM_LEASE_TTL': float(os.getenv('ROOM_LEASE_TTL', 5)),
+    # Frames per second sent to spectators, and frames a worker's spectator relay can queue
+    'SPECTATOR_RATE': float(os.getenv('SPECTATOR_RATE', 10)),
+    'RELAY_QUEUE_SIZE': int(os.getenv('RELAY_QUEUE_SIZE', 1024)),
+    # Record every tick of every room to a memory-mapped log per game
+    'REPLAY_ENABLED': os.getenv('REPLAY_ENABLED', 'False').lower() == 'true',
+    'REPLAY_DIR': os.getenv('REPLAY_DIR', os.path.join(BASE_DIR, 'replays')),
+    # Games written per transaction, and seconds a result waits at most before it is written
+    'HISTORY_BATCH_SIZE': int(os.getenv('HISTORY_BATCH_SIZE', 500)),
+    'HISTORY_FLUSH_INTERVAL': float(os.getenv('HISTORY_FLUSH_INTERVAL', 1.0)),
 }
 
 STATIC_URL = '/static/'